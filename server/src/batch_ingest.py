@@ -0,0 +1,340 @@
+"""
+Offline batch ingestion of a folder of PDFs, for backfills too large to send through `/upload`
+
+Every PDF under the folder goes through the same `create_draft` as an upload (`process_pdf_to_draft` or
+`process_portfolio`), spread across a pool of worker processes that each import the server. The resulting drafts are
+finalized as they are: the parent writes them to the finalized folder, adds them to Chroma with
+`database_upsert_chunks` in batches of `--database-batch-size` documents, and adds them to the field index.
+
+The hash of every PDF that made it into the database is appended to a checkpoint file, so an interrupted run started
+again with the same checkpoint skips those PDFs and picks up where it stopped. A PDF found twice in one run is only
+processed once. Failed PDFs are not checkpointed and are retried by the next run. `--drafts-only` runs checkpoint
+their drafts in a separate file next to the checkpoint (see `drafts_checkpoint_path`), so a later full run still
+finalizes the PDFs they skipped the database for.
+
+Each document id is the path of the PDF relative to the folder; every property of a portfolio gets `_<n>` added.
+At the end the run reports docs/minute along with the throughput of the extraction, transformation and database
+stages.
+
+Example:
+    Run from the same folder as the server, so the drafts, caches and database are shared with it
+    python ./server/src/batch_ingest.py archive/oms --doc-type om --workers 4 --checkpoint batch_checkpoint.jsonl
+
+Dependencies:
+    the dependencies of the server, see server.py
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import multiprocessing
+from typing import Any
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from caching.disk_cache import hash_file
+
+
+DEFAULT_CHECKPOINT_PATH = "batch_checkpoint.jsonl"
+DEFAULT_DATABASE_BATCH_SIZE = 64
+
+STAGE_DATABASE = "database"
+
+
+class Checkpoint:
+    """Append-only JSON lines file of the hashes of the PDFs that were fully ingested"""
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: a str representing the path to the checkpoint file, created on the first `add`
+        """
+        self.path = path
+        self.completed: set[str] = set()
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        self.completed.add(json.loads(line)["hash"])
+                    except (ValueError, KeyError):
+                        # a line cut off by an interrupted write, the PDF is ingested again
+                        continue
+
+    def add(self, entries: list[tuple[str, str]]) -> None:
+        """
+        Args:
+            entries: the hash and path of each ingested PDF
+        """
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            for file_hash, path in entries:
+                f.write(json.dumps({"hash": file_hash, "path": path, "time": time.time()}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.completed.update(file_hash for file_hash, _ in entries)
+
+
+def drafts_checkpoint_path(checkpoint_path: str) -> str:
+    """
+    Args:
+        checkpoint_path: a str representing the path to the checkpoint file of full runs
+
+    Returns:
+        str: the path to the checkpoint file of `--drafts-only` runs, `batch_checkpoint.drafts.jsonl` for `batch_checkpoint.jsonl`
+    """
+    root, extension = os.path.splitext(checkpoint_path)
+    return f"{root}.drafts{extension or '.jsonl'}"
+
+
+def find_pdfs(folder: str) -> list[str]:
+    """
+    Args:
+        folder: a str representing the folder to walk
+
+    Returns:
+        list[str]: the path of every PDF under the folder, sorted so runs process them in the same order
+    """
+    paths = []
+    for root, _, filenames in os.walk(folder):
+        paths.extend(os.path.join(root, filename) for filename in filenames if filename.lower().endswith(".pdf"))
+    return sorted(paths)
+
+
+def init_worker() -> None:
+    """Initializer of the worker processes, imports the server and loads the extraction models once per worker"""
+    import server
+
+    if server.EXTRACTION_STRATEGY != "fast":
+        try:
+            server.EXTRACTION_MODELS.get()
+        except Exception as e:
+            # the models are loaded again by the first partition that needs them
+            print(f"Batch worker {os.getpid()} could not load its models: {str(e)}")
+
+
+def ingest_file(path: str, doc_type: str) -> tuple[dict, int, dict[str, float]]:
+    """
+    Turns a PDF into its draft in a worker process, see `server.create_draft`
+
+    Args:
+        path: a str representing the path to the pdf file
+        doc_type: a str representing the type of document
+
+    Returns:
+        tuple[dict, int, dict[str, float]]: the draft (or an error) as a dict, the status code and the seconds spent
+        in each finished stage
+    """
+    import server
+
+    stage_starts: dict[str, float] = {}
+    timings: dict[str, float] = {}
+
+    def progress(stage: str, status: str) -> None:
+        if status == "started":
+            stage_starts[stage] = time.perf_counter()
+        else:
+            timings[stage] = time.perf_counter() - stage_starts.pop(stage)
+
+    data, status = server.create_draft(str(uuid.uuid4()), os.path.basename(path), doc_type, path, progress=progress)
+    return data, status, timings
+
+
+def draft_documents(doc_id: str, draft_json: dict | list) -> dict[str, dict[str, Any]]:
+    """
+    Args:
+        doc_id: a str representing the id of the PDF
+        draft_json: the draft of the PDF, a list of drafts for a portfolio
+
+    Returns:
+        dict[str, dict[str, Any]]: the documents to be finalized keyed by their id
+    """
+    if isinstance(draft_json, list):
+        return {f"{doc_id}_{index}": entry for index, entry in enumerate(draft_json)}
+    return {doc_id: draft_json}
+
+
+def write_documents(documents: dict[str, dict[str, Any]]) -> None:
+    """Finalizes the documents the same way `/finalize` does: files, database and field index"""
+    import server
+    from werkzeug.utils import secure_filename
+    from database.database_handler import database_upsert_chunks
+
+    for doc_id, document in documents.items():
+        final_file_path = os.path.join(server.FINAL_FOLDER, f"{secure_filename(doc_id)}.json")
+        with open(final_file_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps(document))
+
+    database_upsert_chunks(server.DATABASE_COLLECTION.get(),
+                           documents=documents,
+                           metadata_list=[{"finalized": "True"} for _ in documents],
+                           embedding_function=server.DATABASE_EMBEDDING_FUNCTION.get(),
+                           max_batch_size=server.DATABASE_CHROMA_CLIENT.get().get_max_batch_size())
+    server.FIELD_INDEX.upsert_documents(documents)
+
+
+class BatchStats:
+    """Counts the ingested PDFs and the seconds spent in each stage"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.ingested = 0
+        self.failed = 0
+        self.skipped = 0
+        self.stage_seconds: dict[str, float] = {}
+        self.stage_counts: dict[str, int] = {}
+
+    def add_stage(self, stage: str, seconds: float, count: int = 1) -> None:
+        self.stage_seconds[stage] = self.stage_seconds.get(stage, 0.0) + seconds
+        self.stage_counts[stage] = self.stage_counts.get(stage, 0) + count
+
+    def report(self, workers: int) -> str:
+        """
+        Args:
+            workers: the amount of worker processes, the extraction and transformation stages run on each of them
+
+        Returns:
+            str: the summary of the run, the throughput of a stage is the amount of PDFs it could handle per minute
+            given the seconds it spent on each PDF and the amount of processes running it
+        """
+        elapsed = time.perf_counter() - self.start
+        lines = [f"Ingested {self.ingested} PDFs in {elapsed:.1f}s ({self.ingested / elapsed * 60:.1f} docs/minute), "
+                 f"{self.failed} failed, {self.skipped} skipped"]
+        for stage, seconds in self.stage_seconds.items():
+            count = self.stage_counts[stage]
+            parallelism = 1 if stage == STAGE_DATABASE else workers
+            throughput = count / seconds * 60 * parallelism if seconds else 0.0
+            lines.append(f"  {stage}: {count} PDFs, {seconds / count:.2f}s per PDF, {throughput:.1f} docs/minute")
+        return "\n".join(lines)
+
+
+class PendingWrites:
+    """Finalized documents waiting to be written to the database in one batch"""
+
+    def __init__(self, checkpoint: Checkpoint, stats: BatchStats, batch_size: int, write_database: bool):
+        self.checkpoint = checkpoint
+        self.stats = stats
+        self.batch_size = max(1, batch_size)
+        self.write_database = write_database
+        self.documents: dict[str, dict[str, Any]] = {}
+        self.files: list[tuple[str, str]] = []
+
+    def add(self, file_hash: str, path: str, documents: dict[str, dict[str, Any]]) -> None:
+        self.documents.update(documents)
+        self.files.append((file_hash, path))
+        if not self.write_database or len(self.documents) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """Writes the pending documents and checkpoints their PDFs, the PDFs stay unchecked if the write fails"""
+        if not self.files:
+            return
+        if self.write_database and self.documents:
+            start = time.perf_counter()
+            try:
+                write_documents(self.documents)
+            except Exception as e:
+                print(f"Error saving {len(self.files)} PDFs to the database: {str(e)}")
+                self.stats.failed += len(self.files)
+                self.documents, self.files = {}, []
+                return
+            self.stats.add_stage(STAGE_DATABASE, time.perf_counter() - start, len(self.files))
+
+        self.checkpoint.add(self.files)
+        self.stats.ingested += len(self.files)
+        self.documents, self.files = {}, []
+
+
+def run(folder: str, doc_type: str, workers: int, checkpoint_path: str, database_batch_size: int,
+        write_database: bool) -> BatchStats:
+    """
+    Ingests every PDF under the folder that is not in the checkpoint yet
+
+    Args:
+        folder: a str representing the folder of PDFs
+        doc_type: a str representing the type of document of every PDF
+        workers: the amount of worker processes
+        checkpoint_path: a str representing the path to the checkpoint file, see `drafts_checkpoint_path` for drafts only runs
+        database_batch_size: the amount of documents written to the database at once
+        write_database: whether to finalize the drafts, only drafts are created if False
+
+    Returns:
+        BatchStats: the counts and stage timings of the run
+    """
+    # PDFs that only got a draft are not finalized, they must not be skipped by a later full run
+    checkpoint = Checkpoint(checkpoint_path if write_database else drafts_checkpoint_path(checkpoint_path))
+    stats = BatchStats()
+    pending = PendingWrites(checkpoint, stats, database_batch_size, write_database)
+
+    # hashed up front so PDFs from the checkpoint and duplicates never reach a worker
+    queued: dict[str, str] = {}
+    for path in find_pdfs(folder):
+        file_hash = hash_file(path)
+        if file_hash in checkpoint.completed or file_hash in queued:
+            stats.skipped += 1
+            continue
+        queued[file_hash] = path
+    print(f"Ingesting {len(queued)} PDFs from {folder}, {stats.skipped} skipped")
+
+    # spawned workers start from a clean interpreter instead of a copy of the parent's threads and clients
+    executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                   initializer=init_worker)
+    try:
+        futures = {executor.submit(ingest_file, path, doc_type): (file_hash, path) for file_hash, path in queued.items()}
+        for future in as_completed(futures):
+            file_hash, path = futures[future]
+            try:
+                data, status, timings = future.result()
+            except Exception as e:
+                data, status, timings = {"error": str(e)}, 500, {}
+            for stage, seconds in timings.items():
+                stats.add_stage(stage, seconds)
+
+            if status != 200:
+                print(f"Failed {path} ({status}): {data.get('error')}")
+                stats.failed += 1
+                continue
+            doc_id = os.path.relpath(path, folder).replace(os.sep, "/")
+            pending.add(file_hash, path, draft_documents(doc_id, data["draft_json"]))
+    finally:
+        # an interrupted run still writes and checkpoints whatever finished
+        executor.shutdown(wait=False, cancel_futures=True)
+        pending.flush()
+
+    return stats
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Turns every PDF in a folder into a finalized JSON in the database")
+    parser.add_argument("folder", help="folder searched recursively for PDFs")
+    parser.add_argument("--doc-type", default="", help="document type of every PDF")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 1) // 2),
+                        help="amount of worker processes")
+    parser.add_argument("--extraction-processes", type=int, default=1,
+                        help="amount of processes each worker partitions a single PDF with")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT_PATH,
+                        help="file of the already ingested PDFs, drafts only runs use the same name ending in .drafts.jsonl")
+    parser.add_argument("--database-batch-size", type=int, default=DEFAULT_DATABASE_BATCH_SIZE,
+                        help="amount of documents written to the database at once")
+    parser.add_argument("--drafts-only", action="store_true", help="only create the drafts, do not finalize them")
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.folder):
+        print(f"ERROR: {args.folder} is not a folder")
+        return 1
+
+    # read by the server on import, here and in the spawned workers which inherit the environment
+    os.environ["WARM_UP_ON_START"] = "false"
+    os.environ["EXTRACTION_PROCESSES"] = str(max(1, args.extraction_processes))
+
+    workers = max(1, args.workers)
+    stats = run(args.folder, args.doc_type, workers, args.checkpoint, args.database_batch_size,
+                write_database=not args.drafts_only)
+    print(stats.report(workers))
+    return 0 if stats.failed == 0 else 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,595 @@
+"""
+Load test of `/upload` and `/finalize` under concurrent clients, fully offline
+
+The server runs in this process with its slow dependencies replaced by fakes whose latencies are drawn from
+lognormal distributions, the usual shape of service times:
+    partitioning: `FakePartitioner` is plugged in through `text_extraction.partition` and sleeps per page, much
+        longer for `hi_res` pages than for `fast` ones, before returning unstructured elements derived from the
+        content of each page, so a page range split from a PDF gets the same elements as in the whole PDF
+    OpenAI: an `OpenAIStub` answers every chat completion after a sampled latency, with a JSON object for single
+        property prompts and a list of properties for portfolio prompts
+    embeddings: `FakeEmbeddingProvider` returns hash based vectors after a sampled latency per batch
+
+Everything else (page classification, splitting, caching, relevance filtering, chunking, the OpenAI backend and its
+concurrency limit, Chroma and the field index) is the real code. Each session of a virtual user uploads newly
+generated PDFs of a random document type, a share of them portfolios, and finalizes their drafts with a given
+probability. Every PDF is unique so no session is answered from the caches.
+
+Two load models are supported:
+    closed loop (`--concurrency`): a fixed amount of virtual users each start a new session as soon as their last
+        one finished, the throughput stops growing once the server is saturated
+    open loop (`--arrival-rates`): sessions arrive at the given average rate (Poisson arrivals) whatever the server
+        is doing, latencies are measured from the planned arrival so a slow server is not hidden by fewer requests
+
+Every level is run for `--duration` seconds, optionally for each value of `--threads` (the file processing threads
+of `/upload`). The pool those threads make up is created for every `/upload` request, it is not shared between
+requests, so `--threads` only changes how the `--files-per-upload` files of one request are spread and has no effect
+above that amount of files (it is rejected with a single file per upload). The report holds the throughput, the latency percentiles of each endpoint, the errors and the depth
+of the upload pool of every level, and the saturation point: the last level after which the throughput grows by
+less than `--min-gain`, and the first level whose p95 upload latency is more than `--p95-factor` times the one of
+the lowest level. The fakes sleep instead of computing so they model latency, not the CPU contention of the real
+models, see `benchmarks.run` for the cost of extraction itself. `--time-scale` shrinks every fake latency to get a
+shorter run with the same shape.
+
+Example:
+    cd server/src
+    python -m benchmarks.load_test --concurrency 1,2,4,8,16 --duration 60 --output load.json
+    python -m benchmarks.load_test --arrival-rates 0.5,1,2,4 --portfolio-share 0.5 --time-scale 0.1
+"""
+
+from __future__ import annotations
+
+import os
+import re
+import sys
+import json
+import math
+import time
+import random
+import shutil
+import hashlib
+import argparse
+import tempfile
+import threading
+from typing import Any, Callable
+from benchmarks.synthetic_pdf import build_pdf, FIELDS
+from benchmarks.openai_stub import OpenAIStub
+from benchmarks.run import synthetic_extracted_text, run_metadata
+
+
+# more than the server's default of 4 file processing threads, so a `--threads` sweep changes how uploads are processed
+DEFAULT_FILES_PER_UPLOAD = 8
+
+# (smallest and largest page count, table density) of each document type
+DOCUMENT_PROFILES: dict[str, tuple[tuple[int, int], float]] = {
+    "Multifamily OM": ((20, 40), 0.3),
+    "Retail Lease": ((5, 15), 0.05),
+    "Rent Roll": ((2, 6), 0.9),
+}
+
+# median seconds and sigma (of the log) of the fakes, before `--time-scale`
+FAST_PAGE_LATENCY = (0.03, 0.4)
+HI_RES_PAGE_LATENCY = (1.2, 0.5)
+LLM_LATENCY = (4.0, 0.6)
+EMBEDDING_BATCH_LATENCY = (0.05, 0.3)
+
+# characters of extracted text per page, a page of an OM holds about this much
+CHARS_PER_PAGE = 2500
+EMBEDDING_DIMENSIONS = 384
+PORTFOLIO_PROPERTIES = (2, 5)
+
+PERCENTILES = (50, 90, 95, 99)
+ENDPOINTS = ("upload", "finalize")
+# how often the depth of the upload pool is sampled
+MONITOR_INTERVAL = 0.05
+
+SINGLE_PROMPT = "Extract the following fields of the property as a JSON object: {fields}."
+PORTFOLIO_PROMPT = "This portfolio holds several properties, extract the following fields of each of them as a list of JSON objects: {fields}."
+
+
+class LatencyModel:
+    """Lognormal latency, thread safe"""
+
+    def __init__(self, median: float, sigma: float, scale: float = 1.0, seed: int = 0):
+        """
+        Args:
+            median: the median of the latency in seconds
+            sigma: the standard deviation of the log of the latency, 0 for a constant latency
+            scale: multiplies every latency
+            seed: the seed of the samples
+        """
+        self.median = median
+        self.sigma = sigma
+        self.scale = scale
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample(self) -> float:
+        with self._lock:
+            deviation = self._rng.gauss(0.0, self.sigma) if self.sigma else 0.0
+        return self.median * math.exp(deviation) * self.scale
+
+    def __call__(self) -> float:
+        return self.sample()
+
+
+class FakePartitioner:
+    """Stand-in for unstructured's `partition_pdf` that sleeps for every page and returns synthetic elements per page"""
+
+    def __init__(self, fast: LatencyModel, hi_res: LatencyModel, chars_per_page: int = CHARS_PER_PAGE):
+        """
+        Args:
+            fast: the latency of a page partitioned with `fast`
+            hi_res: the latency of a page partitioned with any other strategy
+            chars_per_page: the amount of extracted text per page
+        """
+        self.fast = fast
+        self.hi_res = hi_res
+        self.chars_per_page = chars_per_page
+        self.pages = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, filename: str, strategy: str = "auto", starting_page_number: int = 1, **kwargs: Any) -> list:
+        from pypdf import PdfReader
+        from unstructured.documents.elements import NarrativeText, Table, ElementMetadata
+
+        contents = [page.get_contents().get_data() for page in PdfReader(filename).pages]
+        with self._lock:
+            self.pages += len(contents)
+        model = self.fast if strategy == "fast" else self.hi_res
+        time.sleep(sum(model.sample() for _ in contents))
+
+        elements = []
+        for page_number, content in enumerate(contents, start=starting_page_number):
+            # the text depends on the page so every unique PDF gets its own text, and its own OpenAI requests
+            seed = int.from_bytes(hashlib.sha256(content).digest()[:8], "big") + page_number
+            for element in synthetic_extracted_text(self.chars_per_page, seed=seed).split("\n\n"):
+                metadata = ElementMetadata(page_number=page_number)
+                if element.startswith("<table>"):
+                    metadata.text_as_html = element
+                    elements.append(Table(text=re.sub(r"<[^>]+>", " ", element), metadata=metadata))
+                else:
+                    elements.append(NarrativeText(text=element, metadata=metadata))
+        return elements
+
+
+def create_fake_embedding_provider(latency: LatencyModel):
+    """
+    Args:
+        latency: the latency of every batch
+
+    Returns:
+        EmbeddingProvider: a provider returning deterministic unit vectors derived from the hash of each text
+    """
+    import numpy as np
+    from database.embeddings import EmbeddingProvider
+
+    class FakeEmbeddingProvider(EmbeddingProvider):
+        def __init__(self):
+            super().__init__("fake", batch_size=64, threads=1)
+
+        def _embed_batch(self, texts: list[str]) -> list[np.ndarray]:
+            time.sleep(latency.sample())
+            vectors = []
+            for text in texts:
+                seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big")
+                vector = np.random.default_rng(seed).standard_normal(EMBEDDING_DIMENSIONS).astype(np.float32)
+                vectors.append(vector / np.linalg.norm(vector))
+            return vectors
+
+    return FakeEmbeddingProvider()
+
+
+def completion_content(portfolio_prompt: str, seed: int = 0) -> Callable[[dict], str]:
+    """
+    Args:
+        portfolio_prompt: the system prompt of portfolio requests, answered with a list of properties
+        seed: the seed of the values
+
+    Returns:
+        Callable[[dict], str]: builds the message content of a completion from the request body
+    """
+    rng = random.Random(seed)
+    lock = threading.Lock()
+
+    def draft() -> dict[str, str]:
+        return {field: f"{field} {rng.randint(0, 10 ** 9)}" for field in FIELDS}
+
+    def content(payload: dict) -> str:
+        messages = payload.get("messages", [])
+        is_portfolio = bool(messages) and messages[0].get("content") == portfolio_prompt
+        with lock:
+            if is_portfolio:
+                return json.dumps([draft() for _ in range(rng.randint(*PORTFOLIO_PROPERTIES))])
+            return json.dumps(draft())
+
+    return content
+
+
+def percentile(values: list[float], q: float) -> float | None:
+    """
+    Args:
+        values: the samples, in any order
+        q: the percentile, from 0 to 100
+
+    Returns:
+        float | None: the percentile, linearly interpolated between the closest ranks, None without samples
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * q / 100
+    lower = math.floor(rank)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+
+
+def summarize_latencies(values: list[float]) -> dict[str, Any]:
+    summary: dict[str, Any] = {"count": len(values)}
+    for q in PERCENTILES:
+        summary[f"p{q}"] = percentile(values, q)
+    summary["max"] = max(values, default=None)
+    return summary
+
+
+def find_saturation(levels: list[tuple[float, float, float | None]], min_gain: float = 0.05,
+                    p95_factor: float = 2.0) -> dict[str, float | None]:
+    """
+    Args:
+        levels: the load, throughput and p95 latency of each level, in increasing load
+        min_gain: the relative throughput gain below which adding load is no longer worth it
+        p95_factor: how many times the p95 latency of the lowest level counts as degraded
+
+    Returns:
+        dict[str, float | None]: the load of the last level worth adding load to (`throughput_plateau`) and of the
+        first level with a degraded p95 latency (`latency_knee`), None if the levels never got there
+    """
+    plateau = None
+    for (load, throughput, _), (_, next_throughput, _) in zip(levels, levels[1:]):
+        if next_throughput < throughput * (1 + min_gain):
+            plateau = load
+            break
+
+    knee = None
+    baseline = levels[0][2] if levels else None
+    if baseline:
+        knee = next((load for load, _, p95 in levels if p95 is not None and p95 > baseline * p95_factor), None)
+    return {"throughput_plateau": plateau, "latency_knee": knee}
+
+
+class LoadGenerator:
+    """Sends sessions of uploads and finalizes to the in process server and records their latencies"""
+
+    def __init__(self, server, doc_types: list[str], portfolio_share: float, finalize_share: float,
+                 files_per_upload: int, seed: int = 0):
+        """
+        Args:
+            server: the imported server module
+            doc_types: the document types to pick from, see `DOCUMENT_PROFILES`
+            portfolio_share: the probability of a file being a portfolio
+            finalize_share: the probability of a session finalizing its drafts
+            files_per_upload: the amount of files of every upload request
+            seed: the seed of the mix
+        """
+        self.server = server
+        self.doc_types = doc_types
+        self.portfolio_share = portfolio_share
+        self.finalize_share = finalize_share
+        self.files_per_upload = files_per_upload
+        self._rng = random.Random(seed)
+        self._counter = 0
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.latencies: dict[str, list[float]] = {endpoint: [] for endpoint in ENDPOINTS}
+            self.errors: dict[str, int] = {endpoint: 0 for endpoint in ENDPOINTS}
+            self.files = 0
+            self.sessions = 0
+            self.last_finish = 0.0
+
+    def _next_files(self) -> tuple[list[tuple[str, str, bytes]], bool]:
+        """Returns the name, document type and bytes of the files of the next session and whether it finalizes"""
+        files = []
+        with self._lock:
+            for _ in range(self.files_per_upload):
+                self._counter += 1
+                doc_type = self._rng.choice(self.doc_types)
+                (min_pages, max_pages), table_density = DOCUMENT_PROFILES[doc_type]
+                pages = self._rng.randint(min_pages, max_pages)
+                suffix = "_portfolio" if self._rng.random() < self.portfolio_share else ""
+                files.append((f"load_{self._counter}{suffix}.pdf", doc_type, pages, table_density, self._counter))
+            finalize = self._rng.random() < self.finalize_share
+        # building the PDFs is left out of the lock
+        return [(name, doc_type, build_pdf(pages, table_density, seed=seed))
+                for name, doc_type, pages, table_density, seed in files], finalize
+
+    def _record(self, endpoint: str, seconds: float, ok: bool, files: int = 0) -> None:
+        with self._lock:
+            self.latencies[endpoint].append(seconds)
+            if not ok:
+                self.errors[endpoint] += 1
+            self.files += files
+            self.last_finish = time.perf_counter()
+
+    def session(self, client, started: float | None = None) -> None:
+        """
+        Uploads new files and, for a share of the sessions, finalizes their drafts
+
+        Args:
+            client: the Flask test client of the calling thread
+            started: when the session was planned to start, now if None
+        """
+        import io
+
+        files, finalize = self._next_files()
+        started = time.perf_counter() if started is None else started
+        data = {"file": [(io.BytesIO(pdf), name) for name, _, pdf in files],
+                "doc_types": [doc_type for _, doc_type, _ in files]}
+        response = client.post("/upload", data=data, content_type="multipart/form-data")
+        ok = response.status_code == 200
+        self._record("upload", time.perf_counter() - started, ok, files=len(files) if ok else 0)
+        with self._lock:
+            self.sessions += 1
+        if not ok or not finalize:
+            return
+
+        batch = []
+        for result in response.get_json():
+            draft = result["draft_json"]
+            if isinstance(draft, list):
+                # portfolio drafts are finalized per property, like the batch ingestion does
+                batch.extend({f"{result['unique_id']}_{index}": entry} for index, entry in enumerate(draft))
+            else:
+                batch.append({result["unique_id"]: draft})
+        start = time.perf_counter()
+        response = client.post("/finalize", json=batch)
+        self._record("finalize", time.perf_counter() - start, response.status_code == 200)
+
+
+class QueueMonitor:
+    """Samples the depth of the upload pool from a background thread"""
+
+    def __init__(self, interval: float = MONITOR_INTERVAL):
+        self.interval = interval
+        self.samples: list[float] = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="queue-monitor", daemon=True)
+
+    def _run(self) -> None:
+        from observability.metrics import QUEUE_DEPTH
+
+        while not self._stop.wait(self.interval):
+            self.samples.append(QUEUE_DEPTH.value(pool="upload"))
+
+    def __enter__(self) -> "QueueMonitor":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def summary(self) -> dict[str, float]:
+        return {"peak": max(self.samples, default=0.0),
+                "mean": sum(self.samples) / len(self.samples) if self.samples else 0.0}
+
+
+def run_closed_loop(generator: LoadGenerator, users: int, duration: float) -> float:
+    """Runs `users` virtual users for `duration` seconds, returns the seconds until the last session finished"""
+    deadline = time.perf_counter() + duration
+
+    def user() -> None:
+        client = generator.server.app.test_client()
+        while time.perf_counter() < deadline:
+            generator.session(client)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=user, name=f"user-{index}", daemon=True) for index in range(users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return max(generator.last_finish, deadline) - start
+
+
+def run_open_loop(generator: LoadGenerator, rate: float, duration: float, seed: int = 0) -> float:
+    """Starts sessions at an average of `rate` per second for `duration` seconds, returns the seconds until the last finished"""
+    rng = random.Random(seed)
+    start = time.perf_counter()
+    planned = start
+    threads = []
+    while True:
+        planned += rng.expovariate(rate)
+        if planned - start > duration:
+            break
+        time.sleep(max(0.0, planned - time.perf_counter()))
+        thread = threading.Thread(target=lambda planned=planned: generator.session(generator.server.app.test_client(), planned),
+                                  daemon=True)
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+    return max(generator.last_finish, start + duration) - start
+
+
+def run_level(generator: LoadGenerator, mode: str, load: float, threads: int, duration: float, seed: int) -> dict[str, Any]:
+    """Runs one load level and returns its result"""
+    generator.server.MAX_FILE_PROCESSING_THREADS = threads
+    generator.reset()
+    with QueueMonitor() as monitor:
+        if mode == "closed":
+            elapsed = run_closed_loop(generator, int(load), duration)
+        else:
+            elapsed = run_open_loop(generator, load, duration, seed)
+
+    requests = sum(len(latencies) for latencies in generator.latencies.values())
+    return {
+        "mode": mode,
+        "load": load,
+        "threads": threads,
+        "seconds": elapsed,
+        "sessions": generator.sessions,
+        "files": generator.files,
+        "requests_per_second": requests / elapsed if elapsed else 0.0,
+        "files_per_minute": generator.files * 60 / elapsed if elapsed else 0.0,
+        "latency": {endpoint: summarize_latencies(latencies) for endpoint, latencies in generator.latencies.items()},
+        "errors": dict(generator.errors),
+        "upload_queue_depth": monitor.summary(),
+    }
+
+
+def format_level(level: dict[str, Any]) -> str:
+    def seconds(value: float | None) -> str:
+        return "-" if value is None else f"{value:.2f}s"
+
+    upload = level["latency"]["upload"]
+    finalize = level["latency"]["finalize"]
+    return (f"{level['mode']} load={level['load']:g} threads={level['threads']}: "
+            f"{level['requests_per_second']:.2f} req/s, {level['files_per_minute']:.1f} files/min, "
+            f"upload p50={seconds(upload['p50'])} p95={seconds(upload['p95'])} p99={seconds(upload['p99'])}, "
+            f"finalize p95={seconds(finalize['p95'])}, "
+            f"errors={sum(level['errors'].values())}, queue peak={level['upload_queue_depth']['peak']:g}")
+
+
+def prepare_server(work_folder: str, args: argparse.Namespace, stub: OpenAIStub):
+    """
+    Imports the server inside `work_folder` with the fakes plugged in
+
+    Returns:
+        module: the server module
+    """
+    server_folder = os.path.join(work_folder, "server")
+    os.makedirs(server_folder, exist_ok=True)
+    os.chdir(server_folder)
+    os.environ["WARM_UP_ON_START"] = "false"
+    os.environ["API_KEY"] = "load-test"
+    os.environ["OPENAI_BASE_URL"] = stub.base_url
+    # fakes only replace the partition of this process, and the rate limits would be hit by the scaled down latencies
+    os.environ["EXTRACTION_PROCESSES"] = "1"
+    os.environ.setdefault("OPENAI_REQUESTS_PER_MINUTE", "0")
+    os.environ.setdefault("OPENAI_TOKENS_PER_MINUTE", "0")
+
+    from text_extraction import partition
+    partition.set_partition_pdf(FakePartitioner(LatencyModel(*FAST_PAGE_LATENCY, args.time_scale, args.seed),
+                                                LatencyModel(*HI_RES_PAGE_LATENCY, args.time_scale, args.seed + 1)))
+
+    import server
+    from resources.lazy import LazyResource
+    from transformation import gpt, gptPortfolio
+
+    embedding_latency = LatencyModel(*EMBEDDING_BATCH_LATENCY, args.time_scale, args.seed + 2)
+    server.DATABASE_EMBEDDING_FUNCTION = LazyResource("embedding model",
+                                                      lambda: create_fake_embedding_provider(embedding_latency))
+
+    # the prompt files are not part of the repository, generic ones listing the generated fields are used without them
+    fields = ", ".join(f'"{field}"' for field in FIELDS)
+    for module, template in ((gpt, SINGLE_PROMPT), (gptPortfolio, PORTFOLIO_PROMPT)):
+        if not os.path.exists(module.PROMPT_FILE_PATH):
+            module.PROMPT_FILE_PATH = os.path.join(work_folder, os.path.basename(module.PROMPT_FILE_PATH))
+            with open(module.PROMPT_FILE_PATH, "w", encoding="utf-8") as f:
+                f.write(template.format(fields=fields))
+    with open(gptPortfolio.PROMPT_FILE_PATH, "r", encoding="utf-8") as f:
+        stub.content = completion_content(f.read(), args.seed)
+    return server
+
+
+def parse_list(value: str, cast: Callable[[str], Any]) -> list:
+    return [cast(item) for item in value.split(",") if item.strip()]
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Load tests /upload and /finalize offline with fake models")
+    loads = parser.add_mutually_exclusive_group()
+    loads.add_argument("--concurrency", default="1,2,4,8,16", help="comma separated virtual users of each closed loop level")
+    loads.add_argument("--arrival-rates", help="comma separated sessions per second of each open loop level")
+    parser.add_argument("--threads", default=None, help="comma separated file processing threads of /upload to run every level with, the server's default if not set")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds every level runs for")
+    parser.add_argument("--doc-types", default=",".join(DOCUMENT_PROFILES), help=f"comma separated document types, of {', '.join(DOCUMENT_PROFILES)}")
+    parser.add_argument("--portfolio-share", type=float, default=0.2, help="probability of a file being a portfolio")
+    parser.add_argument("--finalize-share", type=float, default=0.5, help="probability of a session finalizing its drafts")
+    parser.add_argument("--files-per-upload", type=int, default=DEFAULT_FILES_PER_UPLOAD,
+                        help="files sent by every /upload, the file processing threads only matter with more than one")
+    parser.add_argument("--time-scale", type=float, default=1.0, help="multiplies every fake latency")
+    parser.add_argument("--min-gain", type=float, default=0.05, help="relative throughput gain below which a level counts as saturated")
+    parser.add_argument("--p95-factor", type=float, default=2.0, help="p95 upload latency, as a multiple of the lowest level's, that counts as degraded")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the mix and the latencies")
+    parser.add_argument("--output", default="load_test.json", help="path of the JSON report")
+    args = parser.parse_args(argv)
+
+    doc_types = parse_list(args.doc_types, str.strip)
+    unknown = [doc_type for doc_type in doc_types if doc_type not in DOCUMENT_PROFILES]
+    if unknown or not doc_types:
+        print(f"ERROR: unknown document types {', '.join(unknown)}, expected some of {', '.join(DOCUMENT_PROFILES)}")
+        return 1
+    mode, load_levels = ("open", parse_list(args.arrival_rates, float)) if args.arrival_rates \
+        else ("closed", parse_list(args.concurrency, int))
+    if not load_levels or min(load_levels) <= 0:
+        print("ERROR: every load level must be positive")
+        return 1
+    load_levels.sort()
+    if args.files_per_upload < 1:
+        print("ERROR: --files-per-upload must be positive")
+        return 1
+    if args.threads:
+        thread_levels = parse_list(args.threads, int)
+        if not thread_levels or min(thread_levels) <= 0:
+            print("ERROR: every --threads value must be positive")
+            return 1
+        # the pool is created per request, it never runs more files at once than a single upload holds
+        if args.files_per_upload == 1:
+            print("ERROR: --threads sizes the file processing pool of a single /upload, it has no effect with "
+                  "--files-per-upload 1")
+            return 1
+        if max(thread_levels) > args.files_per_upload:
+            print(f"WARNING: --threads above --files-per-upload {args.files_per_upload} behave like "
+                  f"{args.files_per_upload} threads, every /upload gets its own pool")
+
+    output_path = os.path.abspath(args.output)
+    started_in = os.getcwd()
+    work_folder = tempfile.mkdtemp(prefix="load_test_")
+    llm_latency = LatencyModel(*LLM_LATENCY, args.time_scale, args.seed + 3)
+    levels = []
+    saturation = {}
+    try:
+        with OpenAIStub(latency=llm_latency) as stub:
+            server = prepare_server(work_folder, args, stub)
+            if not args.threads:
+                thread_levels = [server.MAX_FILE_PROCESSING_THREADS]
+            generator = LoadGenerator(server, doc_types, args.portfolio_share, args.finalize_share,
+                                      args.files_per_upload, args.seed)
+            for threads in thread_levels:
+                runs = []
+                for load in load_levels:
+                    llm_requests = stub.requests
+                    level = run_level(generator, mode, load, threads, args.duration, args.seed)
+                    level["llm_requests"] = stub.requests - llm_requests
+                    print(format_level(level))
+                    runs.append(level)
+                levels.extend(runs)
+                saturation[str(threads)] = find_saturation(
+                    [(run["load"], run["requests_per_second"], run["latency"]["upload"]["p95"]) for run in runs],
+                    args.min_gain, args.p95_factor)
+                print(f"threads={threads}: throughput plateau at load {saturation[str(threads)]['throughput_plateau']}, "
+                      f"p95 knee at load {saturation[str(threads)]['latency_knee']}")
+    finally:
+        os.chdir(started_in)
+        shutil.rmtree(work_folder, ignore_errors=True)
+
+    config = {key: value for key, value in vars(args).items() if key != "output"}
+    config.update({"mode": mode, "doc_types": doc_types,
+                   # MAX_FILE_PROCESSING_THREADS sizes a pool created by every /upload, not one shared by all of them
+                   "threads_scope": "per_upload_request"})
+    report = {"metadata": run_metadata(), "config": config, "levels": levels, "saturation": saturation}
+    output_folder = os.path.dirname(output_path)
+    if output_folder:
+        os.makedirs(output_folder, exist_ok=True)
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {len(levels)} levels to {output_path}")
+    return 0 if all(sum(level["errors"].values()) == 0 for level in levels) else 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
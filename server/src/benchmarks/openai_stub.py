@@ -0,0 +1,127 @@
+"""
+Local stand-in for the OpenAI chat completions API, so the transformation stage can be timed without a key or network
+
+`OpenAIStub` serves `POST /v1/chat/completions` on a free local port from a background thread. Every request waits
+`latency` seconds (plus up to `jitter` seconds) and answers with a completion whose message content is `content`, a
+JSON object by default so `response_format={"type": "json_object"}` callers can parse it. Both can also be functions,
+e.g. to draw latencies from a distribution or to answer portfolio prompts with a list. Point a client at
+`stub.base_url`, through `base_url=` or the `OPENAI_BASE_URL` environment variable read by the openai package.
+
+Example:
+    with OpenAIStub(latency=0.2) as stub:
+        backend = AsyncOpenAIBackend("benchmark", base_url=stub.base_url)
+        backend.complete(model="gpt-4o-mini", messages=[{"role": "user", "content": "hi"}]).message.content
+        print(stub.requests)
+"""
+
+import json
+import time
+import random
+import threading
+from typing import Callable
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+DEFAULT_CONTENT = json.dumps({"Property Name": "Benchmark Apartments", "Units": "120", "Year Built": "1998"})
+
+
+class OpenAIStub:
+    """Chat completions server with a configurable latency, counts the requests it answered"""
+
+    def __init__(self, latency: float | Callable[[], float] = 0.0, jitter: float = 0.0,
+                 content: str | Callable[[dict], str] = DEFAULT_CONTENT, seed: int = 0):
+        """
+        Args:
+            latency: the amount of seconds every request waits before it is answered, or a function returning it
+            jitter: the maximum amount of seconds randomly added to the latency
+            content: the message content of every completion, or a function of the request body returning it
+            seed: the seed of the jitter
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.content = content
+        self.requests = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread: threading.Thread | None = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def _delay(self) -> float:
+        with self._lock:
+            self.requests += 1
+            latency = self.latency() if callable(self.latency) else self.latency
+            return latency + (self._rng.uniform(0, self.jitter) if self.jitter else 0.0)
+
+    def _completion(self, payload: dict) -> dict:
+        content = self.content(payload) if callable(self.content) else self.content
+        prompt_chars = sum(len(str(message.get("content", ""))) for message in payload.get("messages", []))
+        return {
+            "id": f"chatcmpl-stub-{self.requests}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload.get("model", ""),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content, "refusal": None},
+                "logprobs": None,
+                "finish_reason": "stop",
+            }],
+            # roughly the token counts of the real API, four characters per token
+            "usage": {"prompt_tokens": prompt_chars // 4, "completion_tokens": len(content) // 4,
+                      "total_tokens": (prompt_chars + len(content)) // 4},
+        }
+
+    def _handler(self) -> type[BaseHTTPRequestHandler]:
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self) -> None:
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if self.path.rstrip("/") != "/v1/chat/completions":
+                    self._reply(404, {"error": {"message": f"Unknown path {self.path}", "type": "invalid_request_error"}})
+                    return
+                try:
+                    payload = json.loads(body)
+                except ValueError:
+                    self._reply(400, {"error": {"message": "Invalid JSON body", "type": "invalid_request_error"}})
+                    return
+
+                time.sleep(stub._delay())
+                self._reply(200, stub._completion(payload))
+
+            def _reply(self, status: int, payload: dict) -> None:
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format: str, *args) -> None:
+                # one line per request would drown the benchmark output
+                pass
+
+        return Handler
+
+    def start(self) -> "OpenAIStub":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="openai-stub", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "OpenAIStub":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
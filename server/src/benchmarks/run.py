@@ -0,0 +1,320 @@
+"""
+Stage level benchmarks of the pipeline, written to a JSON file so runs on different commits can be compared
+
+Suites:
+    extraction: `extract_text` under each strategy on synthetic PDFs of different page counts and table densities
+    clean: `clean_full_chunk` and `clean_chunk` on synthetic extracted text of different sizes
+    llm: `gpt.request` against a local OpenAI stand-in (see `openai_stub`) at different latencies, sequentially
+        through the shared client and concurrently through `AsyncOpenAIBackend`
+    finalize: `/finalize` with batches of new documents of different sizes, and the same batches again unchanged
+
+Every benchmark runs `--repeat` times after an untimed warm-up run and reports the min, median, mean and max seconds,
+along with a throughput in items per second where one applies. A benchmark or suite that fails (e.g. unstructured
+is not installed for `extraction`) is recorded with its error and the other suites still run. Everything the
+server writes goes to a temporary folder, `OPENAI_API_KEY` is never used.
+
+Example:
+    cd server/src
+    python -m benchmarks.run --output bench/HEAD.json
+    python -m benchmarks.run --suites clean,llm --quick --output bench/new.json --compare bench/HEAD.json
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+from typing import Any, Callable
+from concurrent.futures import ThreadPoolExecutor
+from benchmarks.synthetic_pdf import write_pdf, FIELDS, WORDS
+from benchmarks.openai_stub import OpenAIStub
+
+
+EXTRACTION_STRATEGIES = ["fast", "auto", "hi_res", "adaptive"]
+# (pages, table density) of the synthetic PDFs
+DOCUMENTS = [(1, 0.0), (10, 0.0), (10, 0.5), (50, 0.2)]
+QUICK_DOCUMENTS = [(1, 0.0), (10, 0.5)]
+
+CLEAN_SIZES = [10_000, 100_000, 1_000_000]
+QUICK_CLEAN_SIZES = [10_000, 100_000]
+
+LLM_LATENCIES = [0.0, 0.05, 0.2]
+LLM_CONCURRENT_REQUESTS = 32
+LLM_CONCURRENCY = 8
+
+FINALIZE_BATCH_SIZES = [1, 10, 100]
+QUICK_FINALIZE_BATCH_SIZES = [1, 10]
+
+DOC_TYPE = "Multifamily OM"
+
+
+class Results:
+    """Times benchmarks and collects their results"""
+
+    def __init__(self, repeat: int):
+        self.repeat = max(1, repeat)
+        self.results: list[dict[str, Any]] = []
+
+    def measure(self, suite: str, name: str, func: Callable[[], Any], params: dict[str, Any] | None = None,
+                items: int | None = None, warm_up: bool = True, repeat: int | None = None) -> dict[str, Any]:
+        """
+        Args:
+            suite: the name of the suite
+            name: the name of the benchmark within the suite
+            func: the code being timed
+            params: the parameters of the benchmark, part of its identity when comparing runs
+            items: optional amount of items handled by one run of `func`, reported as items per second
+            warm_up: whether to run `func` once before timing it
+            repeat: the amount of timed runs, the default of the run if None
+
+        Returns:
+            dict[str, Any]: the result, also added to `results`
+        """
+        result: dict[str, Any] = {"suite": suite, "name": name, "params": params or {}}
+        try:
+            if warm_up:
+                func()
+            seconds = []
+            for _ in range(repeat or self.repeat):
+                start = time.perf_counter()
+                func()
+                seconds.append(time.perf_counter() - start)
+            result["seconds"] = {"runs": len(seconds), "min": min(seconds), "median": statistics.median(seconds),
+                                 "mean": statistics.fmean(seconds), "max": max(seconds)}
+            if items is not None and result["seconds"]["median"] > 0:
+                result["items_per_second"] = items / result["seconds"]["median"]
+            print(f"{suite}/{name} {json.dumps(params or {})}: {result['seconds']['median']:.4f}s median")
+        except Exception as e:
+            result["error"] = f"{type(e).__name__}: {str(e)}"
+            print(f"{suite}/{name} {json.dumps(params or {})}: failed, {result['error']}")
+        self.results.append(result)
+        return result
+
+
+def synthetic_extracted_text(chars: int, seed: int = 0) -> str:
+    """
+    Args:
+        chars: the approximate amount of characters
+        seed: the seed of the random values
+
+    Returns:
+        str: text shaped like the output of the extraction, key-value lines, prose and HTML tables in blank line separated elements
+    """
+    rng = random.Random(seed)
+    elements = []
+    size = 0
+    while size < chars:
+        kind = rng.random()
+        if kind < 0.4:
+            field = rng.choice(FIELDS)
+            element = f"{field}: {rng.randint(1, 10_000_000):,}.{rng.randint(0, 99):02d} – Café"
+        elif kind < 0.8:
+            element = " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 60))).capitalize() + "."
+        else:
+            cells = "".join(f"<td>{rng.choice(WORDS)} {rng.randint(1, 2000)}</td>" for _ in range(5))
+            element = f"<table><tr>{cells}</tr>\n\t<tr>{cells}</tr></table>"
+        elements.append(element)
+        size += len(element) + 2
+    return "\n\n".join(elements)
+
+
+def bench_extraction(results: Results, work_folder: str, quick: bool) -> None:
+    from text_extraction.model_warmup import MODELS
+    from text_extraction.unstructured_extract import extract_text
+
+    # loading the models is timed on its own, every timed extraction below runs with the models loaded
+    results.measure("extraction", "model_load", MODELS.ensure_loaded, warm_up=False, repeat=1)
+
+    out_path = os.path.join(work_folder, "extracted.txt")
+    for pages, table_density in (QUICK_DOCUMENTS if quick else DOCUMENTS):
+        pdf_path = write_pdf(os.path.join(work_folder, "pdfs", f"om_{pages}_{table_density}.pdf"), pages, table_density)
+        for strategy in EXTRACTION_STRATEGIES:
+            def extract() -> None:
+                if not extract_text(pdf_path, out_path, strategy=strategy, cache=None):
+                    raise RuntimeError(f"extract_text failed with the {strategy} strategy")
+
+            results.measure("extraction", "extract_text", extract, items=pages,
+                            params={"strategy": strategy, "pages": pages, "table_density": table_density})
+
+
+def bench_clean(results: Results, work_folder: str, quick: bool) -> None:
+    from clean_text.clean_text import clean_full_chunk, clean_chunk
+
+    for chars in (QUICK_CLEAN_SIZES if quick else CLEAN_SIZES):
+        text = synthetic_extracted_text(chars)
+        for func in (clean_full_chunk, clean_chunk):
+            results.measure("clean", func.__name__, lambda: func(text), params={"chars": chars}, items=len(text))
+
+
+def bench_llm(results: Results, work_folder: str, quick: bool) -> None:
+    from transformation import gpt
+    from transformation.async_backend import AsyncOpenAIBackend
+
+    text = synthetic_extracted_text(8_000)
+    previous_base_url = os.environ.get("OPENAI_BASE_URL")
+    with OpenAIStub() as stub:
+        # read by the openai package when the shared client is created, the key is new so a new client is created
+        os.environ["OPENAI_BASE_URL"] = stub.base_url
+        api = f"benchmark-{stub.base_url}"
+        backend = AsyncOpenAIBackend(api, max_concurrency=LLM_CONCURRENCY, requests_per_minute=0,
+                                     tokens_per_minute=0, max_retries=0, base_url=stub.base_url)
+        try:
+            for latency in (LLM_LATENCIES[:2] if quick else LLM_LATENCIES):
+                stub.latency = latency
+                results.measure("llm", "request", lambda: gpt.request(DOC_TYPE, api, text),
+                                params={"latency": latency}, items=1)
+
+                def request_concurrently() -> None:
+                    with ThreadPoolExecutor(max_workers=LLM_CONCURRENCY) as executor:
+                        list(executor.map(lambda _: gpt.request(DOC_TYPE, api, text, backend=backend),
+                                          range(LLM_CONCURRENT_REQUESTS)))
+
+                results.measure("llm", "request_backend", request_concurrently, items=LLM_CONCURRENT_REQUESTS,
+                                params={"latency": latency, "requests": LLM_CONCURRENT_REQUESTS,
+                                        "concurrency": LLM_CONCURRENCY})
+        finally:
+            backend.close()
+            if previous_base_url is None:
+                os.environ.pop("OPENAI_BASE_URL", None)
+            else:
+                os.environ["OPENAI_BASE_URL"] = previous_base_url
+
+
+def bench_finalize(results: Results, work_folder: str, quick: bool) -> None:
+    # the server creates its folders, caches and database in the working directory
+    server_folder = os.path.join(work_folder, "server")
+    os.makedirs(server_folder, exist_ok=True)
+    os.chdir(server_folder)
+    os.environ["WARM_UP_ON_START"] = "false"
+    import server
+
+    client = server.app.test_client()
+    rng = random.Random(0)
+    counter = iter(range(sys.maxsize))
+
+    def new_batch(size: int) -> list[dict[str, dict[str, str]]]:
+        # new ids and values every run, so every chunk is embedded instead of found unchanged or in the vector cache
+        batch = []
+        for _ in range(size):
+            index = next(counter)
+            batch.append({f"benchmark_{index}.pdf": {field: f"{field} {index} {rng.randint(0, 10 ** 9)}" for field in FIELDS}})
+        return batch
+
+    def finalize(batch: list[dict[str, dict[str, str]]]) -> None:
+        response = client.post("/finalize", json=batch)
+        if response.status_code != 200:
+            raise RuntimeError(f"/finalize answered {response.status_code}: {response.get_data(as_text=True)}")
+
+    for size in (QUICK_FINALIZE_BATCH_SIZES if quick else FINALIZE_BATCH_SIZES):
+        last_batch: list[dict[str, dict[str, str]]] = []
+
+        def finalize_new() -> None:
+            last_batch[:] = new_batch(size)
+            finalize(last_batch)
+
+        results.measure("finalize", "new", finalize_new, params={"batch_size": size}, items=size)
+        results.measure("finalize", "unchanged", lambda: finalize(last_batch), params={"batch_size": size},
+                        items=size)
+
+
+SUITES: dict[str, Callable[[Results, str, bool], None]] = {
+    "extraction": bench_extraction,
+    "clean": bench_clean,
+    "llm": bench_llm,
+    "finalize": bench_finalize,
+}
+
+
+def run_metadata() -> dict[str, Any]:
+    """
+    Returns:
+        dict[str, Any]: what identifies the run, the commit is None outside of a git checkout
+    """
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {"commit": commit, "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"), "python": platform.python_version(),
+            "platform": platform.platform(), "cpu_count": os.cpu_count()}
+
+
+def result_key(result: dict[str, Any]) -> str:
+    return f"{result['suite']}/{result['name']} {json.dumps(result['params'], sort_keys=True)}"
+
+
+def compare(previous: dict[str, Any], current: dict[str, Any]) -> list[str]:
+    """
+    Args:
+        previous: the output of an earlier run
+        current: the output of this run
+
+    Returns:
+        list[str]: one line per benchmark found in both runs with its median seconds and the ratio of the two
+    """
+    previous_medians = {result_key(result): result["seconds"]["median"]
+                        for result in previous["results"] if "seconds" in result}
+    lines = []
+    for result in current["results"]:
+        key = result_key(result)
+        if "seconds" in result and key in previous_medians and previous_medians[key] > 0:
+            median = result["seconds"]["median"]
+            lines.append(f"{key}: {previous_medians[key]:.4f}s -> {median:.4f}s ({median / previous_medians[key]:.2f}x)")
+    return lines
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Runs the stage level benchmarks and writes their results as JSON")
+    parser.add_argument("--suites", default=",".join(SUITES), help=f"comma separated suites, of {', '.join(SUITES)}")
+    parser.add_argument("--repeat", type=int, default=3, help="amount of timed runs of every benchmark")
+    parser.add_argument("--quick", action="store_true", help="only the smaller documents, texts and batches")
+    parser.add_argument("--output", default="benchmark.json", help="path of the JSON results")
+    parser.add_argument("--compare", help="path of the JSON results of an earlier run to compare against")
+    args = parser.parse_args(argv)
+
+    suites = [suite.strip() for suite in args.suites.split(",") if suite.strip()]
+    unknown = [suite for suite in suites if suite not in SUITES]
+    if unknown:
+        print(f"ERROR: unknown suites {', '.join(unknown)}, expected some of {', '.join(SUITES)}")
+        return 1
+
+    output_path = os.path.abspath(args.output)
+    compare_path = os.path.abspath(args.compare) if args.compare else None
+    results = Results(args.repeat)
+    started_in = os.getcwd()
+    work_folder = tempfile.mkdtemp(prefix="benchmark_")
+    try:
+        for suite in suites:
+            try:
+                SUITES[suite](results, work_folder, args.quick)
+            except Exception as e:
+                print(f"{suite}: failed, {type(e).__name__}: {str(e)}")
+                results.results.append({"suite": suite, "name": None, "params": {},
+                                        "error": f"{type(e).__name__}: {str(e)}"})
+    finally:
+        os.chdir(started_in)
+        shutil.rmtree(work_folder, ignore_errors=True)
+
+    report = {"metadata": run_metadata(), "results": results.results}
+    output_folder = os.path.dirname(output_path)
+    if output_folder:
+        os.makedirs(output_folder, exist_ok=True)
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {len(results.results)} results to {output_path}")
+
+    if compare_path:
+        with open(compare_path, "r", encoding="utf-8") as f:
+            for line in compare(json.load(f), report):
+                print(line)
+    return 0 if all("error" not in result for result in results.results) else 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
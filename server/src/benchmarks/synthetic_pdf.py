@@ -0,0 +1,160 @@
+"""
+Synthetic offering memorandum PDFs for the benchmarks, written without any PDF library
+
+Every page has a heading and lines of key-value pairs and prose in the text layer, so `fast` can read it. Pages with
+a table also get a grid of ruling lines with a value in every cell, enough lines for `page_classifier` to send the
+page to `hi_res`. `table_density` is the share of pages that get a table, spread evenly over the document. The same
+arguments always produce the same bytes, so runs on different commits partition identical files.
+
+Example:
+    write_pdf("bench/om_10_pages.pdf", pages=10, table_density=0.5)
+"""
+
+import os
+import random
+
+
+PAGE_WIDTH = 612
+PAGE_HEIGHT = 792
+MARGIN = 72
+FONT_SIZE = 10
+LINE_HEIGHT = 14
+
+TABLE_ROWS = 8
+TABLE_COLUMNS = 5
+TABLE_ROW_HEIGHT = 20
+
+FIELDS = ["Property Name", "Address", "Year Built", "Units", "Occupancy", "Asking Price", "Cap Rate", "NOI",
+          "Lot Size", "Parking Spaces", "Zoning", "Average Rent", "Price per Unit", "Submarket"]
+WORDS = ["the", "property", "offers", "residents", "a", "unique", "opportunity", "located", "near", "downtown",
+         "with", "strong", "rent", "growth", "and", "value", "add", "upside", "through", "renovation", "of",
+         "units", "amenities", "investors", "market", "occupancy", "stabilized", "class", "multifamily", "asset"]
+TABLE_HEADER = ["Unit Type", "Units", "Sq Ft", "Rent", "Rent/SF"]
+
+
+def page_has_table(index: int, table_density: float) -> bool:
+    """
+    Args:
+        index: the index of the page
+        table_density: the share of pages holding a table (0 to 1)
+
+    Returns:
+        bool: whether the page holds a table, tables are spread evenly over the pages
+    """
+    return int((index + 1) * table_density) > int(index * table_density)
+
+
+def escape(text: str) -> str:
+    """Escapes a str for a PDF literal string"""
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def text_line(x: float, y: float, text: str, size: int = FONT_SIZE) -> str:
+    return f"BT /F1 {size} Tf {x} {y} Td ({escape(text)}) Tj ET\n"
+
+
+def field_value(field: str, rng: random.Random) -> str:
+    if field in ("Year Built",):
+        return str(rng.randint(1950, 2023))
+    if field in ("Units", "Parking Spaces"):
+        return str(rng.randint(8, 400))
+    if field in ("Occupancy", "Cap Rate"):
+        return f"{rng.uniform(3, 99):.2f}%"
+    if field in ("Asking Price", "NOI", "Average Rent", "Price per Unit"):
+        return f"${rng.randint(900, 90_000_000):,}"
+    return " ".join(rng.choice(WORDS).capitalize() for _ in range(rng.randint(1, 3)))
+
+
+def page_content(index: int, has_table: bool, rng: random.Random) -> str:
+    """
+    Args:
+        index: the index of the page
+        has_table: whether to draw a table at the bottom of the page
+        rng: the random source of the values
+
+    Returns:
+        str: the content stream of the page
+    """
+    content = [text_line(MARGIN, PAGE_HEIGHT - MARGIN, f"Offering Memorandum - Page {index + 1}", size=16)]
+    y = PAGE_HEIGHT - MARGIN - 2 * LINE_HEIGHT
+    bottom = MARGIN + (TABLE_ROWS * TABLE_ROW_HEIGHT + LINE_HEIGHT if has_table else 0)
+    while y > bottom:
+        if rng.random() < 0.5:
+            field = rng.choice(FIELDS)
+            line = f"{field}: {field_value(field, rng)}"
+        else:
+            line = " ".join(rng.choice(WORDS) for _ in range(14)).capitalize() + "."
+        content.append(text_line(MARGIN, y, line))
+        y -= LINE_HEIGHT
+
+    if has_table:
+        width = (PAGE_WIDTH - 2 * MARGIN) / TABLE_COLUMNS
+        top = MARGIN + TABLE_ROWS * TABLE_ROW_HEIGHT
+        content.append("0 0 0 RG 0.5 w\n")
+        for row in range(TABLE_ROWS + 1):
+            line_y = top - row * TABLE_ROW_HEIGHT
+            content.append(f"{MARGIN} {line_y} m {PAGE_WIDTH - MARGIN} {line_y} l S\n")
+        for column in range(TABLE_COLUMNS + 1):
+            line_x = MARGIN + column * width
+            content.append(f"{line_x:.1f} {top} m {line_x:.1f} {MARGIN} l S\n")
+        for row in range(TABLE_ROWS):
+            for column in range(TABLE_COLUMNS):
+                if row == 0:
+                    cell = TABLE_HEADER[column]
+                elif column == 0:
+                    cell = f"{rng.randint(0, 3)}BR/{rng.randint(1, 3)}BA"
+                else:
+                    cell = f"{rng.uniform(1, 2000):,.0f}"
+                content.append(text_line(MARGIN + column * width + 4, top - (row + 1) * TABLE_ROW_HEIGHT + 6, cell))
+    return "".join(content)
+
+
+def build_pdf(pages: int, table_density: float = 0.0, seed: int = 0) -> bytes:
+    """
+    Args:
+        pages: the amount of pages
+        table_density: the share of pages holding a table (0 to 1)
+        seed: the seed of the random values on the pages
+
+    Returns:
+        bytes: the PDF file
+    """
+    rng = random.Random(seed)
+    # 1: catalog, 2: pages, 3: font, then a page and its content stream for every page
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", "",
+               "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for index in range(pages):
+        page_id = len(objects) + 1
+        kids.append(f"{page_id} 0 R")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] "
+                       f"/Contents {page_id + 1} 0 R /Resources << /Font << /F1 3 0 R >> >> >>")
+        stream = page_content(index, page_has_table(index, table_density), rng).encode("latin-1")
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream.decode('latin-1')}endstream")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {pages} >>"
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1")
+    out += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode("latin-1")
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("latin-1")
+    return bytes(out)
+
+
+def write_pdf(path: str, pages: int, table_density: float = 0.0, seed: int = 0) -> str:
+    """
+    Writes a synthetic PDF, see `build_pdf`
+
+    Returns:
+        str: the path the PDF was written to
+    """
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(build_pdf(pages, table_density, seed))
+    return path
@@ -0,0 +1,202 @@
+"""
+Persistent, size-bounded key/value cache for str values that is stored on disk
+
+Every entry is stored as its own file named after its key inside the cache folder. The modification time of the
+file is the time the entry was stored and the access time is set to the last time the entry was used, so both the
+expiry and the least recently used order survive a server restart.
+Once the total size of the entries goes over `max_bytes` the least recently used entries are evicted. Entries can
+optionally expire after `ttl_seconds`.
+
+Several processes (batch ingestion workers, server workers) can share a folder. Each keeps its own index of the
+entries: an entry missing from the index is looked up on disk before it counts as a miss, and once the index goes
+over `max_bytes` the folder is scanned again so the entries written by the other processes are evicted as well.
+Entries another process wrote since the last scan are only counted at the next one, so with N processes the folder
+can briefly hold up to N times `max_bytes`. The hit, miss and eviction counters are per process.
+
+Keys should be built with `make_key` so they are safe to use as filenames.
+"""
+
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+HASH_READ_BLOCK_SIZE = 1024 * 1024
+
+
+def make_key(*parts: str | bytes) -> str:
+    """
+    Hashes the given parts into a single SHA-256 hex digest. Each part is length prefixed so that
+    different splits of the same bytes never produce the same key.
+
+    Args:
+        parts: the strs or bytes identifying a cache entry
+
+    Returns:
+        str: the hex digest to be used as the cache key
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        data = part.encode("utf-8") if isinstance(part, str) else part
+        digest.update(len(data).to_bytes(8, "big"))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+def hash_file(path: str) -> str:
+    """
+    Args:
+        path: a str representing the path to the file
+
+    Returns:
+        str: the SHA-256 hex digest of the contents of the file
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_READ_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class DiskCache:
+    """Thread-safe on-disk LRU cache of str values with hit and miss counters"""
+
+    def __init__(self, folder: str, max_bytes: int, ttl_seconds: float | None = None, suffix: str = ".txt"):
+        """
+        Args:
+            folder: a str representing the directory the entries are stored in
+            max_bytes: the maximum total size of all entries before the least recently used are evicted
+            ttl_seconds: optional amount of seconds after which an entry expires, entries never expire if None
+            suffix: the file extension used for the entry files
+        """
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.suffix = suffix
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        # key -> (size in bytes, time the entry was stored), ordered from least to most recently used
+        self._entries: OrderedDict[str, tuple[int, float]] = OrderedDict()
+        self._total_bytes = 0
+        os.makedirs(folder, exist_ok=True)
+        self._load()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.folder, key + self.suffix)
+
+    def _load(self) -> None:
+        """Indexes the entries on disk, ordered by their last use, replacing the current index"""
+        found = []
+        for name in os.listdir(self.folder):
+            if not name.endswith(self.suffix):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.folder, name))
+            except FileNotFoundError:
+                # evicted by another process in the meantime
+                continue
+            found.append((stat.st_atime, name[:-len(self.suffix)], stat.st_size, stat.st_mtime))
+        self._entries.clear()
+        self._total_bytes = 0
+        for _, key, size, created in sorted(found):
+            self._entries[key] = (size, created)
+            self._total_bytes += size
+
+    def _remove(self, key: str) -> None:
+        size, _ = self._entries.pop(key)
+        self._total_bytes -= size
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def get(self, key: str) -> str | None:
+        """
+        Args:
+            key: a str representing the key of the entry
+
+        Returns:
+            str | None: the cached value or None if the key is missing or expired
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                # possibly written by another process sharing the folder
+                try:
+                    stat = os.stat(self._path(key))
+                except FileNotFoundError:
+                    pass
+                else:
+                    entry = self._entries[key] = (stat.st_size, stat.st_mtime)
+                    self._total_bytes += stat.st_size
+            if entry is not None and self.ttl_seconds is not None and time.time() - entry[1] > self.ttl_seconds:
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            try:
+                with open(self._path(key), "r", encoding="utf-8") as f:
+                    value = f.read()
+            except OSError:
+                # entry was removed from disk behind our back
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            os.utime(self._path(key), times=(time.time(), entry[1]))
+            self.hits += 1
+            return value
+
+    def put(self, key: str, value: str) -> None:
+        """
+        Stores the value under the given key and evicts the least recently used entries if the cache is too large.
+        Values larger than the whole cache are not stored.
+
+        Args:
+            key: a str representing the key of the entry
+            value: the str to be stored
+        """
+        data = value.encode("utf-8")
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            path = self._path(key)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+            self._entries[key] = (len(data), os.stat(path).st_mtime)
+            self._total_bytes += len(data)
+            if self._total_bytes > self.max_bytes:
+                # count the entries other processes added or removed before deciding what to evict
+                self._load()
+            while self._total_bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self) -> None:
+        """Removes every entry from the cache"""
+        with self._lock:
+            for key in list(self._entries):
+                self._remove(key)
+
+    def stats(self) -> dict[str, int]:
+        """
+        Returns:
+            dict[str, int]: the hit, miss and eviction counters along with the amount and total size of the entries
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+            }
@@ -0,0 +1,66 @@
+"""
+In-memory, thread-safe least recently used cache bounded by its amount of entries
+"""
+
+import threading
+from typing import Any, Hashable
+from collections import OrderedDict
+
+
+class LRUCache:
+    """Thread-safe in-memory LRU cache with hit and miss counters"""
+
+    def __init__(self, max_entries: int):
+        """
+        Args:
+            max_entries: the maximum amount of entries before the least recently used are evicted
+        """
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        # incremented by every clear, include it in keys so values computed before a clear are never returned after it
+        self.generation = 0
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[Hashable, Any] = OrderedDict()
+
+    def get(self, key: Hashable) -> Any | None:
+        """
+        Args:
+            key: the key of the entry
+
+        Returns:
+            Any | None: the cached value or None if the key is missing
+        """
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """
+        Args:
+            key: the key of the entry
+            value: the value to be stored
+        """
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """Removes every entry from the cache"""
+        with self._lock:
+            self._entries.clear()
+            self.generation += 1
+
+    def stats(self) -> dict[str, int]:
+        """
+        Returns:
+            dict[str, int]: the hit and miss counters along with the amount of entries
+        """
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
@@ -1,8 +1,16 @@
 """
-This file is still being worked on and is not currently being used in the functionality for server.py
+Normalizes extracted text before it is sent to the OpenAI API: non-ASCII characters are dropped, everything is
+lowercased, and the text is split into number, word, whitespace and punctuation tokens joined by single spaces.
+Each whitespace run collapses to its dominant character, and runs dominated by a space disappear.
+
+`clean_full_chunk` is the reference tokenizer, it walks the text one character at a time. `clean_chunk` produces the
+exact same output with a compiled regex over the whole string. `StreamingCleaner`, `iter_clean_text` and
+`iter_clean_elements` produce it from text arriving in chunks, holding only the last open token between chunks, and
+are the ones used by server.py.
 """
 
-from typing import Tuple
+import re
+from typing import Iterable, Iterator, Tuple
 
 Token = str
 
@@ -122,4 +130,181 @@ def handle_others(char_list: list[Char], start_pos: StringPtr) -> Tuple[StringTo
 def clean_full_chunk(str_chunk: str) -> str:
     cleaned_chunk: list[Char] = get_ascii_chars(str_chunk)
     tokenized_chunk: list[Char] = tokenize_list(cleaned_chunk)
-    return ' '.join(tokenized_chunk)
\ No newline at end of file
+    return ' '.join(tokenized_chunk)
+
+
+WHITESPACE = " \t\n\v\f\r\x1c-\x1f"
+WHITESPACE_CHARS = frozenset(" \t\n\v\f\r\x1c\x1d\x1e\x1f")
+# same tokens as `tokenize_list`, the branches start with disjoint characters so their order does not matter except
+# for `--` before `.`. A lone space between two tokens always folds to '' so it is skipped rather than returned.
+TOKEN_PATTERN = re.compile(rf"(?: (?![{WHITESPACE}]))?([a-z]+|[0-9]+(?:\.[0-9]+)?|[{WHITESPACE}]+|--|.)", re.DOTALL)
+# distinct whitespace runs kept by `WHITESPACE_TOKENS`, there are only a handful in practice
+MAX_WHITESPACE_TOKENS = 4096
+
+
+class WhitespaceTokens(dict):
+    """Maps a whitespace run to its token as chosen by `handle_whitespace`, '' for a space, computed once per run"""
+
+    def __missing__(self, run: str) -> StringToken:
+        token, _ = handle_whitespace(list(run), 0)
+        if len(self) < MAX_WHITESPACE_TOKENS:
+            self[run] = token
+        return token
+
+
+WHITESPACE_TOKENS = WhitespaceTokens()
+
+
+def clean_chunk(str_chunk: str) -> str:
+    """
+    Same output as `clean_full_chunk`, byte for byte, several times faster: the text is tokenized by a single
+    compiled regex instead of one function call per character
+
+    Args:
+        str_chunk: a str representing the text to be cleaned
+
+    Returns:
+        str: the cleaned text
+    """
+    assert isinstance(str_chunk, str)
+
+    return tokens_to_text(to_ascii(str_chunk))
+
+
+def to_ascii(str_chunk: str) -> str:
+    """Drops the non-ASCII characters and lowercases the rest, the same characters as `get_ascii_chars`"""
+    return str_chunk.encode("ascii", errors="ignore").decode("ascii").lower()
+
+
+def tokens_to_text(ascii_chunk: str) -> str:
+    """Tokenizes text already passed through `to_ascii` and joins the tokens, see `clean_chunk`"""
+    tokens = [WHITESPACE_TOKENS[token] if token[0] in WHITESPACE_CHARS else token for token in TOKEN_PATTERN.findall(ascii_chunk)]
+    return ' '.join(filter(None, tokens))
+
+
+# a letter followed by anything else always ends a word token
+WORD_END_PATTERN = re.compile(r"[a-z](?=[^a-z])")
+# text held back by `StreamingCleaner` before it also cuts at word ends, in case a document has no whitespace at all
+MAX_CARRY_CHARS = 64 * 1024
+
+
+def last_safe_cut(ascii_text: str) -> int:
+    """
+    Args:
+        ascii_text: a str already passed through `to_ascii`
+
+    Returns:
+        int: the last position where a whitespace run ends and another token starts, cleaning the text on either
+            side of it separately gives the same tokens as cleaning it whole. 0 if there is none
+    """
+    end = len(ascii_text)
+    last_space = max(ascii_text.rfind(char, 0, end) for char in WHITESPACE_CHARS)
+    if last_space == end - 1:
+        # the text ends inside a whitespace run that may go on in the next chunk, cut before that run instead
+        end = len(ascii_text.rstrip("".join(WHITESPACE_CHARS)))
+        last_space = max(ascii_text.rfind(char, 0, end) for char in WHITESPACE_CHARS)
+    return last_space + 1
+
+
+class StreamingCleaner:
+    """
+    Cleans text that arrives in chunks, with the same output as `clean_chunk` on the joined chunks. The token left
+    open at the end of a chunk (a number, word or whitespace run that may continue) is carried over to the next one,
+    so only about one token is held in memory whatever the size of the document.
+
+    Example:
+        cleaner = StreamingCleaner()
+        for chunk in chunks:
+            out.write(cleaner.feed(chunk))
+        out.write(cleaner.finish())
+    """
+
+    def __init__(self):
+        self._carry = ""
+        self._emitted = False
+
+    def feed(self, str_chunk: str) -> str:
+        """
+        Args:
+            str_chunk: a str representing the next chunk of the text
+
+        Returns:
+            str: the cleaned text of every token completed so far, possibly ''
+        """
+        text = self._carry + to_ascii(str_chunk)
+        cut = last_safe_cut(text)
+        if cut == 0 and len(text) > MAX_CARRY_CHARS:
+            word_ends = [match.end() for match in WORD_END_PATTERN.finditer(text)]
+            cut = word_ends[-1] if word_ends else 0
+        if cut == 0:
+            self._carry = text
+            return ""
+        self._carry = text[cut:]
+        return self._emit(text[:cut])
+
+    def finish(self) -> str:
+        """
+        Returns:
+            str: the cleaned text of the tokens still held back, the cleaner can be reused for another text afterwards
+        """
+        cleaned = self._emit(self._carry)
+        self._carry = ""
+        self._emitted = False
+        return cleaned
+
+    def _emit(self, ascii_text: str) -> str:
+        cleaned = tokens_to_text(ascii_text)
+        if not cleaned:
+            return ""
+        if self._emitted:
+            cleaned = " " + cleaned
+        self._emitted = True
+        return cleaned
+
+
+def iter_clean_text(chunks: Iterable[str]) -> Iterator[str]:
+    """
+    Args:
+        chunks: the text in chunks of any size, e.g. the output of `iter_text`
+
+    Returns:
+        Iterator[str]: the cleaned text, joining it gives `clean_chunk` of the joined chunks
+    """
+    cleaner = StreamingCleaner()
+    for chunk in chunks:
+        cleaned = cleaner.feed(chunk)
+        if cleaned:
+            yield cleaned
+    cleaned = cleaner.finish()
+    if cleaned:
+        yield cleaned
+
+
+def iter_clean_elements(chunks: Iterable[str], separator: str = "\n\n") -> Iterator[str]:
+    """
+    Cleans every element of a text on its own and keeps the separators between them, so the cleaned text can still be
+    split into elements. Elements may span chunks and chunks may hold many elements.
+
+    Args:
+        chunks: the text in chunks of any size, e.g. the output of `iter_text`
+        separator: the str between two elements
+
+    Returns:
+        Iterator[str]: the cleaned text, joining it gives `separator.join(clean_chunk(element) for element in text.split(separator))`
+    """
+    cleaner = StreamingCleaner()
+    pending = ""
+    for chunk in chunks:
+        elements = (pending + chunk).split(separator)
+        for element in elements[:-1]:
+            yield cleaner.feed(element) + cleaner.finish() + separator
+        # the end of the chunk may be the start of a separator completed by the next chunk
+        last = elements[-1]
+        held = next((size for size in range(len(separator) - 1, 0, -1) if last.endswith(separator[:size])), 0)
+        pending = last[len(last) - held:] if held else ""
+        cleaned = cleaner.feed(last[:len(last) - held])
+        if cleaned:
+            yield cleaned
+    cleaned = cleaner.feed(pending) + cleaner.finish()
+    if cleaned:
+        yield cleaned
@@ -21,8 +21,107 @@ Notes:
         
 """
 
-import chromadb
-from chromadb import QueryResult
+from __future__ import annotations
+
+import json
+import time
+import hashlib
+from typing import TYPE_CHECKING, Any
+
+# chromadb is only needed for the type hints, the collections are created by the caller
+if TYPE_CHECKING:
+    import chromadb
+    from chromadb import QueryResult
+
+
+# metadata key holding the hash of a document's contents, see `database_upsert_batch`
+CONTENT_HASH_KEY = "content_hash"
+# metadata keys linking a chunk to the document it was split from, see `database_upsert_chunks`
+PARENT_ID_KEY = "parent_id"
+CHUNK_INDEX_KEY = "chunk_index"
+CHUNK_ID_SEPARATOR = "#"
+# all-MiniLM-L6-v2 truncates at 256 word pieces, roughly 1000 characters of field text
+DEFAULT_MAX_CHUNK_CHARS = 1000
+# chunk hits first fetched for every parent requested when collapsing query results to their parents, doubled until
+# enough distinct parents are found
+CHUNK_OVERSAMPLE = 4
+
+
+def content_hash(doc: str) -> str:
+    """
+    Args:
+        doc: the document to hash
+
+    Returns:
+        str: the SHA-256 hex digest of the document
+    """
+    return hashlib.sha256(doc.encode("utf-8")).hexdigest()
+
+
+def split_document(document: dict[str, Any], max_chunk_chars: int = DEFAULT_MAX_CHUNK_CHARS) -> list[str]:
+    """Splits a finalized JSON into groups of consecutive fields, each written as `field: value` lines of at most
+    `max_chunk_chars` characters (a single longer field is its own chunk). Empty fields are left out. Fields and nested
+    keys are sorted so the same document always gives the same chunks, whatever order its keys were sent in.
+
+    Args:
+        document: the finalized JSON as a dict
+        max_chunk_chars: the maximum amount of characters in a chunk
+
+    Returns:
+        list[str]: the text of each chunk, in field name order, never empty
+    """
+    chunks: list[str] = []
+    current: list[str] = []
+    current_chars = 0
+    for field, value in sorted(document.items()):
+        if value is None or value == "":
+            continue
+        if isinstance(value, (dict, list)):
+            value = json.dumps(value, sort_keys=True, ensure_ascii=False)
+        line = f"{field}: {value}"
+        if current and current_chars + len(line) + 1 > max_chunk_chars:
+            chunks.append("\n".join(current))
+            current, current_chars = [], 0
+        current.append(line)
+        current_chars += len(line) + 1
+    if current:
+        chunks.append("\n".join(current))
+    return chunks or [json.dumps(document, sort_keys=True, ensure_ascii=False)]
+
+
+def collapse_to_parents(query_result: QueryResult, results: int, offset: int = 0) -> dict[str, list]:
+    """Collapses the chunk hits of a query to the documents they were split from, each parent keeps the distance of its
+    closest chunk. Hits without a parent (documents stored whole) are their own parent.
+
+    Args:
+        query_result: the result of a chunk level query
+        results: the maximum amount of parents kept for each query text
+        offset: the amount of closest parents skipped for each query text
+
+    Returns:
+        dict[str, list]: the `ids`, `documents` (the matched chunks joined by new lines), `metadatas` and `distances` of the parents
+    """
+    collapsed: dict[str, list] = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+    for ids, documents, metadatas, distances in zip(query_result["ids"], query_result["documents"],
+                                                    query_result["metadatas"], query_result["distances"]):
+        parents: dict[str, dict[str, Any]] = {}
+        # hits are ordered by distance so the first hit of a parent is its closest chunk
+        for chunk_id, document, metadata, distance in zip(ids, documents, metadatas, distances):
+            metadata = dict(metadata or {})
+            parent_id = metadata.pop(PARENT_ID_KEY, chunk_id)
+            metadata.pop(CHUNK_INDEX_KEY, None)
+            metadata.pop(CONTENT_HASH_KEY, None)
+            if parent_id not in parents:
+                if len(parents) == offset + results:
+                    continue
+                parents[parent_id] = {"documents": [], "metadata": metadata, "distance": distance}
+            parents[parent_id]["documents"].append(document)
+        parents = dict(list(parents.items())[offset:])
+        collapsed["ids"].append(list(parents))
+        collapsed["documents"].append(["\n".join(parent["documents"]) for parent in parents.values()])
+        collapsed["metadatas"].append([parent["metadata"] for parent in parents.values()])
+        collapsed["distances"].append([parent["distance"] for parent in parents.values()])
+    return collapsed
 
 
 ####################
@@ -59,7 +158,126 @@ def database_add(collection: chromadb.Collection, *, doc_list: list[str], metada
         ids = id_list
     )
 
-def database_query(collection: chromadb.Collection, *, texts: list[str], results: int = 10, where_dict: dict[str, str] = None, where_docs_dict: dict[str, str] = None) -> QueryResult:
+def database_upsert_batch(collection: chromadb.Collection, *, doc_list: list[str], metadata_list: list[dict[str, str]], id_list: list[str],
+                          embedding_function: chromadb.EmbeddingFunction, max_batch_size: int) -> tuple[list[str], dict[str, float]]:
+    """Adds or updates the document(s) in the database, keyed by their id. A content hash of each document is stored
+    in its metadata under `content_hash` so that documents that did not change since they were last written are skipped
+    without being embedded again. The documents that did change are embedded in a single call to the embedding
+    function and written in as few upserts as possible.
+
+    Args:
+        collection: the collection to operate on
+        doc_list: The documents to be embedded and stored
+        metadata_list: The metadatas to be associated with each document
+        id_list: The unique specifiers to be associated with each document
+        embedding_function: the embedding function of the collection
+        max_batch_size: the maximum amount of documents in a single read or write, see `chromadb.Client.get_max_batch_size`
+
+    Returns:
+        tuple[list[str], dict[str, float]]: the ids that were added or updated, and the amount of seconds spent on the `compare`, `embed` and `write` phases
+
+    Example Arg Formatting:
+        see `database_add`
+        max_batch_size = 5461
+    """
+    start = time.perf_counter()
+    hashes = [content_hash(doc) for doc in doc_list]
+
+    # find the hashes of the documents already stored under the same ids
+    stored_hashes: dict[str, str] = {}
+    for batch_start in range(0, len(id_list), max_batch_size):
+        stored = collection.get(ids=id_list[batch_start:batch_start + max_batch_size], include=["metadatas"])
+        for stored_id, stored_metadata in zip(stored["ids"], stored["metadatas"]):
+            stored_hashes[stored_id] = (stored_metadata or {}).get(CONTENT_HASH_KEY)
+
+    changed = [i for i, (doc_id, doc_hash) in enumerate(zip(id_list, hashes)) if stored_hashes.get(doc_id) != doc_hash]
+    compared = time.perf_counter()
+    if not changed:
+        return [], {"compare": compared - start, "embed": 0.0, "write": 0.0}
+
+    changed_docs = [doc_list[i] for i in changed]
+    changed_ids = [id_list[i] for i in changed]
+    changed_metadatas = [{**metadata_list[i], CONTENT_HASH_KEY: hashes[i]} for i in changed]
+    embeddings = embedding_function(changed_docs)
+    embedded = time.perf_counter()
+
+    for batch_start in range(0, len(changed), max_batch_size):
+        batch_end = batch_start + max_batch_size
+        collection.upsert(
+            documents = changed_docs[batch_start:batch_end],
+            embeddings = embeddings[batch_start:batch_end],
+            metadatas = changed_metadatas[batch_start:batch_end],
+            ids = changed_ids[batch_start:batch_end]
+        )
+
+    return changed_ids, {"compare": compared - start, "embed": embedded - compared, "write": time.perf_counter() - embedded}
+
+def database_upsert_chunks(collection: chromadb.Collection, *, documents: dict[str, dict[str, Any]], metadata_list: list[dict[str, str]],
+                           embedding_function: chromadb.EmbeddingFunction, max_batch_size: int,
+                           max_chunk_chars: int = DEFAULT_MAX_CHUNK_CHARS) -> tuple[list[str], dict[str, float]]:
+    """Splits each finalized JSON into field group chunks (see `split_document`) and adds or updates the chunks in the
+    database with `database_upsert_batch`, so only new or changed chunks are embedded. Every chunk is stored under the
+    id `<document id>#<chunk index>` with the document's metadata along with `parent_id` and `chunk_index`. Chunks left
+    over from a longer earlier version of a document, and whole document entries written before chunking, are deleted.
+
+    Args:
+        collection: the collection to operate on
+        documents: the finalized JSON of each document, keyed by the document's id
+        metadata_list: The metadatas to be associated with each document, in the same order as `documents`
+        embedding_function: the embedding function of the collection
+        max_batch_size: the maximum amount of chunks in a single read or write, see `chromadb.Client.get_max_batch_size`
+        max_chunk_chars: the maximum amount of characters in a chunk
+
+    Returns:
+        tuple[list[str], dict[str, float]]: the ids of the documents that were added or updated, and the amount of seconds spent on the `compare`, `embed`, `write` and `cleanup` phases
+
+    Example Arg Formatting:
+        documents = {
+            "27183_om.pdf": {"address": "123 Test Street", "units": "120"},
+            "6432_mf.pdf": {"address": "86 Street NE", "units": "48"}
+        }
+        metadata_list = [{"finalized": "True"}, {"finalized": "True"}]
+    """
+    chunk_docs: list[str] = []
+    chunk_ids: list[str] = []
+    chunk_metadatas: list[dict[str, Any]] = []
+    for (doc_id, document), metadata in zip(documents.items(), metadata_list):
+        for chunk_index, chunk in enumerate(split_document(document, max_chunk_chars)):
+            chunk_docs.append(chunk)
+            chunk_ids.append(f"{doc_id}{CHUNK_ID_SEPARATOR}{chunk_index}")
+            chunk_metadatas.append({**metadata, PARENT_ID_KEY: doc_id, CHUNK_INDEX_KEY: chunk_index})
+
+    written_chunk_ids, timings = database_upsert_batch(collection,
+                                                       doc_list=chunk_docs,
+                                                       metadata_list=chunk_metadatas,
+                                                       id_list=chunk_ids,
+                                                       embedding_function=embedding_function,
+                                                       max_batch_size=max_batch_size)
+    written = {chunk_id.rsplit(CHUNK_ID_SEPARATOR, 1)[0] for chunk_id in written_chunk_ids}
+
+    # remove chunks that are no longer part of their document and whole document entries from before chunking
+    start = time.perf_counter()
+    doc_ids = list(documents)
+    current_chunk_ids = set(chunk_ids)
+    stale_ids: list[str] = []
+    for batch_start in range(0, len(doc_ids), max_batch_size):
+        batch = doc_ids[batch_start:batch_start + max_batch_size]
+        stored = collection.get(where={PARENT_ID_KEY: {"$in": batch}}, include=["metadatas"])
+        for chunk_id, metadata in zip(stored["ids"], stored["metadatas"]):
+            if chunk_id not in current_chunk_ids:
+                stale_ids.append(chunk_id)
+                written.add(metadata[PARENT_ID_KEY])
+        whole_ids = collection.get(ids=batch, include=[])["ids"]
+        stale_ids.extend(whole_ids)
+        written.update(whole_ids)
+    for batch_start in range(0, len(stale_ids), max_batch_size):
+        collection.delete(ids=stale_ids[batch_start:batch_start + max_batch_size])
+    timings["cleanup"] = time.perf_counter() - start
+
+    return [doc_id for doc_id in doc_ids if doc_id in written], timings
+
+def database_query(collection: chromadb.Collection, *, texts: list[str], results: int = 10, where_dict: dict[str, str] = None, where_docs_dict: dict[str, str] = None,
+                   embeddings: list[list[float]] = None, collapse_parents: bool = False, offset: int = 0) -> QueryResult:
     """Queries the database for the results amount of documents closest to the embedded query text(s)
 
     Args:
@@ -67,12 +285,18 @@ def database_query(collection: chromadb.Collection, *, texts: list[str], results
         texts: The queries to be embedded and searched with (can be just one str)
         results: number of results (documents) to return (default = 10)
         where_dict: optional dict to specify the presence of certain metadata assoicated with the document
-        where_docs_dict: optional dict to specify the presence of certain text in the document
+        where_docs_dict: optional dict to specify the presence of certain text in the document, matched against
+            each chunk on its own when collapse_parents is True
+        embeddings: optional already computed embeddings of the texts, the texts are not embedded again when given
+        collapse_parents: whether to collapse chunk hits to the documents they were split from, see `collapse_to_parents`
+        offset: the amount of closest parents skipped for each query text, only used when collapse_parents is True
 
     Returns:
         QueryResult: a dict like object with relevant keys such as:
             ids, embeddings, documents, uris, data, metadatas, distances, included
             values in the dict are lists of size = results
+            only ids, documents, metadatas and distances are present when collapse_parents is True, holding the
+            parents `offset` to `offset + results` of each query text
     
     Example Arg Formatting:
         texts = ["multifamily", "query2"]
@@ -80,12 +304,31 @@ def database_query(collection: chromadb.Collection, *, texts: list[str], results
         where_dict = {"metadata_field": "value"}
         where_docs_dict = {"$contains": "string"}
     """
-    return collection.query(
-        query_texts = texts,
-        n_results = results,
-        where = where_dict,
-        where_document = where_docs_dict
-    )
+    if not collapse_parents:
+        return collection.query(
+            query_texts = None if embeddings is not None else texts,
+            query_embeddings = embeddings,
+            n_results = results,
+            where = where_dict,
+            where_document = where_docs_dict
+        )
+
+    # several chunks of the same document can be among the closest hits, fetch more chunks until every query text has
+    # `offset + results` distinct parents or the collection has no more matching chunks
+    n_results = (offset + results) * CHUNK_OVERSAMPLE
+    while True:
+        query_result = collection.query(
+            query_texts = None if embeddings is not None else texts,
+            query_embeddings = embeddings,
+            n_results = n_results,
+            where = where_dict,
+            where_document = where_docs_dict
+        )
+        exhausted = all(len(ids) < n_results for ids in query_result["ids"])
+        collapsed = collapse_to_parents(query_result, offset + results)
+        if exhausted or all(len(ids) == offset + results for ids in collapsed["ids"]):
+            return collapse_to_parents(query_result, results, offset)
+        n_results *= 2
 
 def database_update(collection: chromadb.Collection, *, id_list: list[str], metadata_list: list[str] = None, document_list: list[str] = None) -> None:
     """Updates the documents and metadatas for each of the given ids
@@ -155,6 +398,7 @@ def database_delete_collection(chroma_client: chromadb.Client, collection_name:
     chroma_client.delete_collection(name = collection_name)
 
 def main():
+    import chromadb
     from . import settings
     
     # setup the chromadb client (persistent allows data to be stored on disk)
@@ -0,0 +1,299 @@
+"""
+Embedding providers for the database layer, with batched inference and a persistent vector cache
+
+Every provider is a chromadb embedding function, so it can be given to a collection as well as to the
+`database_*` methods. Texts are embedded in batches of `batch_size`, batches run on `threads` threads for providers
+that release the GIL (onnxruntime, network requests) while sentence-transformers hands the threads to torch.
+
+`CachedEmbeddingFunction` puts a SQLite cache of vectors in front of a provider, keyed by the hash of the model and
+the text, so rebuilding the collection from an unchanged corpus never runs the model again. Once the cache holds more
+than `max_entries` vectors the least recently used are evicted.
+
+Providers:
+    onnx: all-MiniLM-L6-v2 through onnxruntime, the chromadb default (384 dimensions)
+    sentence-transformers: any SentenceTransformers model, all-MiniLM-L6-v2 by default (384 dimensions)
+    openai: any OpenAI embedding model, text-embedding-3-small by default (1536 dimensions)
+
+Example:
+    embedding_function = create_embedding_function("onnx", batch_size=64, threads=2,
+                                                   cache_path="cache/embeddings.sqlite3")
+    vectors = embedding_function(["86 Street NE is a multifamily apartment building"])
+
+Dependencies:
+    1. chromadb
+        pip install chromadb
+    2. sentence-transformers (optional)
+        pip install sentence-transformers
+        - only needed for the sentence-transformers provider
+"""
+
+import os
+import abc
+import time
+import sqlite3
+import threading
+from typing import Any
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from chromadb import Documents, EmbeddingFunction, Embeddings
+from chromadb.utils import embedding_functions
+from caching.disk_cache import make_key
+from transformation.openai_client import get_client
+
+
+ONNX_PROVIDER = "onnx"
+SENTENCE_TRANSFORMERS_PROVIDER = "sentence-transformers"
+OPENAI_PROVIDER = "openai"
+
+DEFAULT_MODELS = {
+    ONNX_PROVIDER: "all-MiniLM-L6-v2",
+    SENTENCE_TRANSFORMERS_PROVIDER: "all-MiniLM-L6-v2",
+    OPENAI_PROVIDER: "text-embedding-3-small",
+}
+
+# SQLite limits the amount of parameters of a single statement
+CACHE_LOOKUP_BATCH_SIZE = 500
+# about 600MB of all-MiniLM-L6-v2 vectors (384 float32), 2.4GB of text-embedding-3-small vectors (1536 float32)
+DEFAULT_CACHE_MAX_ENTRIES = 400_000
+
+
+class EmbeddingProvider(EmbeddingFunction[Documents], abc.ABC):
+    """Base class of the providers, splits the texts into batches and embeds them on a pool of threads"""
+
+    def __init__(self, model: str, batch_size: int = 64, threads: int = 1):
+        """
+        Args:
+            model: the name of the embedding model
+            batch_size: the maximum amount of texts embedded by a single call to the model
+            threads: the amount of batches embedded at the same time
+        """
+        self.model = model
+        self.batch_size = max(1, batch_size)
+        self.threads = max(1, threads)
+
+    @property
+    def model_id(self) -> str:
+        """the provider and model, vectors of different model ids are never mixed in the cache"""
+        return f"{type(self).__name__}:{self.model}"
+
+    @abc.abstractmethod
+    def _embed_batch(self, texts: list[str]) -> list[np.ndarray]:
+        """
+        Args:
+            texts: at most `batch_size` texts
+
+        Returns:
+            list[np.ndarray]: the vector of each text, in the same order
+        """
+
+    def warm_up(self) -> None:
+        """Embeds a short text so the model is loaded before the first real request"""
+        self(["warm up"])
+
+    def __call__(self, input: Documents) -> Embeddings:
+        texts = list(input)
+        batches = [texts[start:start + self.batch_size] for start in range(0, len(texts), self.batch_size)]
+        if self.threads == 1 or len(batches) == 1:
+            results = [self._embed_batch(batch) for batch in batches]
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.threads, len(batches))) as executor:
+                results = list(executor.map(self._embed_batch, batches))
+        return [np.asarray(vector, dtype=np.float32) for batch in results for vector in batch]
+
+
+class OnnxEmbeddingProvider(EmbeddingProvider):
+    """all-MiniLM-L6-v2 through onnxruntime, the model is downloaded by chromadb on first use"""
+
+    def __init__(self, model: str = DEFAULT_MODELS[ONNX_PROVIDER], batch_size: int = 64, threads: int = 1):
+        if model != DEFAULT_MODELS[ONNX_PROVIDER]:
+            raise ValueError(f"The {ONNX_PROVIDER} provider only supports {DEFAULT_MODELS[ONNX_PROVIDER]}")
+        super().__init__(model, batch_size, threads)
+        self._function = embedding_functions.DefaultEmbeddingFunction()
+
+    def _embed_batch(self, texts: list[str]) -> list[np.ndarray]:
+        return list(self._function(texts))
+
+
+class SentenceTransformerEmbeddingProvider(EmbeddingProvider):
+    """Any SentenceTransformers model on the CPU, `threads` sets the amount of threads torch uses while the batches
+    are embedded one after the other, torch already spreads a batch over its threads"""
+
+    def __init__(self, model: str = DEFAULT_MODELS[SENTENCE_TRANSFORMERS_PROVIDER], batch_size: int = 64, threads: int = 1):
+        # only imported when used, sentence-transformers pulls in torch
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        super().__init__(model, batch_size, threads=1)
+        torch.set_num_threads(max(1, threads))
+        self._model = SentenceTransformer(model, device="cpu")
+
+    def _embed_batch(self, texts: list[str]) -> list[np.ndarray]:
+        return list(self._model.encode(texts, batch_size=self.batch_size, convert_to_numpy=True,
+                                       normalize_embeddings=True))
+
+
+class OpenAIEmbeddingProvider(EmbeddingProvider):
+    """Any OpenAI embedding model, batches are sent as concurrent requests over the shared client"""
+
+    def __init__(self, api: str, model: str = DEFAULT_MODELS[OPENAI_PROVIDER], batch_size: int = 256, threads: int = 4):
+        """
+        Args:
+            api: a str representing the OpenAI API Key
+            model: the name of the embedding model
+            batch_size: the maximum amount of texts in a single request, at most 2048
+            threads: the amount of requests sent at the same time
+        """
+        if not api:
+            raise ValueError(f"The {OPENAI_PROVIDER} provider needs an OpenAI API Key")
+        super().__init__(model, min(batch_size, 2048), threads)
+        self._api = api
+
+    def _embed_batch(self, texts: list[str]) -> list[np.ndarray]:
+        response = get_client(self._api).embeddings.create(model=self.model, input=texts)
+        return [np.asarray(item.embedding, dtype=np.float32) for item in sorted(response.data, key=lambda item: item.index)]
+
+
+class EmbeddingCache:
+    """Thread-safe SQLite LRU store of vectors keyed by a str with hit and miss counters, see `CachedEmbeddingFunction`"""
+
+    def __init__(self, path: str, max_entries: int = DEFAULT_CACHE_MAX_ENTRIES):
+        """
+        Args:
+            path: a str representing the path to the SQLite database file, created if missing
+            max_entries: the maximum amount of stored vectors before the least recently used are evicted
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode = WAL")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+        # caches written before eviction have no `used_at`, their vectors count as the least recently used
+        columns = [row[1] for row in self._connection.execute("PRAGMA table_info(embeddings)")]
+        if "used_at" not in columns:
+            self._connection.execute("ALTER TABLE embeddings ADD COLUMN used_at REAL NOT NULL DEFAULT 0")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS embeddings_used_at ON embeddings (used_at)")
+        self._connection.commit()
+        self._entries = self._connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def get_many(self, keys: list[str]) -> dict[str, np.ndarray]:
+        """
+        Args:
+            keys: the keys of the vectors
+
+        Returns:
+            dict[str, np.ndarray]: the cached vector of each key, missing keys are left out
+        """
+        found: dict[str, np.ndarray] = {}
+        with self._lock:
+            for start in range(0, len(keys), CACHE_LOOKUP_BATCH_SIZE):
+                batch = keys[start:start + CACHE_LOOKUP_BATCH_SIZE]
+                placeholders = ", ".join("?" for _ in batch)
+                rows = self._connection.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch).fetchall()
+                found.update((key, np.frombuffer(vector, dtype=np.float32)) for key, vector in rows)
+            if found:
+                with self._connection:
+                    now = time.time()
+                    self._connection.executemany("UPDATE embeddings SET used_at = ? WHERE key = ?",
+                                                 [(now, key) for key in found])
+            self.hits += len(found)
+            self.misses += len(set(keys)) - len(found)
+        return found
+
+    def put_many(self, vectors: dict[str, np.ndarray]) -> None:
+        """
+        Args:
+            vectors: the vectors to be stored, keyed by their key
+        """
+        now = time.time()
+        rows = [(key, np.asarray(vector, dtype=np.float32).tobytes(), now) for key, vector in vectors.items()]
+        with self._lock, self._connection:
+            self._connection.executemany("INSERT OR REPLACE INTO embeddings (key, vector, used_at) VALUES (?, ?, ?)", rows)
+            self._entries = self._connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            excess = self._entries - self.max_entries
+            if excess > 0:
+                self._connection.execute(
+                    "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY used_at LIMIT ?)", (excess,))
+                self._entries -= excess
+                self.evictions += excess
+
+    def stats(self) -> dict[str, int]:
+        """
+        Returns:
+            dict[str, int]: the hit, miss and eviction counters along with the amount of stored vectors
+        """
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions, "entries": self._entries}
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+
+class CachedEmbeddingFunction(EmbeddingFunction[Documents]):
+    """Embeds only the texts whose vector is not cached yet, each distinct text is embedded once per call"""
+
+    def __init__(self, provider: EmbeddingProvider, cache: EmbeddingCache):
+        """
+        Args:
+            provider: the provider embedding the texts missing from the cache
+            cache: the persistent cache of vectors
+        """
+        self.provider = provider
+        self.cache = cache
+
+    def warm_up(self) -> None:
+        """Loads the provider's model, bypassing the cache"""
+        self.provider.warm_up()
+
+    def __call__(self, input: Documents) -> Embeddings:
+        texts = list(input)
+        keys = [make_key(self.provider.model_id, text) for text in texts]
+        vectors = self.cache.get_many(keys)
+        missing = {key: text for key, text in zip(keys, texts) if key not in vectors}
+        if missing:
+            new_vectors = dict(zip(missing, self.provider(list(missing.values()))))
+            self.cache.put_many(new_vectors)
+            vectors.update(new_vectors)
+        return [vectors[key] for key in keys]
+
+
+def create_embedding_function(provider: str, *, model: str | None = None, batch_size: int = 64, threads: int = 1,
+                              api: str | None = None, cache_path: str | None = None,
+                              cache_max_entries: int = DEFAULT_CACHE_MAX_ENTRIES) -> EmbeddingFunction:
+    """
+    Args:
+        provider: one of `onnx`, `sentence-transformers` or `openai`
+        model: optional name of the embedding model, the provider's default model if None
+        batch_size: the maximum amount of texts embedded by a single call to the model
+        threads: the amount of threads used to embed, see the providers
+        api: a str representing the OpenAI API Key, only used by the openai provider
+        cache_path: optional path to the SQLite vector cache, vectors are not cached if None
+        cache_max_entries: the maximum amount of cached vectors before the least recently used are evicted
+
+    Returns:
+        EmbeddingFunction: the embedding function, wrapped in a `CachedEmbeddingFunction` if a cache path is given
+
+    Raises:
+        ValueError: if the provider is unknown or cannot be used with the given arguments
+    """
+    if provider not in DEFAULT_MODELS:
+        raise ValueError(f"Unknown embedding provider {provider}, expected one of {', '.join(DEFAULT_MODELS)}")
+    options: dict[str, Any] = {"model": model or DEFAULT_MODELS[provider], "batch_size": batch_size, "threads": threads}
+    if provider == ONNX_PROVIDER:
+        embedding_provider: EmbeddingProvider = OnnxEmbeddingProvider(**options)
+    elif provider == SENTENCE_TRANSFORMERS_PROVIDER:
+        embedding_provider = SentenceTransformerEmbeddingProvider(**options)
+    else:
+        embedding_provider = OpenAIEmbeddingProvider(api, **options)
+
+    if cache_path is None:
+        return embedding_provider
+    return CachedEmbeddingFunction(embedding_provider, EmbeddingCache(cache_path, max_entries=cache_max_entries))
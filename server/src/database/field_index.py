@@ -0,0 +1,220 @@
+"""
+SQLite secondary index over the fields of the finalized JSONs for exact, prefix and numeric range queries
+
+Chroma only finds documents by vector similarity over the whole serialized JSON, which cannot answer questions such
+as "units between 100 and 200 in TX". Every finalized JSON is therefore also split into one row per field, holding
+the normalized text of the value and, when the whole value reads as a number ("$1,250,000", "5.25%", "1.2M", "$5 million"),
+its numeric value. Values that only start with a number, such as "20 Main St", have no numeric value. Field names are matched case-insensitively.
+
+Example filters:
+    [
+        {"field": "units", "min": 100, "max": 200},
+        {"field": "state", "equals": "TX"},
+        {"field": "address", "prefix": "123 main"}
+    ]
+
+Dependencies:
+    1. sqlite3 (part of the python standard library)
+"""
+
+import re
+import json
+import time
+import sqlite3
+import threading
+from typing import Any, Iterator
+
+
+# a value that is a number as a whole, such as `$1,250,000`, `5.25%`, `1.2M` or `$5 million`, commas must group thousands
+NUMBER_PATTERN = re.compile(r"^\s*[$€£]?\s*(-?(?:\d{1,3}(?:,\d{3})+|\d+)(?:\.\d+)?|-?\.\d+)\s*"
+                            r"(k|m|mm|b|bn|thousand|million|billion|%)?\s*$", re.IGNORECASE)
+NUMBER_SUFFIXES = {"k": 1e3, "m": 1e6, "mm": 1e6, "b": 1e9, "bn": 1e9, "thousand": 1e3, "million": 1e6, "billion": 1e9}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    doc_id TEXT PRIMARY KEY,
+    document TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS fields (
+    doc_id TEXT NOT NULL REFERENCES documents(doc_id) ON DELETE CASCADE,
+    field TEXT NOT NULL,
+    value_text TEXT,
+    value_num REAL,
+    PRIMARY KEY (doc_id, field)
+);
+CREATE INDEX IF NOT EXISTS fields_text ON fields (field, value_text);
+CREATE INDEX IF NOT EXISTS fields_num ON fields (field, value_num);
+"""
+
+
+def normalize_field(field: str) -> str:
+    """
+    Args:
+        field: the name of a field
+
+    Returns:
+        str: the lowercase name with spaces and dashes turned into underscores, `Cap Rate` and `cap_rate` are the same field
+    """
+    return re.sub(r"[\s\-]+", "_", field.strip().lower())
+
+
+def normalize_text(value: Any) -> str | None:
+    """
+    Args:
+        value: the value of a field
+
+    Returns:
+        str | None: the lowercase value with collapsed whitespace, nested values as JSON, None if the value is None
+    """
+    if value is None:
+        return None
+    if isinstance(value, (dict, list)):
+        value = json.dumps(value, sort_keys=True)
+    return " ".join(str(value).lower().split())
+
+
+def parse_number(value: Any) -> float | None:
+    """
+    Args:
+        value: the value of a field
+
+    Returns:
+        float | None: the numeric value of the field with its magnitude suffix applied, None if the value is not a number as a whole
+    """
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if not isinstance(value, str):
+        return None
+    match = NUMBER_PATTERN.match(value)
+    if not match:
+        return None
+    number = float(match.group(1).replace(",", ""))
+    suffix = (match.group(2) or "").lower()
+    return number * NUMBER_SUFFIXES.get(suffix, 1)
+
+
+class FieldIndex:
+    """Thread-safe SQLite index of the fields of the finalized JSONs"""
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: a str representing the path to the SQLite database file, created if missing
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA foreign_keys = ON")
+        self._connection.execute("PRAGMA journal_mode = WAL")
+        self._connection.executescript(SCHEMA)
+
+    def upsert_documents(self, documents: dict[str, dict[str, Any]]) -> None:
+        """
+        Adds or replaces the given documents and all of their fields in a single transaction
+
+        Args:
+            documents: the finalized JSON of each document, keyed by the document's id
+        """
+        now = time.time()
+        document_rows = [(doc_id, json.dumps(document, ensure_ascii=False), now) for doc_id, document in documents.items()]
+        field_rows = [(doc_id, normalize_field(field), normalize_text(value), parse_number(value))
+                      for doc_id, document in documents.items() for field, value in document.items()]
+        with self._lock, self._connection:
+            self._connection.executemany("DELETE FROM documents WHERE doc_id = ?", [(doc_id,) for doc_id in documents])
+            self._connection.executemany("INSERT INTO documents VALUES (?, ?, ?)", document_rows)
+            self._connection.executemany("INSERT OR REPLACE INTO fields VALUES (?, ?, ?, ?)", field_rows)
+
+    def query(self, filters: list[dict[str, Any]], limit: int = 100, offset: int = 0) -> tuple[list[dict[str, Any]], int]:
+        """
+        Finds the documents matching every filter. Each filter holds a `field` along with either `equals` (exact
+        match, case-insensitive), `prefix` (text prefix, case-insensitive), or `min` and/or `max` (inclusive numeric
+        range).
+
+        Args:
+            filters: the filters a document must all match, every document matches if empty
+            limit: the maximum amount of documents returned
+            offset: the amount of matching documents to skip
+
+        Returns:
+            tuple[list[dict[str, Any]], int]: the `id` and `document` of each matching document ordered by id, and the total amount of matching documents
+
+        Raises:
+            ValueError: if a filter is not properly formatted
+        """
+        clauses = []
+        params: list[Any] = []
+        for condition in filters:
+            clause, clause_params = self._filter_clause(condition)
+            clauses.append(f"doc_id IN (SELECT doc_id FROM fields WHERE {clause})")
+            params.extend(clause_params)
+        where = " AND ".join(clauses) or "1"
+
+        with self._lock:
+            total = self._connection.execute(f"SELECT COUNT(*) FROM documents WHERE {where}", params).fetchone()[0]
+            rows = self._connection.execute(
+                f"SELECT doc_id, document FROM documents WHERE {where} ORDER BY doc_id LIMIT ? OFFSET ?",
+                [*params, limit, offset]).fetchall()
+        return [{"id": doc_id, "document": json.loads(document)} for doc_id, document in rows], total
+
+    @staticmethod
+    def _filter_clause(condition: dict[str, Any]) -> tuple[str, list[Any]]:
+        if not isinstance(condition, dict) or not isinstance(condition.get("field"), str):
+            raise ValueError("Every filter needs a `field`")
+        field = normalize_field(condition["field"])
+
+        if "equals" in condition:
+            return "field = ? AND value_text = ?", [field, normalize_text(condition["equals"])]
+        if "prefix" in condition:
+            prefix = normalize_text(condition["prefix"]) or ""
+            escaped = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            return "field = ? AND value_text LIKE ? ESCAPE '\\'", [field, escaped + "%"]
+        if "min" in condition or "max" in condition:
+            clause, params = "field = ? AND value_num IS NOT NULL", [field]
+            for key, operator in (("min", ">="), ("max", "<=")):
+                if key in condition:
+                    bound = parse_number(condition[key])
+                    if bound is None:
+                        raise ValueError(f"`{key}` of {condition['field']} is not a number")
+                    clause += f" AND value_num {operator} ?"
+                    params.append(bound)
+            return clause, params
+        raise ValueError(f"Filter on {condition['field']} needs one of `equals`, `prefix`, `min` or `max`")
+
+    def get_documents(self, doc_ids: list[str]) -> dict[str, dict[str, Any]]:
+        """
+        Args:
+            doc_ids: the ids of the documents
+
+        Returns:
+            dict[str, dict[str, Any]]: the finalized JSON of each indexed document, ids that are not indexed are left out
+        """
+        if not doc_ids:
+            return {}
+        placeholders = ", ".join("?" for _ in doc_ids)
+        with self._lock:
+            rows = self._connection.execute(
+                f"SELECT doc_id, document FROM documents WHERE doc_id IN ({placeholders})", doc_ids).fetchall()
+        return {doc_id: json.loads(document) for doc_id, document in rows}
+
+    def export(self) -> Iterator[dict[str, Any]]:
+        """
+        Returns:
+            Iterator[dict[str, Any]]: the `id` and `document` of every indexed document ordered by id, read lazily
+        """
+        last_id = ""
+        while True:
+            with self._lock:
+                rows = self._connection.execute(
+                    "SELECT doc_id, document FROM documents WHERE doc_id > ? ORDER BY doc_id LIMIT 500", (last_id,)).fetchall()
+            if not rows:
+                return
+            for doc_id, document in rows:
+                yield {"id": doc_id, "document": json.loads(document)}
+            last_id = rows[-1][0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
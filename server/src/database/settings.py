@@ -3,8 +3,8 @@ Settings file for testing database_handler, it should not have an impact on serv
 """
 
 import os
-from chromadb.utils import embedding_functions
 from dotenv import load_dotenv
+from .embeddings import create_embedding_function
 
 load_dotenv()
 
@@ -14,16 +14,13 @@ if not openai_api_key:
 
 # SETUP EMBEDDING FUNCTIONS #
 # these items should NOT be used in other scripts directly
-# uses SentenceTransformers all-MiniLM-L6-v2 model
-default_embedding = embedding_functions.DefaultEmbeddingFunction() 
-openai_embedding = embedding_functions.OpenAIEmbeddingFunction(
-    api_key = openai_api_key,
-    model_name = "text-embedding-3-small" # default is text-embedding-ada-002
-)
+# one of `onnx` (SentenceTransformers all-MiniLM-L6-v2 model), `sentence-transformers` or `openai`
+embedding_provider = os.getenv("EMBEDDING_PROVIDER", "openai")
+embedding_model = os.getenv("EMBEDDING_MODEL") # the provider's default if not set, text-embedding-3-small for openai
 
 # CONFIGURATION #
 # these items can be used directly in other scripts
 # name of collection in the database
 PATH_TO_DATA = "./db"
 MAIN_COLLECTION_NAME = "extracted_json"
-EMBEDDING_FUNCTION = openai_embedding
+EMBEDDING_FUNCTION = create_embedding_function(embedding_provider, model=embedding_model, api=openai_api_key)
@@ -0,0 +1,216 @@
+"""
+Durable job store and worker pool used by the server to process uploads in the background
+
+Each job is persisted as its own JSON file inside the job folder so that the status and result of a job survive
+a server restart. Jobs that were still queued or running when the server stopped are handed back through
+`JobStore.unfinished_jobs` so they can be resubmitted. Finished jobs are removed from memory and disk once they are
+older than the store's `retention_seconds`.
+
+Job record format:
+    {
+        "job_id": "uuid",
+        "status": "queued" | "running" | "done" | "failed",
+        "filename": "original_name.pdf",
+        "doc_type": "om",
+        "file_path": "uploads/uuid_original_name.pdf",
+        "created_at": 1700000000.0,
+        "updated_at": 1700000000.0,
+        "status_code": 200,
+        "result": { ... }
+    }
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from typing import Any, Callable
+from concurrent.futures import ThreadPoolExecutor, Future
+from observability.metrics import track_queue
+
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+# finished jobs are kept for a week by default
+DEFAULT_RETENTION_SECONDS = 7 * 24 * 60 * 60
+
+JobRecord = dict[str, Any]
+JobFunction = Callable[..., tuple[dict, int]]
+
+
+class JobStore:
+    """Thread-safe job store that keeps every job record in memory and mirrors it to one JSON file per job"""
+
+    def __init__(self, folder: str, retention_seconds: float | None = DEFAULT_RETENTION_SECONDS):
+        """
+        Args:
+            folder: a str representing the directory the job files are written to
+            retention_seconds: the amount of seconds a finished job is kept after it finished, kept forever if None
+        """
+        self.folder = folder
+        self.retention_seconds = retention_seconds
+        self._lock = threading.Lock()
+        self._jobs: dict[str, JobRecord] = {}
+        os.makedirs(folder, exist_ok=True)
+        self._load()
+        with self._lock:
+            self._prune()
+
+    def _job_path(self, job_id: str) -> str:
+        return os.path.join(self.folder, f"{job_id}.json")
+
+    def _load(self) -> None:
+        """Reads every job file found in the job folder into memory, skipping unreadable ones"""
+        for name in os.listdir(self.folder):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.folder, name), "r", encoding="utf-8") as f:
+                    job = json.load(f)
+                self._jobs[job["job_id"]] = job
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning("Skipping unreadable job file", extra={"file": name, "error": str(e)})
+
+    def _prune(self) -> None:
+        """Removes the finished jobs older than `retention_seconds`, must be called with the lock held"""
+        if self.retention_seconds is None:
+            return
+        cutoff = time.time() - self.retention_seconds
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job["status"] in (JOB_DONE, JOB_FAILED) and job.get("updated_at", 0) < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+            try:
+                os.remove(self._job_path(job_id))
+            except FileNotFoundError:
+                pass
+
+    def _write(self, job: JobRecord) -> None:
+        """Writes the job to disk atomically so a crash never leaves a half written job file"""
+        path = self._job_path(job["job_id"])
+        tmp_path = path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(job, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except BaseException:
+            # the previous version of the job file is left as it was
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def create(self, job_id: str, **fields: Any) -> JobRecord:
+        """
+        Creates a new queued job and persists it
+
+        Args:
+            job_id: a str representing the job's id
+            fields: any extra fields to store with the job (filename, doc_type, file_path, ...)
+
+        Returns:
+            JobRecord: a copy of the created job
+        """
+        now = time.time()
+        job = {"job_id": job_id, "status": JOB_QUEUED, "created_at": now, "updated_at": now,
+               "status_code": None, "result": None, **fields}
+        with self._lock:
+            self._write(job)
+            self._jobs[job_id] = job
+            return dict(job)
+
+    def update(self, job_id: str, **fields: Any) -> JobRecord:
+        """
+        Updates the given fields of an existing job and persists it
+
+        Args:
+            job_id: a str representing the job's id
+            fields: the fields to overwrite
+
+        Returns:
+            JobRecord: a copy of the updated job
+        """
+        with self._lock:
+            # only kept in memory once it is on disk
+            job = {**self._jobs[job_id], **fields, "updated_at": time.time()}
+            self._write(job)
+            self._jobs[job_id] = job
+            if job["status"] in (JOB_DONE, JOB_FAILED):
+                self._prune()
+            return dict(job)
+
+    def get(self, job_id: str) -> JobRecord | None:
+        """
+        Args:
+            job_id: a str representing the job's id
+
+        Returns:
+            JobRecord | None: a copy of the job or None if no job has the given id
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def unfinished_jobs(self) -> list[JobRecord]:
+        """
+        Returns:
+            list[JobRecord]: copies of every job that is still queued or running, oldest first
+        """
+        with self._lock:
+            jobs = [dict(job) for job in self._jobs.values() if job["status"] in (JOB_QUEUED, JOB_RUNNING)]
+        return sorted(jobs, key=lambda job: job["created_at"])
+
+
+class JobQueue:
+    """Runs jobs on a thread pool and records their progress and result in a `JobStore`"""
+
+    def __init__(self, store: JobStore, max_workers: int):
+        """
+        Args:
+            store: the store that job status and results are written to
+            max_workers: the maximum amount of jobs that run at the same time
+        """
+        self.store = store
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job-worker")
+
+    def submit(self, job_id: str, func: JobFunction, *args: Any) -> Future:
+        """
+        Schedules `func(*args)` to run for the given job. `func` must return a tuple of (data, status code),
+        the job is marked done when the status code is 200 and failed otherwise.
+
+        Args:
+            job_id: a str representing the id of an already created job
+            func: the function that processes the job
+            args: the arguments passed to `func`
+
+        Returns:
+            Future: the future of the scheduled job
+        """
+        future = self._executor.submit(self._run, job_id, func, *args)
+        track_queue(future, "jobs")
+        return future
+
+    def _run(self, job_id: str, func: JobFunction, *args: Any) -> None:
+        self.store.update(job_id, status=JOB_RUNNING)
+        try:
+            data, status = func(*args)
+        except Exception as e:
+            data, status = {"error": f"Job {job_id} failed: {str(e)}"}, 500
+        try:
+            self.store.update(job_id, status=JOB_DONE if status == 200 else JOB_FAILED, status_code=status, result=data)
+        except Exception as e:
+            # a job left `running` on disk would be resumed on every restart
+            logger.exception("Could not save the result of a job", extra={"job_id": job_id})
+            try:
+                self.store.update(job_id, status=JOB_FAILED, status_code=500,
+                                  result={"error": f"Job {job_id} failed to save its result: {str(e)}"})
+            except Exception:
+                logger.exception("Could not mark a job as failed", extra={"job_id": job_id})
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,85 @@
+"""
+Leveled logging for the server and its worker processes, as readable text lines or as one JSON object per line
+
+Modules log through `logging.getLogger(__name__)` and pass the values worth searching for as `extra` fields, which
+both formats keep apart from the message:
+    logger.info("Extracted text", extra={"uuid": uuid, "chars": len(text)})
+
+text: 2024-05-01 12:00:00,000 INFO server: Extracted text uuid=1234 chars=5120
+json: {"time": "2024-05-01T12:00:00.000Z", "level": "INFO", "logger": "server", "message": "Extracted text", "uuid": "1234", "chars": 5120}
+
+Configured through the environment:
+    LOG_LEVEL: DEBUG, INFO (default), WARNING or ERROR
+    LOG_FORMAT: text (default) or json
+"""
+
+import os
+import json
+import time
+import logging
+
+
+# attributes every LogRecord has, everything else on a record came from `extra`
+RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord("", logging.INFO, "", 0, "", None, None))) | {"message", "asctime"}
+
+
+def record_fields(record: logging.LogRecord) -> dict:
+    return {key: value for key, value in vars(record).items() if key not in RECORD_ATTRIBUTES}
+
+
+class TextFormatter(logging.Formatter):
+    """Time, level, logger and message followed by the extra fields as key=value pairs"""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = record_fields(record)
+        if not fields:
+            return line
+        pairs = " ".join(f"{key}={json.dumps(value, default=str) if isinstance(value, str) and ' ' in value else value}"
+                         for key, value in fields.items())
+        # keep the traceback added by the base class below the fields
+        message, _, traceback = line.partition("\n")
+        return f"{message} {pairs}" + (f"\n{traceback}" if traceback else "")
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record holding the time, level, logger, message, extra fields and exception"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            **record_fields(record),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class ConfiguredHandler(logging.StreamHandler):
+    """The handler added by `configure_logging`, replaced when it is called again"""
+
+
+def configure_logging(level: str | None = None, format: str | None = None) -> None:
+    """
+    Sends the records of every logger to stderr in the given format, handlers added by anything else are kept
+
+    Args:
+        level: the minimum level of the records, `LOG_LEVEL` or INFO if None
+        format: `text` or `json`, `LOG_FORMAT` or text if None
+    """
+    level = (level or os.getenv("LOG_LEVEL", "INFO")).upper()
+    format = (format or os.getenv("LOG_FORMAT", "text")).lower()
+
+    handler = ConfiguredHandler()
+    handler.setFormatter(JsonFormatter() if format == "json" else TextFormatter())
+    root = logging.getLogger()
+    for existing in [existing for existing in root.handlers if isinstance(existing, ConfiguredHandler)]:
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level)
@@ -0,0 +1,267 @@
+"""
+Counters, gauges and histograms with labels, rendered in the Prometheus text exposition format for `/metrics`
+
+A metric is created once at module level and updated from any thread:
+    ERRORS.inc(stage="extraction")
+    with STAGE_SECONDS.time(stage="extraction"):
+        ...
+
+Values that another object already counts (e.g. the hits of a cache) are read when the metrics are rendered
+instead of being copied on every update, through `set_function`. The pipeline metrics shared by the server and the
+modules it calls are defined at the bottom of this module.
+
+Stages used as the `stage` label:
+    extraction: partitioning a PDF into text, cache hits included
+    llm_request: a single OpenAI request, cached responses are not requests
+    transformation: turning extracted text into a draft (relevance filter, chunked requests and merging)
+    post_processing: parsing, cleaning and saving the draft JSON
+    database_write: writing finalized JSONs to Chroma and the field index
+    upload: handling an `/upload` request
+"""
+
+import abc
+import math
+import time
+import threading
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+
+# from 5ms up to 5 minutes, extraction of a long PDF with hi_res takes minutes while a cached response takes ms
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+LabelValues = tuple[str, ...]
+
+
+def format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def format_labels(label_names: tuple[str, ...], label_values: LabelValues, extra: str = "") -> str:
+    escaped = [value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n") for value in label_values]
+    pairs = [f'{name}="{value}"' for name, value in zip(label_names, escaped)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric(abc.ABC):
+    """Base class of the metrics, holds the values of every combination of label values"""
+
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = (), registry: "Registry | None" = None):
+        """
+        Args:
+            name: the name of the metric, counters should end with `_total`
+            documentation: the help text of the metric
+            labels: the names of the labels, every update gives a value for each of them
+            registry: the registry the metric is rendered by, `REGISTRY` if None
+        """
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+        self._functions: dict[LabelValues, Callable[[], float]] = {}
+        (registry or REGISTRY).register(self)
+
+    def _label_values(self, labels: dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"{self.name} expects the labels {', '.join(self.label_names) or 'none'}, got {', '.join(labels) or 'none'}")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def set_function(self, func: Callable[[], float], **labels: str) -> None:
+        """Reads the value of the given labels from `func` whenever the metrics are rendered"""
+        label_values = self._label_values(labels)
+        with self._lock:
+            self._functions[label_values] = func
+
+    def _function_samples(self) -> list[tuple[str, LabelValues, float]]:
+        with self._lock:
+            functions = list(self._functions.items())
+        samples = []
+        for label_values, func in functions:
+            try:
+                samples.append(("", label_values, float(func())))
+            except Exception:
+                # a value that cannot be read right now is left out of this scrape
+                continue
+        return samples
+
+    @abc.abstractmethod
+    def samples(self) -> list[tuple[str, LabelValues, float]]:
+        """
+        Returns:
+            list[tuple[str, LabelValues, float]]: the suffix of the name, the label values and the value of each sample
+        """
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for suffix, label_values, value in self.samples():
+            label_names = self.label_names
+            extra = ""
+            if suffix == "_bucket":
+                # the last label value of a bucket is its upper bound
+                extra = f'le="{label_values[-1]}"'
+                label_values = label_values[:-1]
+            lines.append(f"{self.name}{suffix}{format_labels(label_names, label_values, extra)} {format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    """Value that only goes up, e.g. the amount of processed pages"""
+
+    type = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        if amount < 0:
+            raise ValueError(f"{self.name} can only be increased")
+        label_values = self._label_values(labels)
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        with self._lock:
+            return self._values.get(self._label_values(labels), 0.0)
+
+    def samples(self) -> list[tuple[str, LabelValues, float]]:
+        with self._lock:
+            samples = [("", label_values, value) for label_values, value in self._values.items()]
+        return samples + self._function_samples()
+
+
+class Gauge(Counter):
+    """Value that goes up and down, e.g. the amount of tasks waiting on a pool"""
+
+    type = "gauge"
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        label_values = self._label_values(labels)
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: str) -> None:
+        label_values = self._label_values(labels)
+        with self._lock:
+            self._values[label_values] = value
+
+
+class Histogram(Metric):
+    """Distribution of observed values over cumulative buckets, e.g. the seconds spent in a stage"""
+
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = DEFAULT_BUCKETS, registry: "Registry | None" = None):
+        """
+        Args:
+            name: the name of the metric
+            documentation: the help text of the metric
+            labels: the names of the labels
+            buckets: the upper bounds of the buckets, `+Inf` is always added
+            registry: the registry the metric is rendered by, `REGISTRY` if None
+        """
+        super().__init__(name, documentation, labels, registry)
+        self.buckets = tuple(sorted(buckets))
+        # bucket counts (not cumulative), sum and count of each combination of label values
+        self._values: dict[LabelValues, tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        label_values = self._label_values(labels)
+        with self._lock:
+            counts, total = self._values.setdefault(label_values, ([0] * (len(self.buckets) + 1), [0.0]))
+            index = next((index for index, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+            counts[index] += 1
+            total[0] += value
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """Observes the seconds spent in the block, also when it raises"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self) -> list[tuple[str, LabelValues, float]]:
+        samples = []
+        with self._lock:
+            for label_values, (counts, total) in self._values.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets + (math.inf,), counts):
+                    cumulative += count
+                    samples.append(("_bucket", label_values + (format_value(bound),), cumulative))
+                samples.append(("_sum", label_values, total[0]))
+                samples.append(("_count", label_values, cumulative))
+        return samples
+
+
+class Registry:
+    """The metrics rendered together by `/metrics`"""
+
+    def __init__(self):
+        self._metrics: dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric) -> None:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"A metric named {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+
+    def render(self) -> str:
+        """
+        Returns:
+            str: every metric in the Prometheus text exposition format (version 0.0.4)
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+REGISTRY = Registry()
+
+
+# metrics of the pipeline, see the stages above
+STAGE_SECONDS = Histogram("pdf_parser_stage_seconds", "Seconds spent in each stage of the pipeline", ("stage",))
+ERRORS = Counter("pdf_parser_errors_total", "Errors by the stage they happened in", ("stage",))
+PAGES_PROCESSED = Counter("pdf_parser_pages_processed_total", "PDF pages partitioned into text, cache hits excluded")
+LLM_TOKENS = Counter("pdf_parser_llm_tokens_total", "Tokens used by OpenAI requests, by kind (prompt or completion)",
+                     ("kind",))
+RELEVANCE_FILTER_TOKENS = Counter("pdf_parser_relevance_filter_tokens_total",
+                                  "Tokens of extracted text given to the relevance filter (input) and dropped by it (dropped)",
+                                  ("kind",))
+CACHE_HITS = Counter("pdf_parser_cache_hits_total", "Hits of each cache", ("cache",))
+CACHE_MISSES = Counter("pdf_parser_cache_misses_total", "Misses of each cache", ("cache",))
+QUEUE_DEPTH = Gauge("pdf_parser_queue_depth", "Tasks submitted to each pool that did not finish yet", ("pool",))
+
+
+def record_llm_request(seconds: float, usage) -> None:
+    """
+    Records an OpenAI request that got a response
+
+    Args:
+        seconds: the seconds the request took
+        usage: the `usage` of the completion, may be None
+    """
+    STAGE_SECONDS.observe(seconds, stage="llm_request")
+    if usage is not None:
+        LLM_TOKENS.inc(usage.prompt_tokens or 0, kind="prompt")
+        LLM_TOKENS.inc(usage.completion_tokens or 0, kind="completion")
+
+
+def track_queue(future, pool: str) -> None:
+    """Counts the future in the queue depth of the pool until it is done (or cancelled)"""
+    QUEUE_DEPTH.inc(pool=pool)
+    future.add_done_callback(lambda _: QUEUE_DEPTH.dec(pool=pool))
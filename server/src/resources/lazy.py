@@ -0,0 +1,84 @@
+"""
+Thread-safe holder of a heavy resource (database client, embedding model, OpenAI backend) built on first use
+
+Building these resources at import time made every cold start, test and CLI import pay for them before the server
+could answer a single request. A `LazyResource` only calls its factory the first time `get` is called, from whichever
+thread gets there first, while the other threads wait for the same instance. `warm_up` builds it on a background
+thread instead, so the first request does not pay for it either.
+
+Example:
+    COLLECTION = LazyResource("chroma collection", open_collection)
+    COLLECTION.warm_up()
+    COLLECTION.get().query(...)
+"""
+
+import time
+import logging
+import threading
+from typing import Any, Callable, Generic, TypeVar
+
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class LazyResource(Generic[T]):
+    """Builds a resource once, on first use or on a background warm-up thread"""
+
+    def __init__(self, name: str, factory: Callable[[], T], warm: Callable[[T], Any] | None = None):
+        """
+        Args:
+            name: a str naming the resource in logs
+            factory: builds the resource, called at most once unless it raises
+            warm: optional function run on the resource by `warm_up` only, e.g. a first inference to load a model
+        """
+        self.name = name
+        self.load_seconds: float | None = None
+        self._factory = factory
+        self._warm = warm
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._value: T | None = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def get(self) -> T:
+        """
+        Returns:
+            T: the resource, built by the calling thread if no other thread built it yet
+
+        Raises:
+            Exception: whatever the factory raised, the next call tries again
+        """
+        if self._loaded:
+            return self._value
+        with self._lock:
+            if not self._loaded:
+                start = time.perf_counter()
+                self._value = self._factory()
+                self.load_seconds = time.perf_counter() - start
+                self._loaded = True
+        return self._value
+
+    def warm_up(self) -> threading.Thread:
+        """
+        Builds the resource on a background thread, errors are logged and left for the first `get` to raise again
+
+        Returns:
+            threading.Thread: the daemon thread building the resource
+        """
+        def run() -> None:
+            try:
+                resource = self.get()
+                if self._warm is not None:
+                    self._warm(resource)
+                logger.info("Warmed up resource", extra={"resource": self.name, "seconds": round(self.load_seconds, 2)})
+            except Exception:
+                logger.exception("Warm up failed", extra={"resource": self.name})
+
+        thread = threading.Thread(target=run, name=f"warm-up {self.name}", daemon=True)
+        thread.start()
+        return thread
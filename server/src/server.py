@@ -1,53 +1,217 @@
 import os
 import uuid
 import json
-from text_extraction.unstructured_extract import extract_text
-from clean_text.clean_text import clean_full_chunk
+import time
+import queue
+import logging
+import threading
+from text_extraction.unstructured_extract import iter_text, count_pages, warm_up as warm_up_extraction
+from caching.disk_cache import DiskCache, make_key, hash_file
+from caching.lru_cache import LRUCache
+from clean_text.clean_text import iter_clean_elements
 from transformation import gpt, gptPortfolio
+from transformation.relevance_filter import filter_relevant, load_field_keywords, chunk_budget
+from transformation.chunking import ELEMENT_SEPARATOR
+from transformation.openai_client import load_prompt
 from flask import Flask, request, jsonify, Response
 from werkzeug.utils import secure_filename
 from dotenv import load_dotenv
-from chromadb.utils import embedding_functions
-from database.database_handler import database_add
-import chromadb
+from database.database_handler import database_upsert_chunks, database_query
+from database.field_index import FieldIndex
+from jobs.job_queue import JobStore, JobQueue, JOB_DONE, JOB_FAILED
+from resources.lazy import LazyResource
+from observability import metrics
+from observability.logs import configure_logging
 import tempfile
 from flask_cors import CORS
+from typing import Callable, Iterator
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
 
 app = Flask(__name__)
 
 # Enable CORS for the /upload route, allowing requests from http://localhost:3000
-CORS(app, resources={r"/upload": {"origins": "http://localhost:3000"}})
-#  python -m flask --app server.py run
+CORS(app, resources={r"/upload": {"origins": "http://localhost:3000"},
+                     r"/jobs/*": {"origins": "http://localhost:3000"},
+                     r"/search": {"origins": "http://localhost:3000"},
+                     r"/fields/*": {"origins": "http://localhost:3000"}})
+#  python -m flask --app "server:create_app()" run
 
 load_dotenv()
 OPENAI_API_KEY = os.getenv("API_KEY")
 
+# leveled logging as text or JSON lines, see `observability.logs` for LOG_LEVEL and LOG_FORMAT
+configure_logging()
+logger = logging.getLogger(__name__)
+
 MAX_FILE_PROCESSING_THREADS = 4
 
+# stages reported by the progress events of a streamed `/upload`, each one is `started` and then `finished`
+STAGE_EXTRACTION = "extraction"
+STAGE_TRANSFORMATION = "transformation"
+STREAM_FORMATS = {"ndjson": "application/x-ndjson", "sse": "text/event-stream"}
+
+# called by the processing functions with a stage and a status, see `stream_upload_results`
+ProgressCallback = Callable[[str, str], None]
+
+# `adaptive` only runs the slow hi_res strategy (OCR and table inference) on the pages that need it
+EXTRACTION_STRATEGY = os.getenv("EXTRACTION_STRATEGY", "adaptive")
+
+# page ranges of a single PDF are partitioned in parallel across this many processes, set to 1 to disable
+EXTRACTION_PROCESSES = int(os.getenv("EXTRACTION_PROCESSES", os.cpu_count() or 1))
+EXTRACTION_PAGES_PER_CHUNK = int(os.getenv("EXTRACTION_PAGES_PER_CHUNK", 8))
+
+# documents longer than this many tokens are split into chunks that are sent to OpenAI concurrently
+LLM_CHUNK_TOKENS = int(os.getenv("LLM_CHUNK_TOKENS", 24000))
+LLM_CHUNK_CONCURRENCY = int(os.getenv("LLM_CHUNK_CONCURRENCY", 4))
+
+# limits shared by every OpenAI request the server sends, set the rate limits to the ones of the account
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", 8))
+OPENAI_REQUESTS_PER_MINUTE = float(os.getenv("OPENAI_REQUESTS_PER_MINUTE", 500))
+OPENAI_TOKENS_PER_MINUTE = float(os.getenv("OPENAI_TOKENS_PER_MINUTE", 200000))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", 6))
+
+# only the most relevant elements of a document that fit in this many chunks of LLM_CHUNK_TOKENS are sent to OpenAI,
+# half a chunk (12000 tokens) by default, less than the 15 to 30 thousand tokens of a typical OM. The filter runs
+# before the chunking so a budget of more than one chunk is still split and merged, set to 0 to disable.
+# RELEVANCE_TOKEN_BUDGET sets the budget in tokens instead
+RELEVANCE_MAX_CHUNKS = float(os.getenv("RELEVANCE_MAX_CHUNKS", 0.5))
+RELEVANCE_TOKEN_BUDGET = int(os.getenv("RELEVANCE_TOKEN_BUDGET", chunk_budget(LLM_CHUNK_TOKENS, RELEVANCE_MAX_CHUNKS)))
+
+# lowercase the text sent to OpenAI, drop non-ASCII characters and collapse whitespace (see `clean_text`), disabled by default
+CLEAN_EXTRACTED_TEXT = os.getenv("CLEAN_EXTRACTED_TEXT", "").lower() in ("1", "true", "yes")
+
+# extracted text is kept in memory, enable to also write it to the temp folder for debugging
+SAVE_EXTRACTED_TEXT = os.getenv("SAVE_EXTRACTED_TEXT", "").lower() in ("1", "true", "yes")
+
+# embedding model of the database, one of `onnx` (default), `sentence-transformers` or `openai`
+EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "onnx")
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL") # the provider's default model if not set
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", 64))
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", 1))
+# vectors of already embedded texts, so rebuilding the database from an unchanged corpus never runs the model
+EMBEDDING_CACHE_PATH = 'cache/embeddings.sqlite3'
+# maximum amount of cached vectors before the least recently used are evicted
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", 400_000))
+
 DATABASE_DATA_FOLDER = "./db"
 DATABASE_COLLECTION_NAME = "finalized_jsons"
-DATABASE_EMBEDDING_FUNCTION = embedding_functions.DefaultEmbeddingFunction()
-DATABASE_CHROMA_CLIENT = chromadb.PersistentClient(path=DATABASE_DATA_FOLDER)
-DATABASE_COLLECTION = DATABASE_CHROMA_CLIENT.get_or_create_collection(
-    name=DATABASE_COLLECTION_NAME, embedding_function=DATABASE_EMBEDDING_FUNCTION)
+
+# build the database, the embedding model, the OpenAI backend and the extraction models in the background once the
+# server starts serving (see `start_background_work`) instead of on the first request that needs them, never on
+# import, disable to keep them from loading until they are used
+WARM_UP_ON_START = os.getenv("WARM_UP_ON_START", "true").lower() in ("1", "true", "yes")
+# resubmit the asynchronous uploads that were queued or running when the server stopped, done once the server starts
+# serving (see `start_background_work`), never on import
+RESUME_JOBS_ON_START = os.getenv("RESUME_JOBS_ON_START", "true").lower() in ("1", "true", "yes")
+
+# paging and caching of /search, results are cleared whenever /finalize writes to the database
+SEARCH_DEFAULT_LIMIT = 10
+SEARCH_MAX_LIMIT = 100
+QUERY_EMBEDDING_CACHE = LRUCache(max_entries=4096)
+SEARCH_RESULT_CACHE = LRUCache(max_entries=1024)
+
+# structured index of the fields of every finalized JSON for exact, prefix and numeric range queries
+FIELD_INDEX_PATH = os.path.join(DATABASE_DATA_FOLDER, "field_index.sqlite3")
+FIELDS_DEFAULT_LIMIT = 100
+FIELDS_MAX_LIMIT = 1000
 
 # Define directories for different stages
 UPLOAD_FOLDER = 'uploads/'
 DRAFT_FOLDER = 'drafts/'
 FINAL_FOLDER = 'finalized/'
 TEMP_FOLDER = 'temp/'
+JOB_FOLDER = 'jobs/'
+EXTRACTION_CACHE_FOLDER = 'cache/extraction/'
+LLM_CACHE_FOLDER = 'cache/llm/'
+DRAFT_INDEX_FOLDER = 'cache/drafts/'
+
+# maximum total size of the cached extracted texts before the least recently used are evicted
+EXTRACTION_CACHE_MAX_BYTES = 512 * 1024 * 1024
+# maximum total size and lifetime of the cached OpenAI responses
+LLM_CACHE_MAX_BYTES = 64 * 1024 * 1024
+LLM_CACHE_TTL_SECONDS = 7 * 24 * 60 * 60
+# seconds a finished job (and its result) stays available through `/jobs/<job_id>`
+JOB_RETENTION_SECONDS = float(os.getenv("JOB_RETENTION_SECONDS", 7 * 24 * 60 * 60))
 
 # Ensure directories exist
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(DRAFT_FOLDER, exist_ok=True)
 os.makedirs(FINAL_FOLDER, exist_ok=True)
 os.makedirs(TEMP_FOLDER, exist_ok=True)
+os.makedirs(JOB_FOLDER, exist_ok=True)
 os.makedirs(DATABASE_DATA_FOLDER, exist_ok=True)
 
+FIELD_INDEX = FieldIndex(FIELD_INDEX_PATH)
+
 app.config['UPLOAD_FOLDER'] = 'uploads'
 
+# the database, the embedding model and the OpenAI backend are only built on first use (or by the warm up),
+# importing chromadb, onnxruntime and openai takes seconds which kept the server from answering `/`
+def create_database_embedding_function():
+    from database.embeddings import create_embedding_function
+    return create_embedding_function(EMBEDDING_PROVIDER, model=EMBEDDING_MODEL, batch_size=EMBEDDING_BATCH_SIZE,
+                                     threads=EMBEDDING_THREADS, api=OPENAI_API_KEY, cache_path=EMBEDDING_CACHE_PATH,
+                                     cache_max_entries=EMBEDDING_CACHE_MAX_ENTRIES)
+
+def create_database_client():
+    import chromadb
+    return chromadb.PersistentClient(path=DATABASE_DATA_FOLDER)
+
+def create_database_collection():
+    from database.embeddings import DEFAULT_MODELS
+    # vectors of different models cannot share a collection, only the default model uses the original name
+    name = DATABASE_COLLECTION_NAME
+    if EMBEDDING_PROVIDER != "onnx":
+        model = EMBEDDING_MODEL or DEFAULT_MODELS.get(EMBEDDING_PROVIDER)
+        name += "_" + secure_filename(f"{EMBEDDING_PROVIDER}_{model}").lower()
+    return DATABASE_CHROMA_CLIENT.get().get_or_create_collection(name=name, embedding_function=DATABASE_EMBEDDING_FUNCTION.get())
+
+def create_openai_backend():
+    if not OPENAI_API_KEY:
+        return None
+    from transformation.async_backend import AsyncOpenAIBackend
+    return AsyncOpenAIBackend(OPENAI_API_KEY, max_concurrency=OPENAI_MAX_CONCURRENCY,
+                              requests_per_minute=OPENAI_REQUESTS_PER_MINUTE,
+                              tokens_per_minute=OPENAI_TOKENS_PER_MINUTE,
+                              max_retries=OPENAI_MAX_RETRIES)
+
+# the warm up embeds a short text so the model itself is loaded, not only the embedding function
+DATABASE_EMBEDDING_FUNCTION = LazyResource("embedding model", create_database_embedding_function,
+                                           warm=lambda embedding_function: embedding_function.warm_up())
+DATABASE_CHROMA_CLIENT = LazyResource("chroma client", create_database_client)
+DATABASE_COLLECTION = LazyResource("chroma collection", create_database_collection)
+# layout detection and table structure models of unstructured, loaded in the server and in every extraction worker
+EXTRACTION_MODELS = LazyResource("extraction models", lambda: warm_up_extraction(EXTRACTION_PROCESSES))
+
+# background processing for asynchronous uploads, job records are persisted in JOB_FOLDER
+JOB_STORE = JobStore(JOB_FOLDER, retention_seconds=JOB_RETENTION_SECONDS)
+JOB_QUEUE = JobQueue(JOB_STORE, max_workers=MAX_FILE_PROCESSING_THREADS)
+
+# every OpenAI request goes through this backend so uploads wait for the rate limit instead of failing on a 429
+OPENAI_BACKEND = LazyResource("OpenAI backend", create_openai_backend)
+
+# extracted text of already seen PDFs, keyed by the hash of the PDF and the extraction parameters
+EXTRACTION_CACHE = DiskCache(EXTRACTION_CACHE_FOLDER, max_bytes=EXTRACTION_CACHE_MAX_BYTES)
+# OpenAI responses of already parsed texts, invalidated whenever a prompt file changes
+LLM_CACHE = DiskCache(LLM_CACHE_FOLDER, max_bytes=LLM_CACHE_MAX_BYTES, ttl_seconds=LLM_CACHE_TTL_SECONDS, suffix=".json")
+# unique id of the draft of every processed PDF, keyed by `draft_index_key`, entries are tiny so the bound is never hit in practice
+DRAFT_INDEX = DiskCache(DRAFT_INDEX_FOLDER, max_bytes=64 * 1024 * 1024)
+
+def embedding_cache_count(counter: str) -> int:
+    """Returns the `hits` or `misses` of the vector cache, 0 until the embedding model is loaded"""
+    if not DATABASE_EMBEDDING_FUNCTION.loaded:
+        return 0
+    return getattr(getattr(DATABASE_EMBEDDING_FUNCTION.get(), "cache", None), counter, 0)
+
+# the caches count their own hits and misses, `/metrics` reads them when it is scraped
+for cache_name, cache in (("extraction", EXTRACTION_CACHE), ("llm", LLM_CACHE), ("drafts", DRAFT_INDEX),
+                          ("query_embeddings", QUERY_EMBEDDING_CACHE), ("search_results", SEARCH_RESULT_CACHE)):
+    metrics.CACHE_HITS.set_function(lambda cache=cache: cache.stats()["hits"], cache=cache_name)
+    metrics.CACHE_MISSES.set_function(lambda cache=cache: cache.stats()["misses"], cache=cache_name)
+metrics.CACHE_HITS.set_function(lambda: embedding_cache_count("hits"), cache="embeddings")
+metrics.CACHE_MISSES.set_function(lambda: embedding_cache_count("misses"), cache="embeddings")
+
 
 @app.route('/')
 def home():
@@ -60,6 +224,32 @@ def upload() -> tuple[Response, int]:
     Turns each PDF file given in the request into a JSON representing the parsed data from it. The JSON(s) are then added to the response.
     The request expects a field name `pdf_files` under files and a field named `doc_types` under form. The length of these fields must be equal.
 
+    When the request is sent with the query parameter `async=true` the files are only saved and queued, the response
+    (status 202) then contains one job per file which can be followed through `/jobs/<job_id>` and `/jobs/<job_id>/result`:
+    ```
+    [
+        { "job_id": "id1", "filename": "file1.pdf", "status": "queued" },
+        { "job_id": "id2", "filename": "file2.pdf", "status": "queued" },
+        ...
+    ]
+    ```
+
+    When the request is sent with the query parameter `stream=ndjson` (or `stream=true`) or `stream=sse` the files are
+    processed in parallel and the response is streamed, each file's draft or error is sent the moment it is ready
+    instead of once the slowest file is done. Every event is a JSON object, one per line for `ndjson` and one per
+    `data:` field (named by `event:`) for `sse`:
+    ```
+    { "event": "progress", "index": 0, "filename": "file1.pdf", "stage": "extraction", "status": "started" }
+    { "event": "progress", "index": 0, "filename": "file1.pdf", "stage": "extraction", "status": "finished" }
+    { "event": "progress", "index": 0, "filename": "file1.pdf", "stage": "transformation", "status": "started" }
+    { "event": "progress", "index": 0, "filename": "file1.pdf", "stage": "transformation", "status": "finished" }
+    { "event": "result", "index": 0, "filename": "file1.pdf", "status": 200, "data": { "unique_id": "id1", "draft_json": {...} } }
+    ...
+    { "event": "done", "succeeded": 9, "failed": 1 }
+    ```
+    A failed file does not stop the others, its result event holds the error and status code that a synchronous
+    `/upload` would have returned.
+
     Args:
         None
 
@@ -70,10 +260,9 @@ def upload() -> tuple[Response, int]:
         # extract necessary information from the request
         # Expecting field name "pdf_files"
         
-        print("Request Form:", request.form)
-
         files = request.files.getlist('file')
-        print(files)
+        logger.info("Upload received", extra={"files": [file.filename for file in files],
+                                              "doc_types": request.form.getlist('doc_types')})
 
         if not files:
             return jsonify({"error": "No files provided"}), 400
@@ -86,6 +275,18 @@ def upload() -> tuple[Response, int]:
         if len(files) != len(doc_types):
             return jsonify({"error": "Number of files and doc types do not match"}), 400
 
+        # queue the files and return their job ids without waiting on the processing
+        if request.args.get('async', '').lower() in ('1', 'true', 'yes'):
+            return queue_upload_jobs(files, doc_types)
+
+        # send each file's result as soon as it is ready
+        stream_format = request.args.get('stream', '').lower()
+        if stream_format in ('1', 'true', 'yes'):
+            stream_format = 'ndjson'
+        if stream_format:
+            if stream_format not in STREAM_FORMATS:
+                return jsonify({"error": f"Unknown stream format {stream_format}, expected one of {', '.join(STREAM_FORMATS)}"}), 400
+            return stream_upload_results(files, doc_types, stream_format)
 
         def process_single_file(index: int, file, doc_type: str) -> tuple[int, dict[str, str], int]:
             """
@@ -103,56 +304,26 @@ def upload() -> tuple[Response, int]:
             if not file and not file.filename.lower().endswith('.pdf'):
                 return index, {"error": "One or more selected files have no filename"}, 400
 
-            # create id and filepath + save file
-            unique_id = str(uuid.uuid4())
-            filename = secure_filename(file.filename)
-            id_and_filename = f"{unique_id}_{filename}"[:128]  # limit to 128 characters, first 32 are uuid
-            id_and_filename = id_and_filename + (
-                "" if id_and_filename.endswith(".pdf") else ".pdf")  # add .pdf if cut off above
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], id_and_filename)
+            unique_id, filename, filepath = create_upload_path(file.filename)
 
             try:
                 # save file to upload folder
                 file.save(filepath)
-
-                # if file is portfolio jump to function process_portfolio
-                if 'portfolio' in filename.lower():
-                    return index, *process_portfolio(index, unique_id, doc_type, filepath)
-
-                # generaye draft json
-                draft_json = process_pdf_to_draft(unique_id, doc_type, filepath)
-                if not draft_json:
-                    return index, {"error": f"Unable to extract text from: {file.filename}"}, 400
-                
-                # clean draft json by replacing empty strings with None
-                draft_json_obj: dict[str, str | None] = json.loads(draft_json)
-                for key, val in draft_json_obj.items():
-                    if val == "":
-                        draft_json_obj[key] = None
-
-                cleaned_draft_json = json.dumps(draft_json_obj, ensure_ascii=False)
-
-                # save draft json for future use
-                draft_file_path = os.path.join(DRAFT_FOLDER, f"{unique_id}.json")
-                with open(draft_file_path, "w", encoding="utf-8") as f:
-                    f.write(cleaned_draft_json)
-
-                # return resulting json
-                return index, {
-                    "unique_id": unique_id,
-                    "draft_json": draft_json_obj
-                }, 200
-            
             except Exception as e:
                 return index, {"error": f"Error saving file {filename}: {str(e)}"}, 500
 
+            return index, *process_saved_file(unique_id, filename, doc_type, filepath)
+
         # create results list
         results = [None] * len(files)
 
         # process files in parallel using ThreadPoolExecutor
-        with ThreadPoolExecutor(max_workers = MAX_FILE_PROCESSING_THREADS) as executor:
+        executor = ThreadPoolExecutor(max_workers = MAX_FILE_PROCESSING_THREADS)
+        try:
             # submit tasks to the executor and get futures
             futures = [executor.submit(process_single_file, ind, file, doctype) for ind, (file, doctype) in enumerate(zip(files, doc_types))]
+            for future in futures:
+                metrics.track_queue(future, "upload")
 
             # process results as they finish executing
             for future in as_completed(futures):
@@ -161,21 +332,366 @@ def upload() -> tuple[Response, int]:
                     return jsonify(data), status
                 # store the result in the results list
                 results[index] = data
+        finally:
+            # on an error the files that did not start yet are dropped instead of keeping the response waiting on them
+            executor.shutdown(wait=False, cancel_futures=True)
 
         # Once all files are processed, return the results
         return jsonify(results), 200
     
-    except Exception as e:
-        print(f"Error: {str(e)}")
+    except Exception:
+        logger.exception("Upload failed")
+        metrics.ERRORS.inc(stage="upload")
         return jsonify({"error": "An error occurred while processing the files"}), 400
 
-def process_pdf_to_draft(uuid: str, doctype: str, file_path: str) -> str:
+def stream_upload_results(files: list, doc_types: list[str], stream_format: str) -> tuple[Response, int]:
+    """
+    Saves each uploaded file, then processes them in parallel and streams their progress and results as they
+    happen, see `upload` for the events
+
+    Args:
+        files: the uploaded file objects
+        doc_types: the document type of each file
+        stream_format: `ndjson` or `sse`
+
+    Returns:
+        tuple[Response, int]: the streamed Response object (or an error) and corresponding status code
+    """
+    # the uploads are only readable while the request is handled, so they are saved before streaming starts
+    saved_files = []
+    for index, (file, doc_type) in enumerate(zip(files, doc_types)):
+        if not file or not file.filename:
+            return jsonify({"error": "One or more selected files have no filename"}), 400
+
+        unique_id, filename, filepath = create_upload_path(file.filename)
+        try:
+            file.save(filepath)
+        except Exception as e:
+            return jsonify({"error": f"Error saving file {filename}: {str(e)}"}), 500
+        saved_files.append((index, unique_id, filename, doc_type, filepath))
+
+    # filled by the worker threads and drained by the response
+    events: queue.Queue[dict] = queue.Queue()
+
+    def process_streamed_file(index: int, unique_id: str, filename: str, doc_type: str, filepath: str) -> None:
+        def progress(stage: str, status: str) -> None:
+            events.put({"event": "progress", "index": index, "filename": filename, "stage": stage, "status": status})
+
+        try:
+            data, status = process_saved_file(unique_id, filename, doc_type, filepath, progress=progress)
+        except Exception as e:
+            data, status = {"error": f"Error processing file {filename}: {str(e)}"}, 500
+        events.put({"event": "result", "index": index, "filename": filename, "status": status, "data": data})
+
+    executor = ThreadPoolExecutor(max_workers=MAX_FILE_PROCESSING_THREADS)
+    for saved_file in saved_files:
+        metrics.track_queue(executor.submit(process_streamed_file, *saved_file), "upload")
+
+    def generate() -> Iterator[str]:
+        succeeded = failed = 0
+        try:
+            while succeeded + failed < len(saved_files):
+                event = events.get()
+                if event["event"] == "result":
+                    if event["status"] == 200:
+                        succeeded += 1
+                    else:
+                        failed += 1
+                yield format_stream_event(event, stream_format)
+            yield format_stream_event({"event": "done", "succeeded": succeeded, "failed": failed}, stream_format)
+        finally:
+            # when the client disconnects the files that already started are still turned into drafts, the others are dropped
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    # keep proxies from buffering the events until the response ends
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return Response(generate(), mimetype=STREAM_FORMATS[stream_format], headers=headers), 200
+
+def format_stream_event(event: dict, stream_format: str) -> str:
+    """
+    Args:
+        event: the event as a dict with its name under `event`
+        stream_format: `ndjson` or `sse`
+
+    Returns:
+        str: the event as a line of JSON for `ndjson` or as a server-sent event for `sse`
+    """
+    data = json.dumps(event, ensure_ascii=False)
+    if stream_format == "sse":
+        return f"event: {event['event']}\ndata: {data}\n\n"
+    return data + "\n"
+
+def no_progress(stage: str, status: str) -> None:
+    """Default progress callback of the processing functions, ignores every stage"""
+
+def create_upload_path(original_filename: str) -> tuple[str, str, str]:
+    """
+    Creates a new id for an uploaded file along with the path it should be saved to
+
+    Args:
+        original_filename: a str representing the filename given by the client
+
+    Returns:
+        tuple[str, str, str]: the new id, the secured filename, and the path to save the file to
+    """
+    unique_id = str(uuid.uuid4())
+    filename = secure_filename(original_filename)
+    id_and_filename = f"{unique_id}_{filename}"[:128]  # limit to 128 characters, first 32 are uuid
+    id_and_filename = id_and_filename + (
+        "" if id_and_filename.endswith(".pdf") else ".pdf")  # add .pdf if cut off above
+    filepath = os.path.join(app.config['UPLOAD_FOLDER'], id_and_filename)
+    return unique_id, filename, filepath
+
+def draft_index_key(filename: str, doc_type: str, filepath: str) -> str:
+    """
+    Builds the key identifying the draft of a PDF from the hash of the PDF, its document type, and everything else
+    that changes the resulting draft (portfolio or not, the prompt file contents, the model, the extraction strategy,
+    whether the text is cleaned, and the relevance budget and chunk size of the text sent to OpenAI)
+
+    Args:
+        filename: a str representing the secured filename of the upload
+        doc_type: a str representing the type of document
+        filepath: a str representing the path to the saved pdf file
+
+    Returns:
+        str: the key of the draft
+    """
+    is_portfolio = 'portfolio' in filename.lower()
+    prompt = load_prompt(gptPortfolio.PROMPT_FILE_PATH if is_portfolio else gpt.PROMPT_FILE_PATH)
+    model = gptPortfolio.MODEL if is_portfolio else gpt.MODEL
+    return make_key(hash_file(filepath), doc_type, str(is_portfolio), prompt, model, EXTRACTION_STRATEGY,
+                    str(CLEAN_EXTRACTED_TEXT), str(RELEVANCE_TOKEN_BUDGET), str(LLM_CHUNK_TOKENS))
+
+def find_existing_draft(index_key: str) -> dict | None:
+    """
+    Args:
+        index_key: a str representing the key of the draft, see `draft_index_key`
+
+    Returns:
+        dict | None: the unique id and draft JSON of an identical earlier upload, None if there is none or its draft was removed
+    """
+    existing_id = DRAFT_INDEX.get(index_key)
+    if existing_id is None:
+        return None
+
+    draft_file_path = os.path.join(DRAFT_FOLDER, f"{existing_id}.json")
+    if not os.path.exists(draft_file_path):
+        return None
+
+    with open(draft_file_path, "r", encoding="utf-8") as f:
+        return {"unique_id": existing_id, "draft_json": json.load(f)}
+
+def process_saved_file(unique_id: str, filename: str, doc_type: str, filepath: str,
+                       progress: ProgressCallback = no_progress) -> tuple[dict, int]:
+    """
+    Turns an already saved PDF file into its draft JSON and saves the draft to the draft folder. When an identical
+    PDF was already turned into a draft the earlier draft (and its unique id) is returned instead and the new upload
+    is removed, so re-uploads do not create duplicate drafts.
+
+    Args:
+        unique_id: a str representing the documents's id
+        filename: a str representing the secured filename of the upload
+        doc_type: a str representing the type of document
+        filepath: a str representing the path to the saved pdf file
+        progress: called with the stage and `started` or `finished`, not called for an earlier draft
+
+    Returns:
+        tuple[dict, int]: the parsed JSON data (or an error) as a dict and the status code
+    """
+    try:
+        index_key = draft_index_key(filename, doc_type, filepath)
+        existing_draft = find_existing_draft(index_key)
+        if existing_draft is not None:
+            logger.info("Upload was already processed", extra={"filename": filename, "unique_id": existing_draft["unique_id"]})
+            os.remove(filepath)
+            return existing_draft, 200
+    except Exception as e:
+        return {"error": f"Error processing file {filename}: {str(e)}"}, 500
+
+    data, status = create_draft(unique_id, filename, doc_type, filepath, progress=progress)
+    if status == 200:
+        DRAFT_INDEX.put(index_key, unique_id)
+    return data, status
+
+def create_draft(unique_id: str, filename: str, doc_type: str, filepath: str,
+                 progress: ProgressCallback = no_progress) -> tuple[dict, int]:
+    """
+    Turns an already saved PDF file into its draft JSON and saves the draft to the draft folder
+
+    Args:
+        unique_id: a str representing the documents's id
+        filename: a str representing the secured filename of the upload
+        doc_type: a str representing the type of document
+        filepath: a str representing the path to the saved pdf file
+        progress: called with the stage and `started` or `finished`
+
+    Returns:
+        tuple[dict, int]: the parsed JSON data (or an error) as a dict and the status code
+    """
+    try:
+        # if file is portfolio jump to function process_portfolio
+        if 'portfolio' in filename.lower():
+            return process_portfolio(0, unique_id, doc_type, filepath, progress=progress)
+
+        # generaye draft json
+        draft_json = process_pdf_to_draft(unique_id, doc_type, filepath, progress=progress)
+        if not draft_json:
+            return {"error": f"Unable to extract text from: {filename}"}, 400
+        
+        with metrics.STAGE_SECONDS.time(stage="post_processing"):
+            # clean draft json by replacing empty strings with None
+            draft_json_obj: dict[str, str | None] = json.loads(draft_json)
+            for key, val in draft_json_obj.items():
+                if val == "":
+                    draft_json_obj[key] = None
+
+            cleaned_draft_json = json.dumps(draft_json_obj, ensure_ascii=False)
+
+            # save draft json for future use
+            draft_file_path = os.path.join(DRAFT_FOLDER, f"{unique_id}.json")
+            with open(draft_file_path, "w", encoding="utf-8") as f:
+                f.write(cleaned_draft_json)
+
+        # return resulting json
+        return {
+            "unique_id": unique_id,
+            "draft_json": draft_json_obj
+        }, 200
+
+    except Exception as e:
+        logger.exception("Draft post processing failed", extra={"uuid": unique_id, "filename": filename})
+        metrics.ERRORS.inc(stage="post_processing")
+        return {"error": f"Error processing file {filename}: {str(e)}"}, 500
+
+def queue_upload_jobs(files: list, doc_types: list[str]) -> tuple[Response, int]:
+    """
+    Saves each uploaded file and queues it for background processing, one job per file. The job id is the same as
+    the unique id of the resulting draft, unless the file was already processed. The result of such a job is the
+    earlier draft, so clients should read the draft's id from `unique_id` in the job result.
+
+    Args:
+        files: the uploaded file objects
+        doc_types: the document type of each file
+
+    Returns:
+        tuple[Response, int]: Response object with the queued jobs and corresponding status code
+    """
+    jobs = []
+    for file, doc_type in zip(files, doc_types):
+        if not file or not file.filename:
+            return jsonify({"error": "One or more selected files have no filename"}), 400
+
+        unique_id, filename, filepath = create_upload_path(file.filename)
+        try:
+            file.save(filepath)
+        except Exception as e:
+            return jsonify({"error": f"Error saving file {filename}: {str(e)}"}), 500
+
+        job = JOB_STORE.create(unique_id, filename=filename, doc_type=doc_type, file_path=filepath)
+        JOB_QUEUE.submit(unique_id, process_saved_file, unique_id, filename, doc_type, filepath)
+        jobs.append({"job_id": unique_id, "filename": filename, "status": job["status"]})
+
+    return jsonify(jobs), 202
+
+def resume_unfinished_jobs() -> None:
+    """Resubmits the jobs that were queued or running when the server last stopped"""
+    for job in JOB_STORE.unfinished_jobs():
+        if not os.path.exists(job.get("file_path", "")):
+            JOB_STORE.update(job["job_id"], status=JOB_FAILED, status_code=500,
+                             result={"error": "Uploaded file is missing, unable to resume job"})
+            continue
+        logger.info("Resuming job", extra={"job_id": job["job_id"]})
+        JOB_QUEUE.submit(job["job_id"], process_saved_file, job["job_id"], job["filename"], job["doc_type"], job["file_path"])
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id: str) -> tuple[Response, int]:
+    """
+    Returns the status of a job created through an asynchronous `/upload`, the status is one of
+    `queued`, `running`, `done` or `failed`
+
+    Args:
+        job_id: a str representing the job's id
+
+    Returns:
+        tuple[Response, int]: Response object and corresponding status code
+    """
+    job = JOB_STORE.get(job_id)
+    if not job:
+        return jsonify({"error": f"No job with id {job_id}"}), 404
+
+    job.pop("result", None)
+    job.pop("file_path", None)
+    return jsonify(job), 200
+
+@app.route('/jobs/<job_id>/result', methods=['GET'])
+def job_result(job_id: str) -> tuple[Response, int]:
+    """
+    Returns the result of a job created through an asynchronous `/upload`. A finished job returns the same JSON
+    that a synchronous `/upload` returns for the file, a failed job returns its error and status code, and a job
+    that is still queued or running returns its status with the status code 202.
+
+    Args:
+        job_id: a str representing the job's id
+
+    Returns:
+        tuple[Response, int]: Response object and corresponding status code
+    """
+    job = JOB_STORE.get(job_id)
+    if not job:
+        return jsonify({"error": f"No job with id {job_id}"}), 404
+
+    if job["status"] in (JOB_DONE, JOB_FAILED):
+        return jsonify(job["result"]), job["status_code"]
+
+    return jsonify({"job_id": job_id, "status": job["status"]}), 202
+
+def extract_document_text(uuid: str, file_path: str, clean: bool = False) -> str:
+    """
+    Extracts the text of the given PDF file in memory. When `SAVE_EXTRACTED_TEXT` is enabled the text is also
+    written to the temp folder as `<uuid>.txt` for debugging, the file is kept after processing.
+
+    Args:
+        uuid: a str representing the documents's id
+        file_path: a str representing the path to the uploaded pdf file
+        clean: whether to clean each element as it is extracted, see `clean_text`
+
+    Returns:
+        str: the extracted text
+    """
+    timings: dict[str, float] = {}
+    with metrics.STAGE_SECONDS.time(stage="extraction"):
+        chunks = iter_text(file_path, strategy=EXTRACTION_STRATEGY, cache=EXTRACTION_CACHE,
+                           workers=EXTRACTION_PROCESSES, pages_per_chunk=EXTRACTION_PAGES_PER_CHUNK, timings=timings)
+        if clean:
+            # elements are cleaned on their own so the blank lines between them survive for relevance filtering and chunking
+            chunks = iter_clean_elements(chunks, separator=ELEMENT_SEPARATOR)
+        text = "".join(chunks)
+    if timings:
+        # nothing is timed on a cache hit, a model load here means the warm up did not finish before the document arrived
+        metrics.PAGES_PROCESSED.inc(count_pages(file_path))
+        logger.info("Extracted text", extra={"uuid": uuid, "chars": len(text),
+                                             "model_load_seconds": round(timings["model_load"], 2),
+                                             "inference_seconds": round(timings["inference"], 2)})
+    else:
+        logger.info("Extracted text from the cache", extra={"uuid": uuid, "chars": len(text)})
+
+    if SAVE_EXTRACTED_TEXT:
+        os.makedirs(TEMP_FOLDER, exist_ok=True)
+        extracted_text_file_path = os.path.join(TEMP_FOLDER, uuid + ".txt")
+        with open(extracted_text_file_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        logger.debug("Saved extracted text", extra={"uuid": uuid, "path": extracted_text_file_path})
+
+    return text
+
+def process_pdf_to_draft(uuid: str, doctype: str, file_path: str, progress: ProgressCallback = no_progress) -> str:
     """
     Turns the given PDF file into a JSON formatted string through text extraction, text cleaning, and text parsing
     Args:
         uuid: a str representing the documents's id
         filetype: a str representing the type of document
         file_path: a str representing the path to the uploaded pdf file
+        progress: called with the stage and `started` or `finished`
     Returns:
         str: a JSON formatted string representing the parsed text
     """
@@ -183,74 +699,57 @@ def process_pdf_to_draft(uuid: str, doctype: str, file_path: str) -> str:
     results = ""
     # Check if input file exists
     if not os.path.exists(file_path):
-        print(f"ERROR: Input file does not exist: {file_path}")
-        return ""
-    
-    # Ensure temp folder exists
-    try:
-        os.makedirs(TEMP_FOLDER, exist_ok=True)
-        print(f"Temp folder created/exists: {TEMP_FOLDER}")
-    except Exception as e:
-        print(f"ERROR: Cannot create temp folder: {e}")
+        logger.error("Input file does not exist", extra={"uuid": uuid, "path": file_path})
         return ""
     
-    # create path where to extract text to
-    extracted_text_file_path = os.path.join(TEMP_FOLDER, uuid + ".txt")
-    print(f"Will extract text to: {extracted_text_file_path}")
-    
     # call function to extract text
-    print("=== Calling extract_text function ===")
+    progress(STAGE_EXTRACTION, "started")
     try:
-        extract_result = extract_text(file_path, extracted_text_file_path)
-        print(f"Extract text result: {extract_result}")
-        
-        if not extract_result:
-            print("ERROR: extract_text returned False")
-            return ""
-            
-    except Exception as e:
-        print(f"ERROR: extract_text threw exception: {e}")
+        file_text = extract_document_text(uuid, file_path, clean=CLEAN_EXTRACTED_TEXT)
+    except Exception:
+        logger.exception("Text extraction failed", extra={"uuid": uuid})
+        metrics.ERRORS.inc(stage="extraction")
         return ""
+    progress(STAGE_EXTRACTION, "finished")
     
-    # Check if extracted text file was created
-    if not os.path.exists(extracted_text_file_path):
-        print(f"ERROR: Extracted text file was not created: {extracted_text_file_path}")
+    if not file_text.strip():
+        logger.error("No text content extracted", extra={"uuid": uuid})
+        metrics.ERRORS.inc(stage="extraction")
         return ""
     
-    print(f"Extracted text file size: {os.path.getsize(extracted_text_file_path)} bytes")
-    
     # call appropriate methods
     try:
         # call openai api for parsing
-        print("=== Reading extracted text ===")
-        file_text = ""
-        with open(extracted_text_file_path, "r", encoding="utf-8", errors="replace") as infile:
-            file_text = infile.read()
-        
-        if not file_text.strip():
-            print("ERROR: No text content extracted")
-            return ""
-        
         if not OPENAI_API_KEY:
-            print("ERROR: OPENAI_API_KEY is not set")
+            logger.error("OPENAI_API_KEY is not set")
             return ""
+
+        with metrics.STAGE_SECONDS.time(stage="transformation"):
+            # drop the elements that are unlikely to hold any of the fields asked for in the prompt
+            keywords = load_field_keywords(load_prompt(gpt.PROMPT_FILE_PATH))
+            file_text, tokens_before, tokens_after = filter_relevant(file_text, RELEVANCE_TOKEN_BUDGET, keywords)
+            metrics.RELEVANCE_FILTER_TOKENS.inc(tokens_before, kind="input")
+            metrics.RELEVANCE_FILTER_TOKENS.inc(tokens_before - tokens_after, kind="dropped")
+            logger.info("Relevance filter applied", extra={"uuid": uuid, "tokens_before": tokens_before,
+                                                           "tokens_after": tokens_after})
+
+            progress(STAGE_TRANSFORMATION, "started")
+            results = gpt.request_chunked(doctype, OPENAI_API_KEY, file_text, max_tokens=LLM_CHUNK_TOKENS,
+                                          concurrency=LLM_CHUNK_CONCURRENCY, cache=LLM_CACHE,
+                                          backend=OPENAI_BACKEND.get()).content
+            progress(STAGE_TRANSFORMATION, "finished")
         
-        results = gpt.request(doctype, OPENAI_API_KEY, file_text).content
-        
-    except Exception as e:
-        print(f"Error during OpenAI API request: {str(e)}")
+    except Exception:
+        logger.exception("OpenAI request failed", extra={"uuid": uuid})
+        metrics.ERRORS.inc(stage="transformation")
         return ""
-    finally:
-        # clean temp files
-        if os.path.exists(extracted_text_file_path):
-            os.remove(extracted_text_file_path)
-            print(f"Cleaned up temp file: {extracted_text_file_path}")
     
-    print("=== process_pdf_to_draft completed successfully ===")
+    logger.info("Draft created", extra={"uuid": uuid})
     # return json formatted str
     return results
 
-def process_portfolio(index: int, uuid: str, doctype: str, file_path: str) -> tuple[dict, int]:
+def process_portfolio(index: int, uuid: str, doctype: str, file_path: str,
+                      progress: ProgressCallback = no_progress) -> tuple[dict, int]:
     """
         Extracts text from a multi‐property (portfolio) PDF, sends it to GPT, parses the multiple JSON objects, and returns them as a list.
 
@@ -259,36 +758,44 @@ def process_portfolio(index: int, uuid: str, doctype: str, file_path: str) -> tu
             uuid: a str representing the documents's id
             filetype: a str representing the type of document
             file_path: a str representing the path to the uploaded pdf file
+            progress: called with the stage and `started` or `finished`
 
         Returns:
             str: a JSON formatted string representing the parsed text with multiple jsons for the multiple properties
         """
 
     # Extract text
-    txt_path = os.path.join(TEMP_FOLDER, f"{uuid}.txt")
-    if not extract_text(file_path, txt_path):
+    progress(STAGE_EXTRACTION, "started")
+    try:
+        content = extract_document_text(uuid, file_path)
+    except Exception:
+        logger.exception("Text extraction failed", extra={"uuid": uuid})
+        metrics.ERRORS.inc(stage="extraction")
         return {"error": "Text extraction failed"}, 400
-
-    with open(txt_path, 'r', encoding='utf-8') as in_f:
-        content = in_f.read()
+    progress(STAGE_EXTRACTION, "finished")
 
     try:
-        raw = gptPortfolio.request(doctype, OPENAI_API_KEY, content).content
+        progress(STAGE_TRANSFORMATION, "started")
+        with metrics.STAGE_SECONDS.time(stage="transformation"):
+            raw = gptPortfolio.request_chunked(doctype, OPENAI_API_KEY, content, max_tokens=LLM_CHUNK_TOKENS,
+                                               concurrency=LLM_CHUNK_CONCURRENCY, cache=LLM_CACHE,
+                                               backend=OPENAI_BACKEND.get()).content
+        progress(STAGE_TRANSFORMATION, "finished")
         portfolio_list = json.loads(raw)
     except Exception as e:
-        os.remove(txt_path)
+        logger.exception("Portfolio parsing failed", extra={"uuid": uuid})
+        metrics.ERRORS.inc(stage="transformation")
         return {"error": f"GPT portfolio parsing failed: {e}"}, 500
 
-    os.remove(txt_path)
+    with metrics.STAGE_SECONDS.time(stage="post_processing"):
+        for entry in portfolio_list:
+            for k, v in entry.items():
+                if v == "":
+                    entry[k] = None
 
-    for entry in portfolio_list:
-        for k, v in entry.items():
-            if v == "":
-                entry[k] = None
-
-    draft_path = os.path.join(DRAFT_FOLDER, f"{uuid}.json")
-    with open(draft_path, 'w', encoding='utf-8') as f:
-        json.dump(portfolio_list, f, ensure_ascii=False)
+        draft_path = os.path.join(DRAFT_FOLDER, f"{uuid}.json")
+        with open(draft_path, 'w', encoding='utf-8') as f:
+            json.dump(portfolio_list, f, ensure_ascii=False)
     return {"unique_id": uuid, "draft_json": portfolio_list}, 200
 
 @app.route('/finalize', methods=['POST'])
@@ -315,6 +822,10 @@ def finalize() -> tuple[Response, int]:
     ]
     ```
 
+    The whole list is validated before anything is saved, then every JSON that is new or changed since it was last
+    finalized is embedded in a single batch, finalizing the same JSON again is a no-op with the status `unchanged`.
+    The response includes the seconds spent in each phase under `timings`.
+
     Args:
         None
 
@@ -322,15 +833,19 @@ def finalize() -> tuple[Response, int]:
         tuple[Response, int]: Response object and corresponding status code
     """
     try:
+        start = time.perf_counter()
+        timings = {}
+
         # get data as json
         data = request.get_json()
 
         if not isinstance(data, list):
             return jsonify({"error": "Request expects a list of JSON objects"}), 400
 
-        response = []
-
-        # process each finalzed json object
+        # validate every finalized json object before anything is written
+        filenames = []
+        final_datas = []
+        final_data_strs = []
         for final_json in data:
             if not isinstance(final_json, dict) or len(final_json) != 1:
                 return jsonify(
@@ -341,31 +856,294 @@ def finalize() -> tuple[Response, int]:
             if not isinstance(final_data, dict):
                 return jsonify({"error": f"JSON of {filename} is not properly formatted"}), 400
 
-            # save final json to file
-            final_data_str = json.dumps(final_data)
+            if filename in filenames:
+                return jsonify({"error": f"{filename} is present more than once"}), 400
+
+            filenames.append(filename)
+            final_datas.append(final_data)
+            final_data_strs.append(json.dumps(final_data))
+
+        timings["validate"] = time.perf_counter() - start
+
+        # save all final jsons to files
+        phase_start = time.perf_counter()
+        for filename, final_data_str in zip(filenames, final_data_strs):
             secured_filename = secure_filename(filename)
             final_file_path = os.path.join(FINAL_FOLDER, f"{secured_filename}.json")
             with open(final_file_path, "w", encoding="utf-8") as f:
                 f.write(final_data_str)
+        timings["write_files"] = time.perf_counter() - phase_start
 
-            try:
-                # save final json to database
-                database_add(DATABASE_COLLECTION,
-                            doc_list=[final_data_str],
-                            id_list=[filename],
-                            metadata_list=[{'finalized': "True"}])
-            except Exception as e:
-                print(f"Error saving to database: {str(e)}")
-                return jsonify({"error": f"Error saving {filename} to database"}), 500
+        database_start = time.perf_counter()
+        try:
+            # save the final jsons to database as field group chunks, only the chunks that changed since they were last finalized are embedded
+            written_ids, database_timings = database_upsert_chunks(DATABASE_COLLECTION.get(),
+                                                                   documents=dict(zip(filenames, final_datas)),
+                                                                   metadata_list=[{'finalized': "True"} for _ in filenames],
+                                                                   embedding_function=DATABASE_EMBEDDING_FUNCTION.get(),
+                                                                   max_batch_size=DATABASE_CHROMA_CLIENT.get().get_max_batch_size())
+            timings.update(database_timings)
+        except Exception:
+            logger.exception("Error saving to database", extra={"documents": len(filenames)})
+            metrics.ERRORS.inc(stage="database_write")
+            return jsonify({"error": "Error saving the finalized files to database"}), 500
 
-            response.append({"filename": filename, "status": "finalized"})
+        try:
+            # keep the field index in sync with the database
+            phase_start = time.perf_counter()
+            FIELD_INDEX.upsert_documents({filename: final_data for filename, final_data in zip(filenames, final_datas)})
+            timings["field_index"] = time.perf_counter() - phase_start
+        except Exception:
+            logger.exception("Error saving to field index", extra={"documents": len(filenames)})
+            metrics.ERRORS.inc(stage="database_write")
+            return jsonify({"error": "Error saving the finalized files to the field index"}), 500
+        metrics.STAGE_SECONDS.observe(time.perf_counter() - database_start, stage="database_write")
 
-        # return response with success
-        return jsonify({"message": "All files successfully saved", "data": response}), 200
-    except Exception as e:
-        print(f"Error: {str(e)}")
+        if written_ids:
+            # cached search results may no longer match the database
+            SEARCH_RESULT_CACHE.clear()
+
+        written = set(written_ids)
+        response = [{"filename": filename, "status": "finalized" if filename in written else "unchanged"}
+                    for filename in filenames]
+        timings["total"] = time.perf_counter() - start
+
+        # return response with success along with the seconds spent in each phase
+        return jsonify({"message": "All files successfully saved", "data": response, "timings": timings}), 200
+    except Exception:
+        logger.exception("Finalize failed")
         return jsonify({"error": "An error occurred while finalizing the files"}), 400
 
+@app.route('/search', methods=['POST'])
+def search() -> tuple[Response, int]:
+    """
+    Searches the finalized JSONs in the database for the documents closest to each query text.
+    The request expects a JSON formatted as:
+    ```
+    {
+        "texts": ["multifamily in TX", "query2"],
+        "where": { "finalized": "True" },
+        "where_document": { "$contains": "string" },
+        "limit": 10,
+        "offset": 0
+    }
+    ```
+    Only `texts` is required, `where` and `where_document` follow the Chroma metadata and full text filter formats,
+    `limit` and `offset` page through the matches of each query text. The response is formatted as:
+    ```
+    {
+        "results": [
+            { "query": "multifamily in TX", "matches": [{ "id": "filename", "document": {...}, "matched_text": "...", "metadata": {...}, "distance": 0.1 }, ...] },
+            ...
+        ],
+        "limit": 10,
+        "offset": 0
+    }
+    ```
+    Documents are stored as field group chunks, the hits are collapsed to the finalized JSON they belong to with
+    `matched_text` holding the fields that matched and `distance` the distance of the closest chunk. `where_document`
+    is matched against each chunk on its own, so a filter whose terms are in different field groups of the same
+    document (e.g. an `$and` of two `$contains`) does not match that document.
+    Query embeddings and results are cached, the result cache is cleared whenever `/finalize` writes to the database.
+
+    Args:
+        None
+
+    Returns:
+        tuple[Response, int]: Response object and corresponding status code
+    """
+    try:
+        data = request.get_json()
+        if not isinstance(data, dict):
+            return jsonify({"error": "Request expects a JSON object"}), 400
+
+        texts = data.get("texts")
+        if isinstance(texts, str):
+            texts = [texts]
+        if not texts or not isinstance(texts, list) or not all(isinstance(text, str) and text for text in texts):
+            return jsonify({"error": "Request expects a non empty list of query texts under `texts`"}), 400
+
+        where = data.get("where") or None
+        where_document = data.get("where_document") or None
+        if not isinstance(where, (dict, type(None))) or not isinstance(where_document, (dict, type(None))):
+            return jsonify({"error": "`where` and `where_document` must be JSON objects"}), 400
+
+        limit = data.get("limit", SEARCH_DEFAULT_LIMIT)
+        offset = data.get("offset", 0)
+        if not isinstance(limit, int) or not isinstance(offset, int) or not 0 < limit <= SEARCH_MAX_LIMIT or offset < 0:
+            return jsonify({"error": f"`limit` must be between 1 and {SEARCH_MAX_LIMIT} and `offset` must not be negative"}), 400
+
+        result_key = json.dumps([SEARCH_RESULT_CACHE.generation, texts, where, where_document, limit, offset], sort_keys=True)
+        results = SEARCH_RESULT_CACHE.get(result_key)
+        if results is None:
+            query_result = database_query(DATABASE_COLLECTION.get(),
+                                          texts=texts,
+                                          results=limit,
+                                          offset=offset,
+                                          where_dict=where,
+                                          where_docs_dict=where_document,
+                                          embeddings=embed_queries(texts),
+                                          collapse_parents=True)
+            full_documents = FIELD_INDEX.get_documents(sorted({doc_id for ids in query_result["ids"] for doc_id in ids}))
+            results = []
+            for i, text in enumerate(texts):
+                matches = [{"id": doc_id,
+                            "document": full_documents.get(doc_id, document),
+                            "matched_text": document,
+                            "metadata": metadata,
+                            "distance": distance}
+                           for doc_id, document, metadata, distance in zip(query_result["ids"][i],
+                                                                           query_result["documents"][i],
+                                                                           query_result["metadatas"][i],
+                                                                           query_result["distances"][i])]
+                results.append({"query": text, "matches": matches})
+            SEARCH_RESULT_CACHE.put(result_key, results)
+
+        return jsonify({"results": results, "limit": limit, "offset": offset}), 200
+    except Exception:
+        logger.exception("Search failed")
+        return jsonify({"error": "An error occurred while searching the database"}), 400
+
+def embed_queries(texts: list[str]) -> list[list[float]]:
+    """
+    Embeds the query texts, reusing the embedding of any text that was already searched for
+
+    Args:
+        texts: the query texts
+
+    Returns:
+        list[list[float]]: the embedding of each text
+    """
+    embeddings = [QUERY_EMBEDDING_CACHE.get(text) for text in texts]
+    missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+    if missing:
+        new_embeddings = DATABASE_EMBEDDING_FUNCTION.get()([texts[i] for i in missing])
+        for i, embedding in zip(missing, new_embeddings):
+            embeddings[i] = [float(value) for value in embedding]
+            QUERY_EMBEDDING_CACHE.put(texts[i], embeddings[i])
+    return embeddings
+
+@app.route('/fields/query', methods=['POST'])
+def fields_query() -> tuple[Response, int]:
+    """
+    Finds the finalized JSONs whose fields match every given filter, using the structured field index rather than
+    vector similarity. The request expects a JSON formatted as:
+    ```
+    {
+        "filters": [
+            { "field": "units", "min": 100, "max": 200 },
+            { "field": "state", "equals": "TX" },
+            { "field": "address", "prefix": "123 main" }
+        ],
+        "limit": 100,
+        "offset": 0
+    }
+    ```
+    `equals` and `prefix` are case-insensitive, `min` and `max` are inclusive and also match values such as
+    `$1,250,000`, `5.25%` or `$5 million`. The response is formatted as:
+    ```
+    { "results": [{ "id": "filename", "document": {...} }, ...], "total": 1, "limit": 100, "offset": 0 }
+    ```
+
+    Args:
+        None
+
+    Returns:
+        tuple[Response, int]: Response object and corresponding status code
+    """
+    try:
+        data = request.get_json()
+        if not isinstance(data, dict) or not isinstance(data.get("filters", []), list):
+            return jsonify({"error": "Request expects a JSON object with a list of filters under `filters`"}), 400
+
+        limit = data.get("limit", FIELDS_DEFAULT_LIMIT)
+        offset = data.get("offset", 0)
+        if not isinstance(limit, int) or not isinstance(offset, int) or not 0 < limit <= FIELDS_MAX_LIMIT or offset < 0:
+            return jsonify({"error": f"`limit` must be between 1 and {FIELDS_MAX_LIMIT} and `offset` must not be negative"}), 400
+
+        try:
+            results, total = FIELD_INDEX.query(data.get("filters", []), limit=limit, offset=offset)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        return jsonify({"results": results, "total": total, "limit": limit, "offset": offset}), 200
+    except Exception:
+        logger.exception("Field query failed")
+        return jsonify({"error": "An error occurred while querying the field index"}), 400
+
+@app.route('/fields/export', methods=['GET'])
+def fields_export() -> Response:
+    """
+    Exports every finalized JSON in the field index as newline delimited JSON, one `{"id": ..., "document": ...}`
+    object per line. The export is streamed so it does not have to fit in memory.
+
+    Args:
+        None
+
+    Returns:
+        Response: the streamed NDJSON response
+    """
+    def generate():
+        for row in FIELD_INDEX.export():
+            yield json.dumps(row, ensure_ascii=False) + "\n"
+
+    return Response(generate(), mimetype="application/x-ndjson")
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics() -> Response:
+    """
+    Returns the metrics of the server in the Prometheus text format: the seconds spent in each stage of the pipeline
+    (extraction, OpenAI requests, JSON post processing and database writes), processed pages, OpenAI tokens, cache
+    hits and misses, errors by stage, and the amount of tasks waiting on each pool. See `observability.metrics`.
+
+    Args:
+        None
+
+    Returns:
+        Response: the metrics as text
+    """
+    return Response(metrics.REGISTRY.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+_BACKGROUND_WORK_STARTED = False
+_BACKGROUND_WORK_LOCK = threading.Lock()
+
+def start_background_work() -> None:
+    """
+    Warms up the database, the embedding model, the OpenAI backend and the extraction models and resumes the
+    unfinished upload jobs, once per process serving requests. Called when the server starts (see `create_app` and
+    `__main__`) rather than on import, so a second import of the server (tests, the batch ingestion workers, the
+    benchmarks) never loads the models or resubmits the same jobs. The parent process of the debug reloader only watches the source files and is skipped,
+    the reloaded child does the work.
+    """
+    global _BACKGROUND_WORK_STARTED
+    if app.debug and os.getenv("WERKZEUG_RUN_MAIN") != "true":
+        return
+    with _BACKGROUND_WORK_LOCK:
+        if _BACKGROUND_WORK_STARTED:
+            return
+        _BACKGROUND_WORK_STARTED = True
+
+    if WARM_UP_ON_START:
+        for resource in (DATABASE_EMBEDDING_FUNCTION, DATABASE_COLLECTION, OPENAI_BACKEND):
+            resource.warm_up()
+        if EXTRACTION_STRATEGY != "fast":
+            # starts EXTRACTION_PROCESSES workers, each loading the models
+            EXTRACTION_MODELS.warm_up()
+    if RESUME_JOBS_ON_START:
+        resume_unfinished_jobs()
+
+def create_app() -> Flask:
+    """
+    Application factory of `flask --app "server:create_app()" run` and WSGI servers, starts the background work
+
+    Returns:
+        Flask: the app
+    """
+    start_background_work()
+    return app
+
 if __name__ == '__main__':
+    app.debug = True
+    start_background_work()
     app.run(debug=True)
 
@@ -0,0 +1,116 @@
+import time
+import asyncio
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+from email.utils import formatdate
+import httpx
+import openai
+from transformation import async_backend
+from transformation.async_backend import AsyncOpenAIBackend, TokenBucket, retry_after_seconds
+
+
+def rate_limit_error(headers: dict[str, str] | None = None) -> openai.RateLimitError:
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    response = httpx.Response(429, headers=headers or {}, request=request)
+    return openai.RateLimitError("Rate limit reached", response=response, body=None)
+
+
+class FakeAsyncClient:
+    """Answers every request with the next of `outcomes`, an exception is raised instead of answered"""
+
+    def __init__(self, outcomes: list):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+        self.beta = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(parse=self.parse)))
+
+    async def parse(self, **kwargs):
+        self.calls += 1
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        choice = SimpleNamespace(message=SimpleNamespace(content=outcome), finish_reason="stop")
+        return SimpleNamespace(choices=[choice], usage=None)
+
+    async def close(self):
+        pass
+
+
+class TokenBucketTestCase(unittest.TestCase):
+    def test_refills_at_its_rate(self):
+        async def scenario() -> float:
+            # a full bucket of 60 tokens a minute refills one token a second
+            bucket = TokenBucket(60)
+            await bucket.acquire(60)
+            # emptied 30 seconds ago, half of the bucket is back
+            bucket.updated -= 30
+            await bucket.acquire(20)
+            return bucket.tokens
+
+        self.assertAlmostEqual(asyncio.run(scenario()), 10.0, places=1)
+
+    def test_blocks_until_enough_tokens(self):
+        async def scenario() -> float:
+            bucket = TokenBucket(600)
+            await bucket.acquire(600)
+            start = time.monotonic()
+            # 600 tokens a minute is 10 a second, 2 tokens take about 0.2s
+            await bucket.acquire(2)
+            return time.monotonic() - start
+
+        self.assertGreaterEqual(asyncio.run(scenario()), 0.15)
+
+    def test_disabled_bucket_never_blocks(self):
+        async def scenario() -> None:
+            bucket = TokenBucket(0)
+            for _ in range(1000):
+                await bucket.acquire(10 ** 6)
+
+        asyncio.run(asyncio.wait_for(scenario(), timeout=1))
+
+
+class RetryAfterTestCase(unittest.TestCase):
+    def test_reads_seconds_and_milliseconds(self):
+        self.assertEqual(retry_after_seconds(rate_limit_error({"retry-after": "7"})), 7.0)
+        self.assertEqual(retry_after_seconds(rate_limit_error({"retry-after-ms": "250", "retry-after": "7"})), 0.25)
+        self.assertIsNone(retry_after_seconds(rate_limit_error()))
+        self.assertIsNone(retry_after_seconds(ValueError("no response")))
+
+    def test_reads_http_dates(self):
+        delay = retry_after_seconds(rate_limit_error({"retry-after": formatdate(time.time() + 30, usegmt=True)}))
+        self.assertAlmostEqual(delay, 30, delta=2)
+        self.assertEqual(retry_after_seconds(rate_limit_error({"retry-after": formatdate(0, usegmt=True)})), 0.0)
+        self.assertIsNone(retry_after_seconds(rate_limit_error({"retry-after": "soon"})))
+
+
+class BackendRetryTestCase(unittest.TestCase):
+    def create_backend(self, outcomes: list, max_retries: int) -> tuple[AsyncOpenAIBackend, FakeAsyncClient]:
+        client = FakeAsyncClient(outcomes)
+        with mock.patch.object(async_backend, "create_async_client", return_value=client):
+            backend = AsyncOpenAIBackend("test", requests_per_minute=0, tokens_per_minute=0, max_retries=max_retries,
+                                         base_delay=0.01, max_delay=0.01)
+        self.addCleanup(backend.close)
+        return backend, client
+
+    def test_retries_rate_limits_then_succeeds(self):
+        backend, client = self.create_backend([rate_limit_error({"retry-after-ms": "10"}), rate_limit_error(), "{}"],
+                                              max_retries=2)
+        choice = backend.complete(model="gpt-4o-mini", messages=[{"role": "user", "content": "text"}])
+        self.assertEqual(choice.message.content, "{}")
+        self.assertEqual((client.calls, backend.retries), (3, 2))
+
+    def test_gives_up_after_max_retries(self):
+        backend, client = self.create_backend([rate_limit_error()] * 3, max_retries=2)
+        with self.assertRaises(openai.RateLimitError):
+            backend.complete(model="gpt-4o-mini", messages=[{"role": "user", "content": "text"}])
+        self.assertEqual(client.calls, 3)
+
+    def test_other_errors_are_not_retried(self):
+        backend, client = self.create_backend([ValueError("bad request"), "{}"], max_retries=2)
+        with self.assertRaises(ValueError):
+            backend.complete(model="gpt-4o-mini", messages=[])
+        self.assertEqual((client.calls, backend.retries), (1, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+from concurrent.futures import ThreadPoolExecutor
+import batch_ingest
+from batch_ingest import Checkpoint, find_pdfs, draft_documents, drafts_checkpoint_path, run
+
+
+class CheckpointTestCase(unittest.TestCase):
+    def test_resumes_from_completed_hashes(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "checkpoint.jsonl")
+            Checkpoint(path).add([("hash1", "a.pdf"), ("hash2", "b.pdf")])
+            # a line cut off by an interrupted run is ignored
+            with open(path, "a", encoding="utf-8") as f:
+                f.write('{"hash": "hash3", "pa')
+
+            self.assertEqual(Checkpoint(path).completed, {"hash1", "hash2"})
+
+    def test_finds_nested_pdfs_in_order(self):
+        with tempfile.TemporaryDirectory() as folder:
+            os.makedirs(os.path.join(folder, "2019"))
+            for name in ["b.pdf", "a.PDF", "notes.txt", os.path.join("2019", "c.pdf")]:
+                open(os.path.join(folder, name), "wb").close()
+
+            found = [os.path.relpath(path, folder) for path in find_pdfs(folder)]
+            self.assertEqual(found, [os.path.join("2019", "c.pdf"), "a.PDF", "b.pdf"])
+
+    def test_portfolio_properties_get_their_own_id(self):
+        self.assertEqual(draft_documents("om.pdf", {"units": "48"}), {"om.pdf": {"units": "48"}})
+        self.assertEqual(draft_documents("portfolio.pdf", [{"units": "48"}, {"units": "12"}]),
+                         {"portfolio.pdf_0": {"units": "48"}, "portfolio.pdf_1": {"units": "12"}})
+
+
+class RunTestCase(unittest.TestCase):
+    """`run` with the workers replaced by threads, PDFs named `bad*` fail to turn into a draft"""
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+        self.pdf_folder = os.path.join(self.folder.name, "pdfs")
+        os.makedirs(self.pdf_folder)
+        for name in ["a.pdf", "b.pdf", "bad.pdf"]:
+            with open(os.path.join(self.pdf_folder, name), "wb") as f:
+                f.write(f"%PDF-1.4 {name}".encode("utf-8"))
+        # the same PDF twice is only ingested once
+        with open(os.path.join(self.pdf_folder, "copy_of_a.pdf"), "wb") as f:
+            f.write(b"%PDF-1.4 a.pdf")
+        self.checkpoint_path = os.path.join(self.folder.name, "checkpoint.jsonl")
+
+        self.ingested: list[str] = []
+        self.written: list[dict] = []
+        self.write_error: Exception | None = None
+        for name, replacement in (("ingest_file", self.fake_ingest_file), ("write_documents", self.fake_write_documents),
+                                  ("ProcessPoolExecutor", self.thread_pool)):
+            patcher = mock.patch.object(batch_ingest, name, replacement)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    @staticmethod
+    def thread_pool(max_workers: int, mp_context, initializer) -> ThreadPoolExecutor:
+        return ThreadPoolExecutor(max_workers=max_workers)
+
+    def fake_ingest_file(self, path: str, doc_type: str) -> tuple[dict, int, dict[str, float]]:
+        name = os.path.basename(path)
+        self.ingested.append(name)
+        if name.startswith("bad"):
+            return {"error": "no text"}, 500, {}
+        return {"unique_id": name, "draft_json": {"name": name}}, 200, {"extraction": 0.1}
+
+    def fake_write_documents(self, documents: dict) -> None:
+        if self.write_error is not None:
+            raise self.write_error
+        self.written.append(documents)
+
+    def run_batch(self, write_database: bool = True) -> batch_ingest.BatchStats:
+        return run(self.pdf_folder, "om", workers=1, checkpoint_path=self.checkpoint_path, database_batch_size=64,
+                   write_database=write_database)
+
+    def test_resumes_after_failed_pdfs(self):
+        stats = self.run_batch()
+        self.assertEqual((stats.ingested, stats.failed, stats.skipped), (2, 1, 1))
+        self.assertEqual(self.written, [{"a.pdf": {"name": "a.pdf"}, "b.pdf": {"name": "b.pdf"}}])
+        self.assertEqual(len(Checkpoint(self.checkpoint_path).completed), 2)
+
+        self.ingested.clear()
+        stats = self.run_batch()
+        self.assertEqual(self.ingested, ["bad.pdf"])
+        self.assertEqual((stats.ingested, stats.failed, stats.skipped), (0, 1, 3))
+
+    def test_failed_database_write_is_not_checkpointed(self):
+        self.write_error = RuntimeError("database is locked")
+        stats = self.run_batch()
+        self.assertEqual((stats.ingested, stats.failed), (0, 3))
+        self.assertFalse(os.path.exists(self.checkpoint_path))
+
+        self.write_error = None
+        self.ingested.clear()
+        stats = self.run_batch()
+        self.assertEqual(sorted(self.ingested), ["a.pdf", "b.pdf", "bad.pdf"])
+        self.assertEqual(stats.ingested, 2)
+
+    def test_drafts_only_does_not_skip_a_later_full_run(self):
+        stats = self.run_batch(write_database=False)
+        self.assertEqual(stats.ingested, 2)
+        self.assertEqual(self.written, [])
+        self.assertFalse(os.path.exists(self.checkpoint_path))
+        self.assertEqual(len(Checkpoint(drafts_checkpoint_path(self.checkpoint_path)).completed), 2)
+
+        # a second drafts only run resumes from its own checkpoint
+        self.ingested.clear()
+        self.run_batch(write_database=False)
+        self.assertEqual(self.ingested, ["bad.pdf"])
+
+        self.ingested.clear()
+        stats = self.run_batch()
+        self.assertEqual(sorted(self.ingested), ["a.pdf", "b.pdf", "bad.pdf"])
+        self.assertEqual(stats.ingested, 2)
+        self.assertEqual(len(self.written), 1)
+
+    def test_drafts_checkpoint_path(self):
+        self.assertEqual(drafts_checkpoint_path("batch_checkpoint.jsonl"), "batch_checkpoint.drafts.jsonl")
+        self.assertEqual(drafts_checkpoint_path(os.path.join("runs", "oms")), os.path.join("runs", "oms.drafts.jsonl"))
+
+
+if __name__ == '__main__':
+    unittest.main()
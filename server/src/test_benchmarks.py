@@ -0,0 +1,101 @@
+import io
+import re
+import json
+import time
+import unittest
+import contextlib
+import urllib.request
+from benchmarks.synthetic_pdf import build_pdf, page_has_table
+from benchmarks.openai_stub import OpenAIStub, DEFAULT_CONTENT
+from benchmarks.load_test import LatencyModel, completion_content, find_saturation, percentile, main
+
+
+class SyntheticPdfTestCase(unittest.TestCase):
+    def test_xref_points_at_every_object(self):
+        pdf = build_pdf(pages=5, table_density=0.4)
+        xref = int(re.search(rb"startxref\n(\d+)", pdf).group(1))
+        self.assertTrue(pdf[xref:].startswith(b"xref"))
+
+        offsets = [int(offset) for offset in re.findall(rb"(\d{10}) 00000 n", pdf)]
+        # catalog, pages, font, then a page and its content stream for every page
+        self.assertEqual(len(offsets), 3 + 2 * 5)
+        for number, offset in enumerate(offsets, start=1):
+            self.assertTrue(pdf[offset:].startswith(f"{number} 0 obj".encode()), number)
+        self.assertIn(b"/Count 5", pdf)
+
+    def test_same_arguments_give_same_bytes(self):
+        self.assertEqual(build_pdf(3, 0.5, seed=1), build_pdf(3, 0.5, seed=1))
+        self.assertNotEqual(build_pdf(3, 0.5, seed=1), build_pdf(3, 0.5, seed=2))
+
+    def test_tables_are_spread_evenly(self):
+        self.assertEqual(sum(page_has_table(index, 0.2) for index in range(50)), 10)
+        self.assertEqual(sum(page_has_table(index, 0.0) for index in range(50)), 0)
+        self.assertEqual(sum(page_has_table(index, 1.0) for index in range(50)), 50)
+
+
+class OpenAIStubTestCase(unittest.TestCase):
+    def post(self, url: str, payload: dict) -> dict:
+        request = urllib.request.Request(url, data=json.dumps(payload).encode(),
+                                         headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(request) as response:
+            return json.loads(response.read())
+
+    def test_answers_like_chat_completions_after_latency(self):
+        with OpenAIStub(latency=0.1) as stub:
+            start = time.perf_counter()
+            completion = self.post(stub.base_url + "/chat/completions",
+                                   {"model": "gpt-4o-mini", "messages": [{"role": "user", "content": "x" * 40}]})
+            self.assertGreaterEqual(time.perf_counter() - start, 0.1)
+            self.assertEqual(stub.requests, 1)
+
+        self.assertEqual(completion["object"], "chat.completion")
+        self.assertEqual(completion["model"], "gpt-4o-mini")
+        self.assertEqual(completion["choices"][0]["message"]["content"], DEFAULT_CONTENT)
+        self.assertEqual(completion["usage"]["prompt_tokens"], 10)
+
+    def test_latency_and_content_can_be_functions(self):
+        portfolio_prompt = "portfolio prompt"
+        with OpenAIStub(latency=lambda: 0.05, content=completion_content(portfolio_prompt)) as stub:
+            start = time.perf_counter()
+            single = self.post(stub.base_url + "/chat/completions",
+                               {"messages": [{"role": "system", "content": "single prompt"}]})
+            self.assertGreaterEqual(time.perf_counter() - start, 0.05)
+            portfolio = self.post(stub.base_url + "/chat/completions",
+                                  {"messages": [{"role": "system", "content": portfolio_prompt}]})
+
+        self.assertIsInstance(json.loads(single["choices"][0]["message"]["content"]), dict)
+        self.assertIsInstance(json.loads(portfolio["choices"][0]["message"]["content"]), list)
+
+
+class LoadTestTestCase(unittest.TestCase):
+    def test_percentile_interpolates_between_ranks(self):
+        self.assertEqual(percentile([4, 1, 3, 2], 50), 2.5)
+        self.assertEqual(percentile([1, 2, 3, 4, 5], 90), 4.6)
+        self.assertEqual(percentile([7], 99), 7)
+        self.assertIsNone(percentile([], 50))
+
+    def test_saturation_is_where_throughput_stops_growing(self):
+        levels = [(1, 1.0, 2.0), (2, 1.9, 2.1), (4, 3.5, 3.0), (8, 3.6, 5.0), (16, 3.5, 9.0)]
+        self.assertEqual(find_saturation(levels), {"throughput_plateau": 4, "latency_knee": 8})
+        self.assertEqual(find_saturation(levels, p95_factor=10.0)["latency_knee"], None)
+        # throughput that keeps growing never saturates
+        self.assertIsNone(find_saturation([(1, 1.0, 1.0), (2, 2.0, 1.0)])["throughput_plateau"])
+
+    def test_latency_model(self):
+        self.assertAlmostEqual(LatencyModel(0.5, 0.0, scale=0.1).sample(), 0.05)
+        model = LatencyModel(1.0, 0.5, seed=1)
+        samples = [model() for _ in range(2001)]
+        # the median of a lognormal latency is the given median
+        self.assertAlmostEqual(percentile(samples, 50), 1.0, delta=0.05)
+        self.assertTrue(all(sample > 0 for sample in samples))
+
+    def test_threads_need_several_files_per_upload(self):
+        # the file processing pool is created per upload, checked before the server is imported
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            self.assertEqual(main(["--threads", "2,4", "--files-per-upload", "1"]), 1)
+        self.assertIn("--files-per-upload 1", output.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import os
+import time
+import tempfile
+import unittest
+from caching.disk_cache import DiskCache, make_key
+from caching.lru_cache import LRUCache
+
+
+class DiskCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+
+    def test_evicts_least_recently_used_over_max_bytes(self):
+        cache = DiskCache(self.folder.name, max_bytes=10)
+        cache.put("a", "1234")
+        cache.put("b", "1234")
+        self.assertEqual(cache.get("a"), "1234")
+        # `b` is the least recently used once `a` was read
+        cache.put("c", "1234")
+
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), "1234")
+        self.assertEqual(cache.get("c"), "1234")
+        self.assertEqual(cache.stats(), {"hits": 3, "misses": 1, "evictions": 1, "entries": 2, "bytes": 8})
+        self.assertEqual(sorted(os.listdir(self.folder.name)), ["a.txt", "c.txt"])
+
+    def test_values_larger_than_the_cache_are_not_stored(self):
+        cache = DiskCache(self.folder.name, max_bytes=4)
+        cache.put("a", "12345")
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.stats()["entries"], 0)
+
+    def test_entries_expire_after_ttl(self):
+        cache = DiskCache(self.folder.name, max_bytes=100, ttl_seconds=60)
+        cache.put("fresh", "value")
+        cache.put("stale", "value")
+        stored_long_ago = time.time() - 120
+        os.utime(os.path.join(self.folder.name, "stale.txt"), times=(stored_long_ago, stored_long_ago))
+
+        # the time an entry was stored is read back from disk
+        reloaded = DiskCache(self.folder.name, max_bytes=100, ttl_seconds=60)
+        self.assertEqual(reloaded.get("fresh"), "value")
+        self.assertIsNone(reloaded.get("stale"))
+        self.assertFalse(os.path.exists(os.path.join(self.folder.name, "stale.txt")))
+        self.assertEqual((reloaded.hits, reloaded.misses), (1, 1))
+
+    def test_processes_sharing_a_folder_evict_each_others_entries(self):
+        # two instances stand in for two processes, each with its own index
+        first = DiskCache(self.folder.name, max_bytes=10)
+        second = DiskCache(self.folder.name, max_bytes=10)
+        first.put("a", "1234")
+        second.put("b", "1234")
+        second.put("c", "1234")
+        self.assertEqual(first.get("b"), "1234")
+        # over the bound, the scan finds `c` and evicts the least recently used entries of both processes
+        first.put("d", "1234")
+
+        self.assertEqual(sorted(os.listdir(self.folder.name)), ["b.txt", "d.txt"])
+        self.assertEqual(first.evictions, 2)
+        self.assertEqual(first.stats()["bytes"], 8)
+        # the other process notices the evicted entries on its next read
+        self.assertIsNone(second.get("c"))
+        self.assertEqual(second.get("d"), "1234")
+
+    def test_make_key_separates_parts(self):
+        self.assertNotEqual(make_key("ab", "c"), make_key("a", "bc"))
+        self.assertEqual(make_key("ab", b"c"), make_key("ab", "c"))
+
+
+class LRUCacheTestCase(unittest.TestCase):
+    def test_evicts_least_recently_used_over_max_entries(self):
+        cache = LRUCache(max_entries=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        self.assertEqual(cache.get("a"), 1)
+        # `b` is the least recently used once `a` was read
+        cache.put("c", 3)
+
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual((cache.get("a"), cache.get("c")), (1, 3))
+        self.assertEqual(cache.stats(), {"hits": 3, "misses": 1, "entries": 2})
+
+    def test_clear_starts_a_new_generation(self):
+        cache = LRUCache(max_entries=2)
+        key = (cache.generation, "query")
+        cache.put(key, ["result"])
+        cache.clear()
+
+        self.assertIsNone(cache.get(key))
+        self.assertEqual(cache.generation, 1)
+        self.assertNotEqual((cache.generation, "query"), key)
+        self.assertEqual(cache.stats()["entries"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
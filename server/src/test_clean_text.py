@@ -0,0 +1,88 @@
+import random
+import unittest
+from clean_text import clean_text
+from clean_text.clean_text import clean_chunk, clean_full_chunk, iter_clean_text, iter_clean_elements
+
+
+# characters covering every branch of the reference tokenizer: numbers with periods, words, each kind of whitespace,
+# dashes, other punctuation, uppercase and non-ASCII characters
+ALPHABETS = [
+    "aZ9.-- \t\n\v\f\r\x1c\x1f,$%<>/é€",
+    "9.-a ",
+    "-- a\n",
+    "9.a\n \t\v",
+]
+
+EXAMPLES = [
+    "",
+    " ",
+    "\n",
+    "  leading and trailing  ",
+    "Year Built: 1998\n\nPrice - $1,250,000.00 — 5.25%\tcap",
+    "1.2.3.4 ... 5. .6 1..2",
+    "a---b----c-d",
+    " \n\t \v\f\r\n \x1c ",
+    "<table><tr><td>Unit Mix</td><td>2BR/2BA</td></tr></table>\n\n",
+    "Café Straße ÉTAGE naïve",
+]
+
+
+class CleanTextTestCase(unittest.TestCase):
+    def test_examples_match_reference(self):
+        for text in EXAMPLES:
+            with self.subTest(text=text):
+                self.assertEqual(clean_chunk(text), clean_full_chunk(text))
+
+    def test_random_text_matches_reference(self):
+        rng = random.Random(0)
+        for alphabet in ALPHABETS:
+            for _ in range(5000):
+                text = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 40)))
+                self.assertEqual(clean_chunk(text), clean_full_chunk(text), repr(text))
+
+    def test_large_text_matches_reference(self):
+        text = "".join(EXAMPLES) * 500
+        self.assertEqual(clean_chunk(text), clean_full_chunk(text))
+
+
+def split_randomly(text: str, rng: random.Random) -> list[str]:
+    cuts = sorted(rng.randint(0, len(text)) for _ in range(rng.randint(0, 6)))
+    return [text[start:end] for start, end in zip([0] + cuts, cuts + [len(text)])]
+
+
+class StreamingCleanerTestCase(unittest.TestCase):
+    def test_chunks_match_whole_text(self):
+        rng = random.Random(1)
+        for alphabet in ALPHABETS:
+            for _ in range(3000):
+                text = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 40)))
+                chunks = split_randomly(text, rng)
+                self.assertEqual("".join(iter_clean_text(chunks)), clean_chunk(text), repr(chunks))
+
+    def test_elements_are_cleaned_separately(self):
+        rng = random.Random(2)
+        for alphabet in ALPHABETS:
+            for _ in range(3000):
+                text = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 40)))
+                chunks = split_randomly(text, rng)
+                expected = "\n\n".join(clean_chunk(element) for element in text.split("\n\n"))
+                self.assertEqual("".join(iter_clean_elements(chunks)), expected, repr(chunks))
+
+    def test_text_without_whitespace_is_not_held_back(self):
+        text = "abc,def" * 20000
+        chunks = [text[start:start + 1000] for start in range(0, len(text), 1000)]
+        consumed = []
+
+        def tracked_chunks():
+            for chunk in chunks:
+                consumed.append(chunk)
+                yield chunk
+
+        cleaned = iter_clean_text(tracked_chunks())
+        # the first output arrives once MAX_CARRY_CHARS are held, long before the end of the text
+        self.assertTrue(next(cleaned))
+        self.assertLessEqual(len(consumed) * 1000, clean_text.MAX_CARRY_CHARS + 1000)
+        self.assertEqual("".join(iter_clean_text(chunks)), clean_chunk(text))
+
+if __name__ == '__main__':
+    unittest.main()
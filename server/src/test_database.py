@@ -0,0 +1,144 @@
+import unittest
+from database.field_index import FieldIndex, parse_number
+from database.database_handler import (PARENT_ID_KEY, CHUNK_INDEX_KEY, CHUNK_OVERSAMPLE, split_document,
+                                       database_upsert_chunks, database_query)
+
+
+class FakeCollection:
+    """An in memory stand in for the parts of `chromadb.Collection` used by the database handler"""
+
+    def __init__(self):
+        self.records: dict[str, dict] = {}
+        # distance of every record to any query, records are returned closest first
+        self.distances: dict[str, float] = {}
+        self.queried_n_results: list[int] = []
+
+    def get(self, ids=None, where=None, include=()):
+        if ids is not None:
+            found = [doc_id for doc_id in ids if doc_id in self.records]
+        else:
+            key, condition = next(iter(where.items()))
+            found = [doc_id for doc_id, record in self.records.items() if record["metadata"].get(key) in condition["$in"]]
+        return {"ids": found, "metadatas": [self.records[doc_id]["metadata"] for doc_id in found]}
+
+    def upsert(self, documents, embeddings, metadatas, ids):
+        for doc_id, document, embedding, metadata in zip(ids, documents, embeddings, metadatas):
+            self.records[doc_id] = {"document": document, "embedding": embedding, "metadata": metadata}
+
+    def query(self, query_texts, query_embeddings, n_results, where, where_document):
+        self.queried_n_results.append(n_results)
+        # only `$contains` and an `$and` of them are supported as full text filters
+        conditions = (where_document or {}).get("$and", [where_document] if where_document else [])
+        matching = [doc_id for doc_id, record in self.records.items()
+                    if all(condition["$contains"] in record["document"] for condition in conditions)]
+        hits = sorted(matching, key=lambda doc_id: self.distances[doc_id])[:n_results]
+        return {"ids": [hits],
+                "documents": [[self.records[doc_id]["document"] for doc_id in hits]],
+                "metadatas": [[self.records[doc_id]["metadata"] for doc_id in hits]],
+                "distances": [[self.distances[doc_id] for doc_id in hits]]}
+
+    def delete(self, ids):
+        for doc_id in ids:
+            self.records.pop(doc_id, None)
+
+
+def embed(documents: list[str]) -> list[list[float]]:
+    return [[float(len(document))] for document in documents]
+
+
+class UpsertChunksTestCase(unittest.TestCase):
+    def upsert(self, collection: FakeCollection, documents: dict) -> list[str]:
+        written, _ = database_upsert_chunks(collection,
+                                            documents=documents,
+                                            metadata_list=[{"finalized": "True"} for _ in documents],
+                                            embedding_function=embed,
+                                            max_batch_size=10,
+                                            max_chunk_chars=40)
+        return written
+
+    def test_reordered_keys_are_unchanged(self):
+        document = {"address": "123 Test Street", "units": "120", "amenities": {"pool": "yes", "gym": "no"},
+                    "year built": "1998"}
+        reordered = {"year built": "1998", "amenities": {"gym": "no", "pool": "yes"}, "units": "120",
+                     "address": "123 Test Street"}
+        self.assertEqual(split_document(document, 40), split_document(reordered, 40))
+
+        collection = FakeCollection()
+        self.assertEqual(self.upsert(collection, {"om.pdf": document}), ["om.pdf"])
+        self.assertEqual(self.upsert(collection, {"om.pdf": reordered}), [])
+
+    def test_shorter_document_removes_stale_chunks(self):
+        collection = FakeCollection()
+        self.upsert(collection, {"om.pdf": {"address": "123 Test Street", "units": "120", "year built": "1998"}})
+        self.assertEqual(self.upsert(collection, {"om.pdf": {"address": "123 Test Street"}}), ["om.pdf"])
+        self.assertEqual([record["metadata"][PARENT_ID_KEY] for record in collection.records.values()], ["om.pdf"])
+
+    def test_full_text_filters_match_each_chunk(self):
+        collection = FakeCollection()
+        self.upsert(collection, {"om.pdf": {"address": "123 Test Street", "units": "120", "year built": "1998"}})
+        collection.distances = {chunk_id: 0.0 for chunk_id in collection.records}
+
+        def query(where_document: dict) -> list[str]:
+            return database_query(collection, texts=["multifamily"], embeddings=[[0.0]], results=5,
+                                  where_docs_dict=where_document, collapse_parents=True)["ids"][0]
+
+        self.assertEqual(query({"$contains": "1998"}), ["om.pdf"])
+        self.assertEqual(query({"$and": [{"$contains": "Test Street"}, {"$contains": "units"}]}), ["om.pdf"])
+        # the address and the year built are split into different chunks
+        self.assertEqual(query({"$and": [{"$contains": "Test Street"}, {"$contains": "1998"}]}), [])
+
+
+class QueryParentsTestCase(unittest.TestCase):
+    def setUp(self):
+        # the closest parent has far more chunks than the oversampling covers, the others have one chunk each
+        self.collection = FakeCollection()
+        chunks = [("big.pdf", i) for i in range(3 * CHUNK_OVERSAMPLE)] + [(f"{i}.pdf", 0) for i in range(6)]
+        for distance, (parent_id, chunk_index) in enumerate(chunks):
+            chunk_id = f"{parent_id}#{chunk_index}"
+            self.collection.records[chunk_id] = {"document": f"chunk {chunk_id}", "embedding": [0.0],
+                                                 "metadata": {PARENT_ID_KEY: parent_id, CHUNK_INDEX_KEY: chunk_index}}
+            self.collection.distances[chunk_id] = float(distance)
+
+    def query(self, results: int, offset: int) -> list[str]:
+        query_result = database_query(self.collection, texts=["multifamily"], embeddings=[[0.0]], results=results,
+                                      offset=offset, collapse_parents=True)
+        return query_result["ids"][0]
+
+    def test_pages_over_distinct_parents(self):
+        pages = [self.query(results=2, offset=offset) for offset in (0, 2, 4, 6)]
+        self.assertEqual(pages, [["big.pdf", "0.pdf"], ["1.pdf", "2.pdf"], ["3.pdf", "4.pdf"], ["5.pdf"]])
+        self.assertEqual(self.query(results=7, offset=0), ["big.pdf"] + [f"{i}.pdf" for i in range(6)])
+
+    def test_fetches_more_chunks_until_enough_parents(self):
+        self.assertEqual(self.query(results=2, offset=0), ["big.pdf", "0.pdf"])
+        self.assertEqual(self.collection.queried_n_results, [2 * CHUNK_OVERSAMPLE, 4 * CHUNK_OVERSAMPLE])
+        self.assertEqual(self.query(results=3, offset=8), [])
+
+
+class FieldIndexTestCase(unittest.TestCase):
+    def test_parses_whole_numbers_only(self):
+        for value, expected in [("$1,250,000", 1250000), ("5.25%", 5.25), ("1.2M", 1.2e6), ("$5 million", 5e6),
+                                ("$2.5mm", 2.5e6), ("750K", 750e3), ("-0.5", -0.5), (120, 120.0)]:
+            with self.subTest(value=value):
+                self.assertEqual(parse_number(value), expected)
+        for value in ["20 Main St", "120 units", "1,25,000", "Built 1998", "12-24 months", True, None, ""]:
+            with self.subTest(value=value):
+                self.assertIsNone(parse_number(value))
+
+    def test_numeric_filters_skip_text_values(self):
+        index = FieldIndex(":memory:")
+        index.upsert_documents({
+            "a.pdf": {"Address": "20 Main St", "Price": "$5 million"},
+            "b.pdf": {"Address": "30", "Price": "$4,500,000"},
+        })
+
+        results, total = index.query([{"field": "address", "min": 10, "max": 25}])
+        self.assertEqual((results, total), ([], 0))
+        results, _ = index.query([{"field": "price", "min": "$4.8M"}])
+        self.assertEqual([result["id"] for result in results], ["a.pdf"])
+        results, _ = index.query([{"field": "price", "max": 4600000}])
+        self.assertEqual([result["id"] for result in results], ["b.pdf"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,100 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import unittest
+import numpy as np
+from database.embeddings import (EmbeddingProvider, EmbeddingCache, CachedEmbeddingFunction, OpenAIEmbeddingProvider,
+                                 create_embedding_function)
+
+
+class FakeProvider(EmbeddingProvider):
+    """Embeds a text as a vector filled with its length and records every batch it is given"""
+
+    def __init__(self, batch_size: int = 64, threads: int = 1):
+        super().__init__("fake", batch_size, threads)
+        self.batches: list[list[str]] = []
+        self._lock = threading.Lock()
+
+    def _embed_batch(self, texts: list[str]) -> list[np.ndarray]:
+        with self._lock:
+            self.batches.append(texts)
+        return [np.full(2, len(text), dtype=np.float32) for text in texts]
+
+
+class ProviderTestCase(unittest.TestCase):
+    def test_batches_keep_the_order_of_the_texts(self):
+        texts = ["a", "bb", "ccc", "dddd", "eeeee"]
+        for threads in (1, 3):
+            with self.subTest(threads=threads):
+                provider = FakeProvider(batch_size=2, threads=threads)
+                vectors = provider(texts)
+
+                self.assertEqual(sorted(len(batch) for batch in provider.batches), [1, 2, 2])
+                self.assertEqual([float(vector[0]) for vector in vectors], [1.0, 2.0, 3.0, 4.0, 5.0])
+
+    def test_factory_rejects_unusable_providers(self):
+        with self.assertRaises(ValueError):
+            create_embedding_function("word2vec")
+        with self.assertRaises(ValueError):
+            create_embedding_function("openai", api=None)
+
+    def test_factory_wraps_the_provider_in_a_bounded_cache(self):
+        with tempfile.TemporaryDirectory() as folder:
+            embedding_function = create_embedding_function("openai", api="key", batch_size=4096,
+                                                            cache_path=os.path.join(folder, "embeddings.sqlite3"),
+                                                            cache_max_entries=10)
+            self.addCleanup(embedding_function.cache.close)
+
+            self.assertIsInstance(embedding_function, CachedEmbeddingFunction)
+            self.assertIsInstance(embedding_function.provider, OpenAIEmbeddingProvider)
+            self.assertEqual(embedding_function.provider.batch_size, 2048)
+            self.assertEqual(embedding_function.cache.max_entries, 10)
+
+
+class CachedEmbeddingFunctionTestCase(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+        self.path = os.path.join(self.folder.name, "embeddings.sqlite3")
+
+    def create(self, max_entries: int) -> tuple[CachedEmbeddingFunction, FakeProvider]:
+        provider = FakeProvider()
+        cache = EmbeddingCache(self.path, max_entries=max_entries)
+        self.addCleanup(cache.close)
+        return CachedEmbeddingFunction(provider, cache), provider
+
+    def test_repeated_texts_are_embedded_once(self):
+        embedding_function, provider = self.create(max_entries=100)
+        vectors = embedding_function(["a", "bb", "a"])
+        self.assertEqual(provider.batches, [["a", "bb"]])
+        self.assertEqual([float(vector[0]) for vector in vectors], [1.0, 2.0, 1.0])
+
+        embedding_function(["bb", "a"])
+        self.assertEqual(provider.batches, [["a", "bb"]])
+        self.assertEqual(embedding_function.cache.stats(), {"hits": 2, "misses": 2, "evictions": 0, "entries": 2})
+
+        # the vectors are read back from disk by a new process
+        reloaded, reloaded_provider = self.create(max_entries=100)
+        reloaded(["a", "bb"])
+        self.assertEqual(reloaded_provider.batches, [])
+
+    def test_cache_stays_within_max_entries(self):
+        embedding_function, provider = self.create(max_entries=3)
+        for text in ["a", "bb", "ccc", "dddd", "eeeee"]:
+            embedding_function([text])
+        self.assertEqual(embedding_function.cache.stats()["evictions"], 2)
+        # the least recently used vectors were evicted
+        embedding_function(["ccc", "dddd", "eeeee"])
+        self.assertEqual(len(provider.batches), 5)
+
+        # a single call embedding more texts than the cache holds
+        embedding_function(["f", "gg", "hhh", "iiii"])
+        stats = embedding_function.cache.stats()
+        self.assertEqual((stats["entries"], stats["evictions"]), (3, 6))
+        with sqlite3.connect(self.path) as connection:
+            self.assertEqual(connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0], 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
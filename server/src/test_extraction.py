@@ -0,0 +1,93 @@
+import os
+import hashlib
+import tempfile
+import unittest
+from unittest import mock
+from concurrent.futures import ThreadPoolExecutor
+from benchmarks.synthetic_pdf import write_pdf
+from text_extraction import partition, page_classifier
+from text_extraction import unstructured_extract
+from text_extraction.page_classifier import classify_pages, FAST_STRATEGY, HI_RES_STRATEGY
+from benchmarks.synthetic_pdf import page_has_table
+
+
+def fake_partition_pdf(filename: str, strategy: str = "auto", starting_page_number: int = 1, **kwargs) -> list:
+    """Stand-in for unstructured's `partition_pdf` returning one element per page derived from the page's content,
+    so a page range split from a PDF gets the same elements as in the whole PDF"""
+    from pypdf import PdfReader
+    from unstructured.documents.elements import NarrativeText, ElementMetadata
+
+    elements = []
+    for page_number, page in enumerate(PdfReader(filename).pages, start=starting_page_number):
+        digest = hashlib.sha256(page.get_contents().get_data()).hexdigest()
+        elements.append(NarrativeText(text=f"Page {page_number} {digest}",
+                                      metadata=ElementMetadata(page_number=page_number)))
+    return elements
+
+
+class ParallelExtractionTestCase(unittest.TestCase):
+    def setUp(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.pdf_path = write_pdf(os.path.join(folder.name, "om.pdf"), pages=7, table_density=0.3)
+
+        self.strategies = []
+
+        def partition_pdf(filename, strategy="auto", **kwargs):
+            self.strategies.append(strategy)
+            return fake_partition_pdf(filename, strategy=strategy, **kwargs)
+
+        partition.set_partition_pdf(partition_pdf)
+        self.addCleanup(partition.set_partition_pdf, None)
+        # the fake only replaces the partition of this process, the page ranges run on threads instead
+        pool = ThreadPoolExecutor(max_workers=2)
+        self.addCleanup(pool.shutdown)
+        for patcher in (mock.patch.object(unstructured_extract, "get_process_pool", lambda workers: pool),
+                        # the models are not needed by the fake, loading them would partition the warm up PDF
+                        mock.patch.object(unstructured_extract.MODELS, "ensure_loaded", return_value=0.0)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def extract(self, strategy: str, workers: int) -> str:
+        return "".join(unstructured_extract.iter_partition_text(self.pdf_path, strategy, infer_table=True,
+                                                                workers=workers, pages_per_chunk=3))
+
+    def test_parallel_text_matches_serial(self):
+        for strategy in ("fast", "hi_res", "auto"):
+            with self.subTest(strategy=strategy):
+                serial = self.extract(strategy, workers=1)
+                self.strategies.clear()
+                parallel = self.extract(strategy, workers=2)
+                self.assertEqual(parallel, serial)
+                # 7 pages in ranges of 3
+                self.assertEqual(len(self.strategies), 3)
+
+    def test_auto_is_resolved_for_the_whole_pdf(self):
+        self.extract("auto", workers=2)
+        self.assertEqual(self.strategies, ["hi_res"] * 3)
+
+
+class PageClassifierTestCase(unittest.TestCase):
+    def setUp(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.pdf_path = write_pdf(os.path.join(folder.name, "om.pdf"), pages=10, table_density=0.3)
+
+    def test_table_pages_go_to_hi_res(self):
+        expected = [HI_RES_STRATEGY if page_has_table(index, 0.3) else FAST_STRATEGY for index in range(10)]
+        self.assertIn(HI_RES_STRATEGY, expected)
+        self.assertIn(FAST_STRATEGY, expected)
+        self.assertEqual(classify_pages(self.pdf_path), expected)
+
+    def test_thresholds_are_part_of_the_cache_key(self):
+        adaptive_key = unstructured_extract.extraction_cache_key(self.pdf_path, "adaptive", True)
+        hi_res_key = unstructured_extract.extraction_cache_key(self.pdf_path, "hi_res", True)
+        with mock.patch.object(page_classifier, "MIN_TABLE_LINES", 40):
+            self.assertNotEqual(unstructured_extract.extraction_cache_key(self.pdf_path, "adaptive", True), adaptive_key)
+            self.assertEqual(unstructured_extract.extraction_cache_key(self.pdf_path, "hi_res", True), hi_res_key)
+            # without enough ruling lines the table pages are plain text
+            self.assertEqual(classify_pages(self.pdf_path), [FAST_STRATEGY] * 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
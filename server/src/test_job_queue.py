@@ -0,0 +1,112 @@
+import os
+import json
+import tempfile
+import unittest
+from jobs.job_queue import JobStore, JobQueue, JOB_QUEUED, JOB_RUNNING, JOB_DONE, JOB_FAILED
+
+
+class JobStoreTestCase(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+
+    def test_round_trip_through_disk(self):
+        store = JobStore(self.folder.name)
+        store.create("job1", filename="om.pdf", doc_type="om", file_path="uploads/job1_om.pdf")
+        store.update("job1", status=JOB_DONE, status_code=200, result={"units": "48"})
+
+        job = JobStore(self.folder.name).get("job1")
+        self.assertEqual(job["status"], JOB_DONE)
+        self.assertEqual(job["status_code"], 200)
+        self.assertEqual(job["result"], {"units": "48"})
+        self.assertEqual(job["filename"], "om.pdf")
+        self.assertGreaterEqual(job["updated_at"], job["created_at"])
+        self.assertIsNone(store.get("missing"))
+
+    def test_failed_write_keeps_previous_version(self):
+        store = JobStore(self.folder.name)
+        store.create("job1", filename="om.pdf")
+        with self.assertRaises(TypeError):
+            # not JSON serializable, the dump fails half way through
+            store.update("job1", status=JOB_DONE, result={"units": object()})
+
+        self.assertEqual(os.listdir(self.folder.name), ["job1.json"])
+        with open(os.path.join(self.folder.name, "job1.json"), "r", encoding="utf-8") as f:
+            self.assertEqual(json.load(f)["status"], JOB_QUEUED)
+        self.assertEqual(store.get("job1")["status"], JOB_QUEUED)
+
+    def test_unfinished_jobs_are_resumed_from_disk(self):
+        store = JobStore(self.folder.name)
+        for job_id in ("first", "second", "finished"):
+            store.create(job_id, filename=f"{job_id}.pdf")
+        store.update("second", status=JOB_RUNNING)
+        store.update("finished", status=JOB_DONE, status_code=200)
+        with open(os.path.join(self.folder.name, "broken.json"), "w", encoding="utf-8") as f:
+            f.write('{"job_id": "bro')
+
+        resumed = JobStore(self.folder.name).unfinished_jobs()
+        self.assertEqual([job["job_id"] for job in resumed], ["first", "second"])
+
+    def test_finished_jobs_expire(self):
+        store = JobStore(self.folder.name, retention_seconds=60)
+        for job_id in ("old", "recent", "queued"):
+            store.create(job_id)
+        store.update("old", status=JOB_DONE)
+        store.update("recent", status=JOB_FAILED)
+        # finished long ago, only unfinished jobs are kept past the retention
+        for job_id in ("old", "queued"):
+            with open(os.path.join(self.folder.name, f"{job_id}.json"), "r", encoding="utf-8") as f:
+                job = json.load(f)
+            with open(os.path.join(self.folder.name, f"{job_id}.json"), "w", encoding="utf-8") as f:
+                json.dump({**job, "created_at": 0, "updated_at": 0}, f)
+
+        reloaded = JobStore(self.folder.name, retention_seconds=60)
+        self.assertIsNone(reloaded.get("old"))
+        self.assertEqual(reloaded.get("recent")["status"], JOB_FAILED)
+        self.assertEqual(reloaded.get("queued")["status"], JOB_QUEUED)
+        self.assertEqual(sorted(os.listdir(self.folder.name)), ["queued.json", "recent.json"])
+
+
+class JobQueueTestCase(unittest.TestCase):
+    def test_records_status_of_each_job(self):
+        with tempfile.TemporaryDirectory() as folder:
+            store = JobStore(folder)
+            queue = JobQueue(store, max_workers=2)
+            for job_id in ("ok", "rejected", "crashed"):
+                store.create(job_id)
+
+            def crash() -> tuple[dict, int]:
+                raise RuntimeError("boom")
+
+            futures = [queue.submit("ok", lambda: ({"units": "48"}, 200)),
+                       queue.submit("rejected", lambda: ({"error": "no text"}, 400)),
+                       queue.submit("crashed", crash)]
+            for future in futures:
+                future.result()
+            queue.shutdown()
+
+            self.assertEqual(store.get("ok")["status"], JOB_DONE)
+            self.assertEqual(store.get("ok")["result"], {"units": "48"})
+            self.assertEqual(store.get("rejected")["status"], JOB_FAILED)
+            self.assertEqual(store.get("rejected")["status_code"], 400)
+            self.assertEqual(store.get("crashed")["status_code"], 500)
+            self.assertIn("boom", store.get("crashed")["result"]["error"])
+            self.assertEqual(store.unfinished_jobs(), [])
+
+    def test_result_that_cannot_be_saved_fails_the_job(self):
+        with tempfile.TemporaryDirectory() as folder:
+            store = JobStore(folder)
+            queue = JobQueue(store, max_workers=1)
+            store.create("unserializable")
+
+            queue.submit("unserializable", lambda: ({"units": object()}, 200)).result()
+            queue.shutdown()
+
+            job = JobStore(folder).get("unserializable")
+            self.assertEqual(job["status"], JOB_FAILED)
+            self.assertEqual(job["status_code"], 500)
+            self.assertIn("failed to save its result", job["result"]["error"])
+
+
+if __name__ == '__main__':
+    unittest.main()
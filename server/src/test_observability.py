@@ -0,0 +1,79 @@
+import json
+import logging
+import unittest
+from concurrent.futures import Future
+from observability.metrics import Registry, Counter, Gauge, Histogram, QUEUE_DEPTH, track_queue
+from observability.logs import JsonFormatter, TextFormatter
+
+
+class MetricsTestCase(unittest.TestCase):
+    def test_histogram_buckets_are_cumulative(self):
+        registry = Registry()
+        histogram = Histogram("stage_seconds", "Seconds per stage", ("stage",), buckets=(0.1, 1.0), registry=registry)
+        for value in (0.05, 0.5, 0.5, 5.0):
+            histogram.observe(value, stage="extraction")
+
+        lines = registry.render().splitlines()
+        self.assertIn('stage_seconds_bucket{stage="extraction",le="0.1"} 1', lines)
+        self.assertIn('stage_seconds_bucket{stage="extraction",le="1"} 3', lines)
+        self.assertIn('stage_seconds_bucket{stage="extraction",le="+Inf"} 4', lines)
+        self.assertIn('stage_seconds_sum{stage="extraction"} 6.05', lines)
+        self.assertIn('stage_seconds_count{stage="extraction"} 4', lines)
+        self.assertIn("# TYPE stage_seconds histogram", lines)
+
+    def test_counters_gauges_and_functions(self):
+        registry = Registry()
+        errors = Counter("errors_total", "Errors", ("stage",), registry=registry)
+        depth = Gauge("queue_depth", "Depth", ("pool",), registry=registry)
+        hits = Counter("cache_hits_total", "Hits", ("cache",), registry=registry)
+        errors.inc(stage="extraction")
+        errors.inc(2, stage="extraction")
+        depth.inc(pool="upload")
+        depth.dec(pool="upload")
+        hits.set_function(lambda: 7, cache="llm")
+        hits.set_function(lambda: 1 / 0, cache="broken")
+
+        lines = registry.render().splitlines()
+        self.assertIn('errors_total{stage="extraction"} 3', lines)
+        self.assertIn('queue_depth{pool="upload"} 0', lines)
+        self.assertIn('cache_hits_total{cache="llm"} 7', lines)
+        # a value that cannot be read is left out instead of failing the scrape
+        self.assertFalse(any('cache="broken"' in line for line in lines))
+        with self.assertRaises(ValueError):
+            errors.inc(-1, stage="extraction")
+        with self.assertRaises(ValueError):
+            errors.inc(pool="extraction")
+        with self.assertRaises(ValueError):
+            Counter("errors_total", "Errors", registry=registry)
+
+    def test_queue_depth_follows_futures(self):
+        before = QUEUE_DEPTH.value(pool="test")
+        future = Future()
+        track_queue(future, "test")
+        self.assertEqual(QUEUE_DEPTH.value(pool="test"), before + 1)
+        future.set_result(None)
+        self.assertEqual(QUEUE_DEPTH.value(pool="test"), before)
+
+
+class LogFormatTestCase(unittest.TestCase):
+    def record(self) -> logging.LogRecord:
+        record = logging.LogRecord("server", logging.INFO, __file__, 1, "Extracted text", None, None)
+        record.uuid = "1234"
+        record.chars = 5120
+        return record
+
+    def test_json_keeps_extra_fields(self):
+        entry = json.loads(JsonFormatter().format(self.record()))
+        self.assertEqual(entry["level"], "INFO")
+        self.assertEqual(entry["logger"], "server")
+        self.assertEqual(entry["message"], "Extracted text")
+        self.assertEqual(entry["uuid"], "1234")
+        self.assertEqual(entry["chars"], 5120)
+
+    def test_text_appends_extra_fields(self):
+        line = TextFormatter().format(self.record())
+        self.assertTrue(line.endswith("INFO server: Extracted text uuid=1234 chars=5120"), line)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+# the server creates its folders and indexes in the working directory and loads its models on start up, keep both out
+# of the tests
+os.environ["WARM_UP_ON_START"] = "false"
+os.chdir(tempfile.mkdtemp())
+import server
+from server import app
+from database.field_index import FieldIndex
+
+
+class FakeCollection:
+    """An in memory stand in for `chromadb.Collection`, the distance of a chunk is how far its length is from the query's"""
+
+    def __init__(self):
+        self.records: dict[str, dict] = {}
+        self.queries = 0
+
+    def get(self, ids=None, where=None, include=()):
+        if ids is not None:
+            found = [doc_id for doc_id in ids if doc_id in self.records]
+        else:
+            key, condition = next(iter(where.items()))
+            found = [doc_id for doc_id, record in self.records.items() if record["metadata"].get(key) in condition["$in"]]
+        return {"ids": found, "metadatas": [self.records[doc_id]["metadata"] for doc_id in found]}
+
+    def upsert(self, documents, embeddings, metadatas, ids):
+        for doc_id, document, embedding, metadata in zip(ids, documents, embeddings, metadatas):
+            self.records[doc_id] = {"document": document, "embedding": embedding, "metadata": metadata}
+
+    def delete(self, ids):
+        for doc_id in ids:
+            self.records.pop(doc_id, None)
+
+    def query(self, query_texts, query_embeddings, n_results, where, where_document):
+        self.queries += 1
+        result = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        for query_embedding in query_embeddings:
+            distances = {doc_id: abs(record["embedding"][0] - query_embedding[0]) for doc_id, record in self.records.items()}
+            hits = sorted(distances, key=distances.get)[:n_results]
+            result["ids"].append(hits)
+            result["documents"].append([self.records[doc_id]["document"] for doc_id in hits])
+            result["metadatas"].append([self.records[doc_id]["metadata"] for doc_id in hits])
+            result["distances"].append([distances[doc_id] for doc_id in hits])
+        return result
+
+
+def embed(texts: list[str]) -> list[list[float]]:
+    return [[float(len(text))] for text in texts]
+
+
+class SearchCacheTestCase(unittest.TestCase):
+    """`/search` and `/finalize` with the database replaced by an in memory collection"""
+
+    def setUp(self):
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+        self.collection = FakeCollection()
+
+        resources = {
+            "DATABASE_COLLECTION": SimpleNamespace(get=lambda: self.collection),
+            "DATABASE_EMBEDDING_FUNCTION": SimpleNamespace(get=lambda: embed),
+            "DATABASE_CHROMA_CLIENT": SimpleNamespace(get=lambda: SimpleNamespace(get_max_batch_size=lambda: 100)),
+            "FIELD_INDEX": FieldIndex(":memory:"),
+        }
+        for name, resource in resources.items():
+            patcher = mock.patch.object(server, name, resource)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        server.SEARCH_RESULT_CACHE.clear()
+        server.QUERY_EMBEDDING_CACHE.clear()
+
+    def finalize(self, documents: dict[str, dict]) -> list[str]:
+        response = self.client.post("/finalize", json=[{filename: document} for filename, document in documents.items()])
+        self.assertEqual(response.status_code, 200)
+        return [result["status"] for result in response.get_json()["data"]]
+
+    def search(self, text: str) -> list[str]:
+        response = self.client.post("/search", json={"texts": [text], "limit": 5})
+        self.assertEqual(response.status_code, 200)
+        return [match["id"] for match in response.get_json()["results"][0]["matches"]]
+
+    def test_repeated_search_is_cached(self):
+        self.finalize({"a.pdf": {"address": "1 Main St"}})
+        self.assertEqual(self.search("main street"), ["a.pdf"])
+        self.assertEqual(self.search("main street"), ["a.pdf"])
+        self.assertEqual(self.collection.queries, 1)
+
+    def test_finalize_invalidates_cached_results(self):
+        self.finalize({"a.pdf": {"address": "1 Main St"}})
+        self.assertEqual(self.search("main street"), ["a.pdf"])
+
+        self.assertEqual(self.finalize({"b.pdf": {"address": "2 Main St"}}), ["finalized"])
+        self.assertEqual(sorted(self.search("main street")), ["a.pdf", "b.pdf"])
+        self.assertEqual(self.collection.queries, 2)
+
+    def test_unchanged_finalize_keeps_cached_results(self):
+        self.finalize({"a.pdf": {"address": "1 Main St"}})
+        self.search("main street")
+        generation = server.SEARCH_RESULT_CACHE.generation
+
+        self.assertEqual(self.finalize({"a.pdf": {"address": "1 Main St"}}), ["unchanged"])
+        self.search("main street")
+        self.assertEqual(server.SEARCH_RESULT_CACHE.generation, generation)
+        self.assertEqual(self.collection.queries, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+import os
+import sys
+import json
+import tempfile
+import unittest
+import subprocess
+
+# importing the server must stay cheap, the database, the embedding model and OpenAI are only loaded on first use
+IMPORT_TIME_BUDGET_SECONDS = 3.0
+DEFERRED_MODULES = ["chromadb", "unstructured", "openai", "onnxruntime", "torch", "numpy", "pdfminer", "pypdf"]
+
+IMPORT_SCRIPT = f"""
+import sys, json, time
+start = time.perf_counter()
+import server
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "loaded": [name for name in {DEFERRED_MODULES!r} if name in sys.modules]}}))
+"""
+
+
+class StartupTestCase(unittest.TestCase):
+    def test_import_time_budget(self):
+        src_folder = os.path.dirname(os.path.abspath(__file__))
+        env = {**os.environ, "PYTHONPATH": src_folder, "WARM_UP_ON_START": "false"}
+        # the server creates its folders in the working directory, keep them out of the source tree
+        with tempfile.TemporaryDirectory() as work_folder:
+            # a job left queued by an earlier run, only resumed once the server starts serving
+            os.makedirs(os.path.join(work_folder, "jobs"))
+            job_path = os.path.join(work_folder, "jobs", "queued.json")
+            with open(job_path, "w", encoding="utf-8") as f:
+                json.dump({"job_id": "queued", "status": "queued", "created_at": 0, "file_path": "missing.pdf"}, f)
+
+            output = subprocess.run([sys.executable, "-c", IMPORT_SCRIPT], cwd=work_folder, env=env,
+                                    capture_output=True, text=True, check=True).stdout
+            with open(job_path, "r", encoding="utf-8") as f:
+                job_status = json.load(f)["status"]
+        report = json.loads(output.strip().splitlines()[-1])
+
+        self.assertEqual(report["loaded"], [], "heavy modules were imported at start up")
+        self.assertLess(report["seconds"], IMPORT_TIME_BUDGET_SECONDS)
+        self.assertEqual(job_status, "queued", "jobs were resumed on import")
+
+
+if __name__ == '__main__':
+    unittest.main()
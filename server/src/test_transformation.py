@@ -0,0 +1,124 @@
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+from caching.disk_cache import DiskCache
+from transformation.openai_client import is_cacheable
+from transformation.chunking import split_text, count_tokens, merge_drafts, merge_portfolios, ELEMENT_SEPARATOR
+from transformation.relevance_filter import filter_relevant, chunk_budget, DEFAULT_KEYWORDS
+
+
+class FakeBackend:
+    """Answers every request with the given finish reason and content"""
+
+    def __init__(self, finish_reason: str, content: str):
+        self.choice = SimpleNamespace(finish_reason=finish_reason,
+                                      message=SimpleNamespace(role="assistant", content=content))
+        self.requests = 0
+
+    def complete(self, **kwargs):
+        self.requests += 1
+        return self.choice
+
+
+class ResponseCacheTestCase(unittest.TestCase):
+    def test_only_complete_json_is_cacheable(self):
+        self.assertTrue(is_cacheable("stop", '{"Units": "48"}'))
+        self.assertTrue(is_cacheable("stop", '[{"Units": "48"}]'))
+        self.assertFalse(is_cacheable("length", '{"Units": "48"}'))
+        self.assertFalse(is_cacheable("content_filter", '{"Units": "48"}'))
+        self.assertFalse(is_cacheable("stop", '{"Units": "4'))
+        self.assertFalse(is_cacheable("stop", ""))
+        self.assertFalse(is_cacheable("stop", None))
+
+    def test_truncated_responses_are_not_cached(self):
+        from transformation import gpt, gptPortfolio
+
+        with tempfile.TemporaryDirectory() as folder:
+            prompt_path = os.path.join(folder, "prompt.txt")
+            with open(prompt_path, "w", encoding="utf-8") as f:
+                f.write('Extract "Units" as JSON')
+            for module in (gpt, gptPortfolio):
+                previous_path = module.PROMPT_FILE_PATH
+                module.PROMPT_FILE_PATH = prompt_path
+                try:
+                    cache = DiskCache(os.path.join(folder, module.__name__), max_bytes=1024 * 1024, suffix=".json")
+                    truncated = FakeBackend("length", '{"Units": "4')
+                    module.request("om", "key", "Units: 48", cache=cache, backend=truncated)
+                    module.request("om", "key", "Units: 48", cache=cache, backend=truncated)
+                    self.assertEqual(truncated.requests, 2, module.__name__)
+                    self.assertEqual(cache.stats()["entries"], 0, module.__name__)
+
+                    complete = FakeBackend("stop", '{"Units": "48"}')
+                    module.request("om", "key", "Units: 48", cache=cache, backend=complete)
+                    self.assertEqual(cache.stats()["entries"], 1, module.__name__)
+                finally:
+                    module.PROMPT_FILE_PATH = previous_path
+
+
+class RelevanceChunkingTestCase(unittest.TestCase):
+    def setUp(self):
+        relevant = [f"Unit {index}: rent ${1000 + index:,} occupancy {90 + index % 10}%" for index in range(120)]
+        filler = [" ".join(["the property offers residents a unique opportunity"] * 3) for _ in range(120)]
+        # relevant and filler elements take turns, the filter has to drop every filler element
+        self.text = ELEMENT_SEPARATOR.join(element for pair in zip(relevant, filler) for element in pair)
+        self.chunk_tokens = count_tokens(ELEMENT_SEPARATOR.join(relevant)) // 3
+
+    def test_filtered_text_is_still_chunked(self):
+        budget = chunk_budget(self.chunk_tokens, 2)
+        filtered, before, after = filter_relevant(self.text, budget, DEFAULT_KEYWORDS)
+        self.assertLessEqual(after, budget)
+        self.assertLess(after, before)
+        self.assertNotIn("unique opportunity", filtered)
+
+        chunks = split_text(filtered, self.chunk_tokens)
+        self.assertGreater(len(chunks), 1)
+        self.assertLessEqual(len(chunks), 3)
+        self.assertTrue(all(count_tokens(chunk) <= self.chunk_tokens for chunk in chunks))
+
+    def test_budget_of_one_chunk_is_never_chunked(self):
+        filtered, _, _ = filter_relevant(self.text, chunk_budget(self.chunk_tokens, 1), DEFAULT_KEYWORDS)
+        self.assertEqual(len(split_text(filtered, self.chunk_tokens)), 1)
+        self.assertEqual(chunk_budget(self.chunk_tokens, 0), 0)
+
+
+class MergeTestCase(unittest.TestCase):
+    def test_first_non_empty_value_wins(self):
+        drafts = [
+            {"Property Name": "Oak Apartments", "Units": "", "Year Built": None, "Amenities": []},
+            {"Property Name": "Oak Apts", "Units": "120", "Year Built": "1998", "Amenities": ["Pool"]},
+            {"Units": "118", "Year Built": "", "Occupancy": {}},
+        ]
+        self.assertEqual(merge_drafts(drafts), {"Property Name": "Oak Apartments", "Units": "120",
+                                                "Year Built": "1998", "Amenities": ["Pool"], "Occupancy": {}})
+
+    def test_fields_keep_the_order_they_are_first_found_in(self):
+        merged = merge_drafts([{"b": "", "a": "1"}, {"c": "3", "b": "2"}])
+        self.assertEqual(list(merged), ["b", "a", "c"])
+        self.assertEqual(merge_drafts([]), {})
+
+    def test_properties_split_across_chunks_are_merged(self):
+        chunks = [
+            [{"Address": "12 Main St", "Units": "48"}, {"Address": "86 Street NE", "Units": ""}],
+            # the end of the second property, and a property with the same address written differently
+            [{"Address": "86  street ne", "Units": "24", "Year Built": "1970"},
+             {"Address": "5 Elm Rd", "Units": "10"}],
+            [{"Property Name": "Unnamed lot"}, {"Units": "3"}, {"Units": "4"}],
+        ]
+        self.assertEqual(merge_portfolios(chunks), [
+            {"Address": "12 Main St", "Units": "48"},
+            {"Address": "86 Street NE", "Units": "24", "Year Built": "1970"},
+            {"Address": "5 Elm Rd", "Units": "10"},
+            {"Property Name": "Unnamed lot"},
+            # without an address or a name a property cannot be recognized, it is never merged
+            {"Units": "3"},
+            {"Units": "4"},
+        ])
+
+    def test_first_value_wins_for_duplicate_properties(self):
+        chunks = [[{"Address": "12 Main St", "Units": "48"}], [{"Address": "12 MAIN ST", "Units": "50"}]]
+        self.assertEqual(merge_portfolios(chunks), [{"Address": "12 Main St", "Units": "48"}])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+import io
+import os
+import json
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+# the server saves the uploads and creates its folders in the working directory and loads its models on start up,
+# keep both out of the tests
+os.environ["WARM_UP_ON_START"] = "false"
+os.chdir(tempfile.mkdtemp())
+import server
+from server import app
+
+
+class UploadTestCase(unittest.TestCase):
+    """`/upload` with the processing of each saved file replaced, files named `bad*` fail"""
+
+    def setUp(self):
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+        self.processed: list[str] = []
+        self.processed_lock = threading.Lock()
+        # set to let the files named `slow*` finish
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+
+        patcher = mock.patch.object(server, "process_saved_file", side_effect=self.fake_process_saved_file)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def fake_process_saved_file(self, unique_id: str, filename: str, doc_type: str, filepath: str,
+                                progress=server.no_progress) -> tuple[dict, int]:
+        with self.processed_lock:
+            self.processed.append(filename)
+        if filename.startswith("slow"):
+            self.release.wait(timeout=10)
+        progress("extraction", "started")
+        progress("extraction", "finished")
+        if filename.startswith("bad"):
+            return {"error": f"Error processing file {filename}"}, 500
+        return {"unique_id": unique_id, "draft_json": {"doc_type": doc_type}}, 200
+
+    def post(self, filenames: list[str], query: str = "", **kwargs):
+        data = {
+            "file": [(io.BytesIO(b"%PDF-1.4"), filename) for filename in filenames],
+            "doc_types": ["om" for _ in filenames],
+        }
+        return self.client.post(f"/upload{query}", data=data, content_type="multipart/form-data", **kwargs)
+
+    def test_ndjson_stream_events(self):
+        response = self.post(["first.pdf", "bad.pdf", "third.pdf"], "?stream=ndjson")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, "application/x-ndjson")
+        events = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+        self.assertEqual(events[-1], {"event": "done", "succeeded": 2, "failed": 1})
+        results = {event["index"]: event for event in events if event["event"] == "result"}
+        self.assertEqual(sorted(results), [0, 1, 2])
+        self.assertEqual(results[1]["status"], 500)
+        self.assertIn("error", results[1]["data"])
+        self.assertEqual(results[2]["data"]["draft_json"], {"doc_type": "om"})
+        for index in results:
+            file_events = [event for event in events if event.get("index") == index]
+            # the progress of a file comes before its result
+            self.assertEqual([(event["event"], event.get("status")) for event in file_events],
+                             [("progress", "started"), ("progress", "finished"), ("result", results[index]["status"])])
+
+    def test_sse_stream_events(self):
+        response = self.post(["first.pdf", "bad.pdf"], "?stream=sse")
+        self.assertEqual(response.mimetype, "text/event-stream")
+        messages = [message for message in response.get_data(as_text=True).split("\n\n") if message]
+
+        names = [message.splitlines()[0] for message in messages]
+        self.assertEqual(names.count("event: progress"), 4)
+        self.assertEqual(names.count("event: result"), 2)
+        self.assertEqual(names[-1], "event: done")
+        self.assertEqual(json.loads(messages[-1].splitlines()[1][len("data: "):]),
+                         {"event": "done", "succeeded": 1, "failed": 1})
+
+    def test_stream_disconnect_drops_files_that_did_not_start(self):
+        with mock.patch.object(server, "MAX_FILE_PROCESSING_THREADS", 1):
+            response = self.post(["first.pdf", "slow.pdf", "never.pdf"], "?stream=ndjson", buffered=False)
+            for line in response.response:
+                if json.loads(line)["event"] == "result":
+                    break
+            # the client disconnects while the second file is running
+            response.close()
+            self.release.set()
+
+        self.assertNotIn("never.pdf", self.processed)
+
+    def test_buffered_upload_stops_on_first_error(self):
+        with mock.patch.object(server, "MAX_FILE_PROCESSING_THREADS", 1):
+            response = self.post(["bad.pdf", "slow.pdf", "never.pdf"])
+            self.release.set()
+
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(response.get_json(), {"error": "Error processing file bad.pdf"})
+        self.assertNotIn("never.pdf", self.processed)
+
+    def test_buffered_upload_returns_results_in_order(self):
+        response = self.post(["first.pdf", "second.pdf"])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result["draft_json"] for result in response.get_json()], [{"doc_type": "om"}] * 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
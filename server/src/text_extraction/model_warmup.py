@@ -0,0 +1,83 @@
+"""
+Loads the layout detection and table structure models of unstructured once per process, ahead of the first request
+
+The first `hi_res` partition in a process loads the layout detection model, and the first table found loads the table
+structure model. Without warming up, that cost lands on whichever upload comes first, once in the server and again in
+every extraction worker. `MODELS` loads both by partitioning a tiny bundled PDF. unstructured keeps loaded models in
+module level registries, so every later partition in the same process reuses them. Extraction workers call
+`init_worker` when they start, so page ranges never wait on a model load.
+
+`MODELS.ensure_loaded` returns the seconds it spent loading, which lets extraction report model load time separately
+from inference time.
+"""
+
+import os
+import time
+import logging
+import threading
+from observability.logs import configure_logging
+from text_extraction import partition
+
+
+logger = logging.getLogger(__name__)
+
+WARMUP_PDF_PATH = os.path.join(os.path.dirname(__file__), "assets", "warmup.pdf")
+
+# strategies that can run the layout detection model, `fast` only reads the text layer
+MODEL_STRATEGIES = frozenset({"hi_res", "auto"})
+
+
+class ModelHolder:
+    """Loads the unstructured models at most once per process"""
+
+    def __init__(self):
+        self.loaded = False
+        self.load_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def ensure_loaded(self) -> float:
+        """
+        Loads the models if this process did not load them yet, other threads wait for the same load
+
+        Returns:
+            float: the amount of seconds this call spent loading the models, 0 if they were already loaded
+        """
+        if self.loaded:
+            return 0.0
+        with self._lock:
+            if self.loaded:
+                return 0.0
+            start = time.perf_counter()
+            load_models()
+            self.load_seconds = time.perf_counter() - start
+            self.loaded = True
+            return self.load_seconds
+
+
+def load_models() -> None:
+    """Partitions the bundled PDF with hi_res and table inference, then loads the table structure model"""
+    partition.partition_pdf(WARMUP_PDF_PATH, strategy="hi_res", infer_table_structure=True)
+    if partition.is_replaced():
+        # a fake partition (see `partition.set_partition_pdf`) does not use the table structure model
+        return
+    try:
+        # only loaded once a table is found, which the bundled PDF does not have
+        from unstructured_inference.models.tables import load_agent
+        load_agent()
+    except ImportError:
+        pass
+
+
+MODELS = ModelHolder()
+
+
+def init_worker() -> None:
+    """Initializer of the extraction worker processes, see `get_process_pool`"""
+    # spawned workers start without the logging configuration of the server, the environment holds the same settings
+    configure_logging()
+    try:
+        seconds = MODELS.ensure_loaded()
+        logger.info("Extraction worker loaded its models", extra={"pid": os.getpid(), "seconds": round(seconds, 2)})
+    except Exception:
+        # the worker still runs, the models are loaded again by the first partition that needs them
+        logger.exception("Extraction worker could not load its models", extra={"pid": os.getpid()})
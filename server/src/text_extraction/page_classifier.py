@@ -0,0 +1,149 @@
+"""
+Cheap pre-pass that decides, page by page, which Unstructured strategy a PDF page needs
+
+Pages are inspected with pdfminer without running layout analysis, only the raw objects of each page are counted
+(`extract_pages` always analyzes the layout, even with `laparams=None`, so the pages are interpreted directly):
+    - the amount of characters in the embedded text layer, scanned pages have little to none and need OCR
+    - the share of the page covered by images, image heavy pages may hold text that only OCR can read
+    - the amount of ruling lines and rectangles, a high amount usually means the page holds a table
+
+Pages that match any of the above are partitioned with `hi_res` so OCR and table inference run on them, every
+other page is plain text and is partitioned with `fast`.
+
+Dependencies:
+    1. pip install pdfminer.six (installed with unstructured[pdf])
+
+pdfminer is only imported once a PDF is classified, so importing the server does not load it
+"""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Iterator
+
+if TYPE_CHECKING:
+    from pdfminer.layout import LTComponent, LTPage
+
+
+FAST_STRATEGY = "fast"
+HI_RES_STRATEGY = "hi_res"
+
+# pages with fewer characters in their text layer are treated as scanned
+MIN_TEXT_CHARS = 100
+# pages with a larger share of their area covered by images need OCR
+MAX_IMAGE_COVERAGE = 0.3
+# pages with at least this many lines and rectangles are treated as holding a table
+MIN_TABLE_LINES = 12
+
+
+def classifier_settings() -> str:
+    """
+    Returns:
+        str: the thresholds pages are classified with, part of the extraction cache key of the `adaptive` strategy
+    """
+    return f"{MIN_TEXT_CHARS}:{MAX_IMAGE_COVERAGE}:{MIN_TABLE_LINES}"
+
+
+def iter_raw_pages(pdf_path: str) -> Iterator[LTPage]:
+    """
+    Interprets each page into its raw characters, images and curves, an aggregator without `laparams` skips
+    grouping them into lines and boxes
+
+    Args:
+        pdf_path: a str representing the path to the PDF file (.pdf)
+
+    Returns:
+        Iterator[LTPage]: the objects of each page, in page order
+    """
+    from pdfminer.converter import PDFPageAggregator
+    from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+    from pdfminer.pdfpage import PDFPage
+
+    resource_manager = PDFResourceManager()
+    device = PDFPageAggregator(resource_manager, laparams=None)
+    interpreter = PDFPageInterpreter(resource_manager, device)
+    with open(pdf_path, "rb") as f:
+        for page in PDFPage.get_pages(f):
+            interpreter.process_page(page)
+            yield device.get_result()
+
+
+def page_features(page: LTPage) -> tuple[int, float, int]:
+    """
+    Counts the characters, image coverage and ruling lines of a page
+
+    Args:
+        page: the pdfminer page, see `iter_raw_pages`
+
+    Returns:
+        tuple[int, float, int]: the amount of characters, the share of the page covered by images (0 to 1), and the amount of lines and rectangles
+    """
+    from pdfminer.layout import LTChar, LTContainer, LTCurve, LTImage
+
+    chars = 0
+    image_area = 0.0
+    lines = 0
+    stack: list[LTComponent] = list(page)
+    while stack:
+        obj = stack.pop()
+        if isinstance(obj, LTChar):
+            chars += 1
+        elif isinstance(obj, LTImage):
+            image_area += obj.width * obj.height
+        elif isinstance(obj, LTCurve):
+            # LTLine and LTRect are both LTCurves
+            lines += 1
+        if isinstance(obj, LTContainer):
+            # figures can hold nested characters, images and lines
+            stack.extend(obj)
+
+    page_area = page.width * page.height
+    coverage = min(image_area / page_area, 1.0) if page_area else 0.0
+    return chars, coverage, lines
+
+
+def classify_page(chars: int, image_coverage: float, lines: int) -> str:
+    """
+    Args:
+        chars: the amount of characters in the page's text layer
+        image_coverage: the share of the page covered by images (0 to 1)
+        lines: the amount of lines and rectangles drawn on the page
+
+    Returns:
+        str: the strategy the page should be partitioned with, `hi_res` or `fast`
+    """
+    if chars < MIN_TEXT_CHARS or image_coverage > MAX_IMAGE_COVERAGE or lines >= MIN_TABLE_LINES:
+        return HI_RES_STRATEGY
+    return FAST_STRATEGY
+
+
+def classify_pages(pdf_path: str) -> list[str]:
+    """
+    Args:
+        pdf_path: a str representing the path to the PDF file (.pdf)
+
+    Returns:
+        list[str]: the strategy each page should be partitioned with, in page order
+    """
+    return [classify_page(*page_features(page)) for page in iter_raw_pages(pdf_path)]
+
+
+def group_pages(strategies: list[str], pages_per_chunk: int = 0) -> list[tuple[int, int, str]]:
+    """
+    Groups consecutive pages that share a strategy into page ranges
+
+    Args:
+        strategies: the strategy of each page, in page order
+        pages_per_chunk: the maximum amount of pages in a range, ranges are not limited if 0 or less
+
+    Returns:
+        list[tuple[int, int, str]]: the first page (starting at 1), the last page (inclusive), and the strategy of each range, in page order
+    """
+    ranges: list[tuple[int, int, str]] = []
+    for page, strategy in enumerate(strategies, start=1):
+        if ranges:
+            first, last, range_strategy = ranges[-1]
+            if range_strategy == strategy and (pages_per_chunk <= 0 or last - first + 1 < pages_per_chunk):
+                ranges[-1] = (first, page, strategy)
+                continue
+        ranges.append((page, page, strategy))
+    return ranges
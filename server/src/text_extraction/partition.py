@@ -0,0 +1,49 @@
+"""
+The `partition_pdf` every extraction goes through, replaceable by a function of the same signature
+
+`benchmarks.load_test` plugs in a fake with realistic latencies so the whole server can be load tested offline,
+without the layout models. Only the current process is affected, fakes are meant to be used with
+`EXTRACTION_PROCESSES=1`.
+"""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Any, Callable
+
+if TYPE_CHECKING:
+    from unstructured.documents.elements import Element
+
+
+PartitionFunction = Callable[..., "list[Element]"]
+
+_REPLACEMENT: PartitionFunction | None = None
+
+
+def set_partition_pdf(func: PartitionFunction | None) -> None:
+    """
+    Args:
+        func: called instead of unstructured's `partition_pdf` with the same arguments, None restores it
+    """
+    global _REPLACEMENT
+    _REPLACEMENT = func
+
+
+def is_replaced() -> bool:
+    return _REPLACEMENT is not None
+
+
+def partition_pdf(filename: str, **kwargs: Any) -> list[Element]:
+    """
+    Partitions the PDF with unstructured's `partition_pdf`, or with the function given to `set_partition_pdf`
+
+    Args:
+        filename: a str representing the path to the PDF file (.pdf)
+        kwargs: the arguments of `partition_pdf` (strategy, infer_table_structure, starting_page_number, ...)
+
+    Returns:
+        list[Element]: the elements of the PDF
+    """
+    if _REPLACEMENT is not None:
+        return _REPLACEMENT(filename, **kwargs)
+    from unstructured.partition.pdf import partition_pdf as unstructured_partition_pdf
+    return unstructured_partition_pdf(filename, **kwargs)
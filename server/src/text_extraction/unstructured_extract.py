@@ -6,48 +6,379 @@ Dependencies:
         - ensure it is available in the system's path
     2. pip install unstructured
     3. pip install unstructured[pdf,ocr]
+        - also installs pypdf which is used to split PDFs into page ranges
+
+unstructured is only imported once a PDF is partitioned, importing it loads most of its models' dependencies, and
+pypdf once a PDF is counted or split
 """
 
+from __future__ import annotations
+
+import os
+import time
+import logging
+import tempfile
+import threading
+import multiprocessing
+from typing import TYPE_CHECKING, Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor
+from caching.disk_cache import DiskCache, make_key, hash_file
+from text_extraction.page_classifier import classify_pages, classifier_settings, group_pages, HI_RES_STRATEGY
+from text_extraction.model_warmup import MODELS, MODEL_STRATEGIES, init_worker
+from text_extraction.partition import partition_pdf
+from observability.metrics import track_queue
+
+if TYPE_CHECKING:
+    from unstructured.documents.elements import Element
+
+
+logger = logging.getLogger(__name__)
+
+# classifies every page and only partitions the pages that need it with hi_res
+ADAPTIVE_STRATEGY = "adaptive"
+# lets unstructured choose between fast, hi_res and ocr_only for the whole PDF, see `resolve_strategy`
+AUTO_STRATEGY = "auto"
+
+# process pool shared by every page parallel extraction, created on first use
+_PROCESS_POOL: ProcessPoolExecutor | None = None
+_PROCESS_POOL_WORKERS = 0
+_PROCESS_POOL_LOCK = threading.Lock()
+
+
+def extraction_cache_key(pdf_path: str, strategy: str, infer_table: bool) -> str:
+    """
+    Builds the extraction cache key of a PDF file from the SHA-256 of its bytes and the extraction parameters,
+    including the page classification thresholds for the `adaptive` strategy
+
+    Args:
+        pdf_path: a str representing the path to the PDF file (.pdf)
+        strategy: the text extraction method used
+        infer_table: whether tables are inferred
+
+    Returns:
+        str: the cache key
+    """
+    if strategy == ADAPTIVE_STRATEGY:
+        return make_key(hash_file(pdf_path), strategy, str(infer_table), classifier_settings())
+    return make_key(hash_file(pdf_path), strategy, str(infer_table))
+
+
+def iter_element_texts(elements: Iterable[Element]) -> Iterator[str]:
+    """Yields the relevant text of each element followed by a blank line, tables are kept in their html format to preserve table structure
+
+    Args:
+        elements: the elements returned by `partition_pdf`
+
+    Returns:
+        Iterator[str]: the extracted text of each element that has any
+    """
+    from unstructured.documents.elements import Text, Table
+
+    for elem in elements:
+        extract_text = ""
+        # for tables, append their html format to preserve table structure
+        if isinstance(elem, Table):
+            extract_text = elem.metadata.text_as_html or ""
+        # for general text, treat normally
+        elif isinstance(elem, Text):
+            extract_text = elem.text
+        # yield extracted text from current elem
+        if extract_text:
+            # filter out characters that can't be encoded in UTF-8
+            cleaned_text = extract_text.encode("utf-8", errors="ignore").decode("utf-8", errors="ignore")
+            yield f"{cleaned_text}\n\n"
+
+
+def elements_to_text(elements: Iterable[Element]) -> str:
+    """
+    Args:
+        elements: the elements returned by `partition_pdf`
+
+    Returns:
+        str: the extracted text with each element separated by a blank line
+    """
+    return "".join(iter_element_texts(elements))
+
+
+def get_process_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    Returns the shared process pool used for page parallel extraction, the pool is recreated if a different
+    amount of workers is requested. Workers are spawned rather than forked since the server runs threads, and load
+    the unstructured models as soon as they start (see `model_warmup`).
+
+    Args:
+        workers: the amount of worker processes
+
+    Returns:
+        ProcessPoolExecutor: the shared process pool
+    """
+    global _PROCESS_POOL, _PROCESS_POOL_WORKERS
+    with _PROCESS_POOL_LOCK:
+        if _PROCESS_POOL is None or _PROCESS_POOL_WORKERS != workers:
+            if _PROCESS_POOL is not None:
+                _PROCESS_POOL.shutdown(wait=False)
+            _PROCESS_POOL = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                                initializer=init_worker)
+            _PROCESS_POOL_WORKERS = workers
+        return _PROCESS_POOL
+
+
+def warm_up(workers: int = 1) -> float:
+    """
+    Loads the unstructured models in the current process and, with more than one worker, starts every worker of the
+    shared process pool so each loads its own models before the first PDF arrives
+
+    Args:
+        workers: the amount of worker processes, see `iter_text`
+
+    Returns:
+        float: the amount of seconds spent loading the models in the current process
+    """
+    seconds = MODELS.ensure_loaded()
+    if workers > 1:
+        pool = get_process_pool(workers)
+        # the pool spawns a worker for every task submitted while the others are busy
+        for future in [pool.submit(time.sleep, 0.1) for _ in range(workers)]:
+            future.result()
+    return seconds
+
+
+def add_timings(timings: dict[str, float] | None, model_load: float, inference: float) -> None:
+    """Adds the seconds spent loading models and partitioning to `timings`, if given"""
+    if timings is not None:
+        timings["model_load"] = timings.get("model_load", 0.0) + model_load
+        timings["inference"] = timings.get("inference", 0.0) + inference
+
+
+def count_pages(pdf_path: str) -> int:
+    """
+    Args:
+        pdf_path: a str representing the path to the PDF file (.pdf)
+
+    Returns:
+        int: the amount of pages of the PDF
+    """
+    from pypdf import PdfReader
+
+    return len(PdfReader(pdf_path).pages)
+
+
+def resolve_strategy(pdf_path: str, strategy: str, infer_table: bool) -> str:
+    """
+    Resolves `auto` once for the whole PDF the way unstructured resolves it: `hi_res` when tables are inferred,
+    otherwise `fast` when the PDF has a text layer and `ocr_only` when it does not. Partitioning page ranges with
+    `auto` would let every range decide on its own pages, so a range without text could be OCRed while the whole
+    PDF would not be.
+
+    Args:
+        pdf_path: a str representing the path to the PDF file (.pdf)
+        strategy: the requested strategy, every other strategy is returned as is
+        infer_table: whether tables are inferred
+
+    Returns:
+        str: the strategy every page range is partitioned with
+    """
+    from pypdf import PdfReader
+
+    if strategy != AUTO_STRATEGY:
+        return strategy
+    if infer_table:
+        return HI_RES_STRATEGY
+    has_text = any((page.extract_text() or "").strip() for page in PdfReader(pdf_path).pages)
+    return "fast" if has_text else "ocr_only"
+
+
+def split_pdf(pdf_path: str, page_ranges: list[tuple[int, int]], out_folder: str) -> list[str]:
+    """
+    Splits the given PDF into smaller PDFs, one for each page range
+
+    Args:
+        pdf_path: a str representing the path to the PDF file (.pdf)
+        page_ranges: the first page (starting at 1) and last page (inclusive) of each smaller PDF
+        out_folder: a str representing the directory the smaller PDFs are written to
+
+    Returns:
+        list[str]: the path to each smaller PDF, in the same order as `page_ranges`
+    """
+    from pypdf import PdfReader, PdfWriter
+
+    reader = PdfReader(pdf_path)
+    chunk_paths = []
+    for first_page, last_page in page_ranges:
+        writer = PdfWriter()
+        for page in reader.pages[first_page - 1:last_page]:
+            writer.add_page(page)
+        chunk_path = os.path.join(out_folder, f"pages_{first_page}_{last_page}.pdf")
+        with open(chunk_path, "wb") as chunk_file:
+            writer.write(chunk_file)
+        chunk_paths.append(chunk_path)
+    return chunk_paths
+
+
+def partition_pages(pdf_path: str, first_page: int, strategy: str, infer_table: bool) -> tuple[str, float, float]:
+    """
+    Extracts the text of a PDF containing a range of pages of the original PDF, runs in a worker process
+    when the extraction is parallel
+
+    Args:
+        pdf_path: a str representing the path to the PDF file holding the range of pages (.pdf)
+        first_page: the page number of the first page in the original PDF
+        strategy: what text extraction method to use
+        infer_table: whether to infer tables
+
+    Returns:
+        tuple[str, float, float]: the extracted text of the pages, the seconds spent loading models (0 once the process loaded them) and the seconds spent partitioning
+    """
+    model_load = MODELS.ensure_loaded() if strategy in MODEL_STRATEGIES else 0.0
+    start = time.perf_counter()
+    elements = partition_pdf(pdf_path, strategy=strategy, infer_table_structure=infer_table, starting_page_number=first_page)
+    text = elements_to_text(elements)
+    return text, model_load, time.perf_counter() - start
+
+
+def iter_partition_ranges(pdf_path: str, page_ranges: list[tuple[int, int, str]], infer_table: bool, workers: int,
+                          timings: dict[str, float] | None = None) -> Iterator[str]:
+    """
+    Partitions each page range of the given PDF with its own strategy and yields the text of each range in page order
+
+    Args:
+        pdf_path: a str representing the path to the PDF file (.pdf)
+        page_ranges: the first page (starting at 1), last page (inclusive), and strategy of each range, in page order
+        infer_table: whether to infer tables
+        workers: the amount of worker processes, ranges are partitioned one after another in the current process if 1 or less
+        timings: optional dict the seconds spent on `model_load` and `inference` are added to
+
+    Returns:
+        Iterator[str]: the extracted text of each range
+    """
+    with tempfile.TemporaryDirectory() as chunk_folder:
+        chunk_paths = split_pdf(pdf_path, [(first, last) for first, last, _ in page_ranges], chunk_folder)
+        if workers <= 1:
+            for chunk_path, (first, _, strategy) in zip(chunk_paths, page_ranges):
+                text, model_load, inference = partition_pages(chunk_path, first, strategy, infer_table)
+                add_timings(timings, model_load, inference)
+                yield text
+            return
+
+        pool = get_process_pool(workers)
+        futures = [pool.submit(partition_pages, chunk_path, first, strategy, infer_table)
+                   for chunk_path, (first, _, strategy) in zip(chunk_paths, page_ranges)]
+        for future in futures:
+            track_queue(future, "extraction")
+        # results are yielded in submission order which is page order
+        for future in futures:
+            text, model_load, inference = future.result()
+            add_timings(timings, model_load, inference)
+            yield text
+
+
+def iter_partition_text(pdf_path: str, strategy: str, infer_table: bool, workers: int = 1, pages_per_chunk: int = 0,
+                        timings: dict[str, float] | None = None) -> Iterator[str]:
+    """
+    Extracts the text of the given PDF file. With more than one worker the PDF is split into ranges of
+    `pages_per_chunk` pages that are partitioned in parallel across a process pool and merged back in page order.
+    `auto` is resolved for the whole PDF before it is split (see `resolve_strategy`) so every range is partitioned
+    with the strategy the whole PDF would be, the text then matches partitioning the whole PDF at once as long as
+    partitioning a page does not depend on the other pages, which holds for the layout, OCR and table models.
+
+    With the `adaptive` strategy each page is classified first and only the pages that need it (scanned, image heavy
+    or table pages) are partitioned with `hi_res`, the remaining pages are partitioned with `fast`.
+
+    Args:
+        pdf_path: a str representing the path to the PDF file (.pdf)
+        strategy: what text extraction method to use
+        infer_table: whether to infer tables
+        workers: the amount of worker processes, the PDF is partitioned in the current process if 1 or less
+        pages_per_chunk: the amount of pages partitioned by a worker at a time, the PDF is partitioned in the current process if 0 or less
+        timings: optional dict the seconds spent on `model_load` and `inference` are added to
+
+    Returns:
+        Iterator[str]: the extracted text, one element or page range at a time
+    """
+    if strategy == ADAPTIVE_STRATEGY:
+        page_strategies = classify_pages(pdf_path)
+        logger.info("Adaptive strategy classified the pages",
+                    extra={"hi_res_pages": page_strategies.count(HI_RES_STRATEGY), "pages": len(page_strategies)})
+        yield from iter_partition_ranges(pdf_path, group_pages(page_strategies, pages_per_chunk), infer_table, workers, timings)
+        return
+
+    page_count = count_pages(pdf_path) if workers > 1 and pages_per_chunk > 0 else 0
+    if page_count > pages_per_chunk:
+        strategy = resolve_strategy(pdf_path, strategy, infer_table)
+        page_ranges = [(first, min(first + pages_per_chunk - 1, page_count), strategy)
+                       for first in range(1, page_count + 1, pages_per_chunk)]
+        yield from iter_partition_ranges(pdf_path, page_ranges, infer_table, workers, timings)
+        return
+
+    model_load = MODELS.ensure_loaded() if strategy in MODEL_STRATEGIES else 0.0
+    start = time.perf_counter()
+    # first get all elements in the pdf
+    elements = partition_pdf(pdf_path, strategy=strategy, infer_table_structure=infer_table)
+    add_timings(timings, model_load, time.perf_counter() - start)
+    # then yield the relevant text from each element
+    yield from iter_element_texts(elements)
+
+
+def iter_text(pdf_path: str, strategy: str = "auto", infer_table: bool = True, cache: DiskCache | None = None,
+              workers: int = 1, pages_per_chunk: int = 0, timings: dict[str, float] | None = None) -> Iterator[str]:
+    """Extracts text from the given PDF file via `pdf_path` using Unstructured and yields it as it is extracted,
+    without going through a file. Joining the yielded strs gives the same text `extract_text` writes to its output file.
+    The arguments are the same as the ones of `extract_text`.
+
+    Args:
+        pdf_path: a str representing the path to the PDF file (.pdf)
+        strategy: what text extraction method to use, see `extract_text`
+        infer_table: whether to infer tables, only has an effect if current strategy is `hi_res`
+        cache: optional extraction cache, the text is only stored once the whole PDF was extracted
+        workers: the amount of worker processes to partition page ranges with
+        pages_per_chunk: the amount of pages in each page range partitioned by a worker
+        timings: optional dict the seconds spent on `model_load` and `inference` are added to, nothing is added on a cache hit
+
+    Returns:
+        Iterator[str]: the cleaned text of each element (or of each page range when partitioning in parallel)
+    """
+    if cache is None:
+        yield from iter_partition_text(pdf_path, strategy, infer_table, workers, pages_per_chunk, timings)
+        return
+
+    cache_key = extraction_cache_key(pdf_path, strategy, infer_table)
+    text = cache.get(cache_key)
+    if text is not None:
+        yield text
+        return
 
-from unstructured.partition.pdf import partition_pdf
-from unstructured.documents.elements import Text, Table
+    chunks = []
+    for chunk in iter_partition_text(pdf_path, strategy, infer_table, workers, pages_per_chunk, timings):
+        chunks.append(chunk)
+        yield chunk
+    cache.put(cache_key, "".join(chunks))
 
 
-def extract_text(pdf_path: str, out_path: str, strategy: str = "auto", infer_table: bool = True) -> bool:
+def extract_text(pdf_path: str, out_path: str, strategy: str = "auto", infer_table: bool = True, cache: DiskCache | None = None,
+                 workers: int = 1, pages_per_chunk: int = 0) -> bool:
     """Extracts text from the given PDF file via `pdf_path` using Unstructured. Extracted text is sent to a file that is either
     created (or overwritten) as specified by `out_path`. Behavior of the text extraction can be controlled by `strategy`
-    and `infer_table`.
+    and `infer_table`. Use `iter_text` to get the text without going through a file.
 
     Args:
         pdf_path: a str representing the path to the PDF file (.pdf)
         out_path: a str representing the path to the output file (.txt)
-        strategy: what text extraction method to use: `auto` for automatically choosing between fast and hi_res depending on the page's content (faster); `hi_res` to understand page layout and use OCR (slower)
+        strategy: what text extraction method to use: `auto` for automatically choosing between fast and hi_res depending on the page's content (faster); `hi_res` to understand page layout and use OCR (slower); `adaptive` for choosing between fast and hi_res for each page separately (fastest for mostly text documents)
         infer_table: whether to infer tables, only has an effect if current strategy is `hi_res`
+        cache: optional extraction cache, when the same PDF was already extracted with the same parameters the cached text is used and partitioning is skipped
+        workers: the amount of worker processes to partition page ranges with, 1 partitions the whole PDF in the current process
+        pages_per_chunk: the amount of pages in each page range partitioned by a worker
 
     Returns:
         bool: whether the operation succeeded or not
     """
     try:
-        # first get all elements in the pdf
-        elements = partition_pdf(pdf_path, strategy=strategy, infer_table_structure=infer_table)
-        print("done")
-        # then collect the relevant text from each element
         with open(out_path, "w", encoding="utf-8") as out_file:
-            for elem in elements:
-                extract_text = ""
-                # for tables, append their html format to preserve table structure
-                if isinstance(elem, Table):
-                    extract_text = elem.metadata.text_as_html or ""
-                # for general text, treat normally
-                elif isinstance(elem, Text):
-                    extract_text = elem.text
-                # write extracted text from current elem to out file
-                if extract_text:
-                    # filter out characters that can't be encoded in UTF-8
-                    cleaned_text = extract_text.encode("utf-8", errors="ignore").decode("utf-8", errors="ignore")
-                    out_file.write(f"{cleaned_text}\n\n")
+            for chunk in iter_text(pdf_path, strategy, infer_table, cache, workers, pages_per_chunk):
+                out_file.write(chunk)
+        logger.info("Extracted text", extra={"pdf_path": pdf_path, "out_path": out_path})
         return True  
-    except Exception as e:
-        print(e)
+    except Exception:
+        logger.exception("Text extraction failed", extra={"pdf_path": pdf_path})
         return False
     
\ No newline at end of file
@@ -0,0 +1,212 @@
+"""
+asyncio based OpenAI backend with bounded concurrency, rate limiting and retries, shared by `gpt` and `gptPortfolio`
+
+The backend runs its own event loop on a background thread, so the synchronous Flask workers and the threads used for
+chunked requests can all hand their requests to it. Every request, whichever thread it comes from, goes through:
+    - a global semaphore that bounds the amount of requests in flight
+    - two token buckets, one for requests per minute and one for tokens per minute
+    - exponential backoff with jitter on rate limit, timeout, connection and server errors, honoring the
+      `Retry-After` header OpenAI sends with 429 responses
+
+This keeps the throughput at the account's rate limit instead of failing uploads once the limit is hit. Connections
+are pooled with the same limits as the shared synchronous clients, see `openai_client`.
+
+Example:
+    backend = AsyncOpenAIBackend(api_key, max_concurrency=8, requests_per_minute=500, tokens_per_minute=200000)
+    choice = backend.complete(model="gpt-4o-mini", messages=[...])
+"""
+
+import random
+import asyncio
+import logging
+import threading
+import time
+from typing import Any
+from email.utils import parsedate_to_datetime
+from concurrent.futures import Future
+import httpx
+import openai
+from openai.types.chat import ParsedChoice
+from transformation.chunking import count_tokens
+from transformation.openai_client import create_async_client
+from observability import metrics
+
+
+logger = logging.getLogger(__name__)
+
+# amount of completion tokens reserved from the token bucket for each request
+EXPECTED_COMPLETION_TOKENS = 1000
+
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
+
+
+class TokenBucket:
+    """Token bucket that refills continuously at `rate_per_minute` and holds at most a minute worth of tokens"""
+
+    def __init__(self, rate_per_minute: float):
+        """
+        Args:
+            rate_per_minute: the amount of tokens added every minute, the bucket never blocks if 0 or less
+        """
+        self.capacity = rate_per_minute
+        self.rate = rate_per_minute / 60
+        self.tokens = rate_per_minute
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, amount: float) -> None:
+        """
+        Waits until the bucket holds `amount` tokens and takes them, amounts larger than the capacity only wait
+        for a full bucket
+
+        Args:
+            amount: the amount of tokens to take
+        """
+        if self.capacity <= 0:
+            return
+        amount = min(amount, self.capacity)
+        # the lock makes waiters take tokens in the order they arrived
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+
+def retry_after_seconds(error: Exception) -> float | None:
+    """
+    Args:
+        error: the error raised by the OpenAI client
+
+    Returns:
+        float | None: the amount of seconds the server asked to wait before retrying, None if it did not say
+    """
+    response = getattr(error, "response", None)
+    if not isinstance(response, httpx.Response):
+        return None
+    try:
+        if "retry-after-ms" in response.headers:
+            return float(response.headers["retry-after-ms"]) / 1000
+        if "retry-after" not in response.headers:
+            return None
+        retry_after = response.headers["retry-after"]
+        try:
+            return float(retry_after)
+        except ValueError:
+            # Retry-After can also be an http date, a date in the past means retrying right away
+            return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+    except (ValueError, TypeError):
+        return None
+
+
+class AsyncOpenAIBackend:
+    """Sends chat completion requests to OpenAI from a background event loop within concurrency and rate limits"""
+
+    def __init__(self, api: str, max_concurrency: int = 8, requests_per_minute: float = 500,
+                 tokens_per_minute: float = 200000, max_retries: int = 6, base_delay: float = 1.0,
+                 max_delay: float = 60.0, base_url: str | None = None):
+        """
+        Args:
+            api: a str representing the OpenAI API Key
+            max_concurrency: the maximum amount of requests in flight at the same time
+            requests_per_minute: the request rate limit of the account, not limited if 0 or less
+            tokens_per_minute: the token rate limit of the account, not limited if 0 or less
+            max_retries: the maximum amount of retries of a single request
+            base_delay: the amount of seconds waited before the first retry, doubled for each retry after
+            max_delay: the maximum amount of seconds waited between two retries
+            base_url: optional url of an OpenAI compatible server to send the requests to
+        """
+        self.max_concurrency = max_concurrency
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retries = 0
+        self._api = api
+        self._base_url = base_url
+        self._loop = asyncio.new_event_loop()
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run_loop, name="openai-backend", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+
+    def _run_loop(self) -> None:
+        asyncio.set_event_loop(self._loop)
+        # everything bound to the loop is created on it
+        self._client = create_async_client(self._api, base_url=self._base_url)
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._request_bucket = TokenBucket(self.requests_per_minute)
+        self._token_bucket = TokenBucket(self.tokens_per_minute)
+        self._ready.set()
+        self._loop.run_forever()
+
+    async def _complete(self, prompt_tokens: int, **kwargs: Any) -> ParsedChoice:
+        attempt = 0
+        while True:
+            await self._request_bucket.acquire(1)
+            await self._token_bucket.acquire(prompt_tokens + EXPECTED_COMPLETION_TOKENS)
+            try:
+                async with self._semaphore:
+                    start = time.perf_counter()
+                    completion = await self._client.beta.chat.completions.parse(**kwargs)
+                    metrics.record_llm_request(time.perf_counter() - start, completion.usage)
+                return completion.choices[0]
+            except RETRYABLE_ERRORS as e:
+                metrics.ERRORS.inc(stage="llm_request")
+                if attempt >= self.max_retries:
+                    raise
+                delay = retry_after_seconds(e)
+                if delay is None:
+                    # full jitter keeps the retries of many requests from lining up
+                    delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+                attempt += 1
+                self.retries += 1
+                logger.warning("OpenAI request failed, retrying",
+                               extra={"error": type(e).__name__, "attempt": attempt, "max_retries": self.max_retries,
+                                      "delay": round(delay, 1)})
+                await asyncio.sleep(delay)
+            except Exception:
+                metrics.ERRORS.inc(stage="llm_request")
+                raise
+
+    def submit(self, **kwargs: Any) -> Future:
+        """
+        Schedules a chat completion request without waiting for it
+
+        Args:
+            kwargs: the arguments of `client.beta.chat.completions.parse` (model, messages, response_format, ...)
+
+        Returns:
+            Future: a future resolving to the ParsedChoice of the request
+        """
+        # counted on the calling thread, tokenizing a long prompt on the loop would stall every request in flight
+        prompt_tokens = sum(count_tokens(str(message.get("content", ""))) for message in kwargs.get("messages", []))
+        return asyncio.run_coroutine_threadsafe(self._complete(prompt_tokens, **kwargs), self._loop)
+
+    def complete(self, **kwargs: Any) -> ParsedChoice:
+        """
+        Sends a chat completion request and waits for its result, can be called from any thread
+
+        Args:
+            kwargs: the arguments of `client.beta.chat.completions.parse` (model, messages, response_format, ...)
+
+        Returns:
+            ParsedChoice: the first choice of the request, its .message.content holds the content as a str and its .finish_reason tells whether the completion was cut off
+        """
+        return self.submit(**kwargs).result()
+
+    def close(self) -> None:
+        """Closes the client and stops the event loop"""
+        asyncio.run_coroutine_threadsafe(self._client.close(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
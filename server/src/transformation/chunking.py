@@ -0,0 +1,172 @@
+"""
+Token-aware chunking and map-reduce helpers for sending very long documents to the OpenAI API
+
+The extracted text is split on element boundaries (the blank line `extract_text` puts after every element) into
+chunks that fit a token budget, tables are single elements so they are never cut in half. Each chunk is sent to the
+model on its own, concurrently, and the JSON of each chunk is merged back into a single result in chunk order so the
+merge does not depend on which request finished first.
+
+Dependencies:
+    1. tiktoken (optional)
+        pip install tiktoken
+        - without it the token count is estimated from the length of the text
+"""
+
+from __future__ import annotations
+
+import json
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Callable
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+if TYPE_CHECKING:
+    from openai.types.chat import ParsedChatCompletionMessage
+
+
+ELEMENT_SEPARATOR = "\n\n"
+# rough amount of characters per token for english text, used when tiktoken is not installed
+CHARS_PER_TOKEN = 4
+
+RequestFunction = Callable[..., "ParsedChatCompletionMessage"]
+
+
+@lru_cache(maxsize=None)
+def _encoding():
+    # loading the encoding reads (or downloads) its vocabulary, only done once tokens are counted
+    return tiktoken.get_encoding("o200k_base") if tiktoken is not None else None
+
+
+def count_tokens(text: str) -> int:
+    """
+    Args:
+        text: a str representing the text to count the tokens of
+
+    Returns:
+        int: the amount of tokens in the text, estimated if tiktoken is not installed
+    """
+    encoding = _encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def split_text(text: str, max_tokens: int) -> list[str]:
+    """
+    Splits the extracted text into chunks of at most `max_tokens` tokens without cutting an element in half.
+    An element that is larger than `max_tokens` on its own becomes its own chunk.
+
+    Args:
+        text: a str representing the extracted text
+        max_tokens: the token budget of a chunk
+
+    Returns:
+        list[str]: the chunks in document order, joining them gives back the text
+    """
+    chunks: list[str] = []
+    current: list[str] = []
+    current_tokens = 0
+    for element in text.split(ELEMENT_SEPARATOR):
+        element += ELEMENT_SEPARATOR
+        element_tokens = count_tokens(element)
+        if current and current_tokens + element_tokens > max_tokens:
+            chunks.append("".join(current))
+            current, current_tokens = [], 0
+        current.append(element)
+        current_tokens += element_tokens
+    if current:
+        chunks.append("".join(current))
+
+    # the split adds a separator after the last element which the text did not have
+    chunks[-1] = chunks[-1][:-len(ELEMENT_SEPARATOR)]
+    return [chunk for chunk in chunks if chunk]
+
+
+def request_chunks(request_func: RequestFunction, type: str, api: str, chunks: list[str], concurrency: int, **kwargs: Any) -> list[Any]:
+    """
+    Sends every chunk to the model concurrently and parses the JSON of each response
+
+    Args:
+        request_func: the function used for a single request, `gpt.request` or `gptPortfolio.request`
+        type: a str representing the document type
+        api: a str representing the OpenAI API Key
+        chunks: the chunks of text to be parsed
+        concurrency: the maximum amount of requests sent at the same time
+        kwargs: any extra keyword arguments passed to `request_func`
+
+    Returns:
+        list[Any]: the parsed JSON of each chunk, in chunk order
+    """
+    def request_chunk(chunk: str) -> Any:
+        return json.loads(request_func(type, api, chunk, **kwargs).content)
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        # map keeps the results in chunk order
+        return list(executor.map(request_chunk, chunks))
+
+
+def is_empty(value: Any) -> bool:
+    return value is None or value == "" or value == [] or value == {}
+
+
+def merge_drafts(drafts: list[dict[str, Any]]) -> dict[str, Any]:
+    """
+    Merges the drafts parsed from each chunk of one document, every field keeps the first non empty value found
+    in chunk order
+
+    Args:
+        drafts: the draft of each chunk, in chunk order
+
+    Returns:
+        dict[str, Any]: the merged draft
+    """
+    merged: dict[str, Any] = {}
+    for draft in drafts:
+        for key, value in draft.items():
+            if key not in merged or (is_empty(merged[key]) and not is_empty(value)):
+                merged[key] = value
+    return merged
+
+
+def property_key(entry: dict[str, Any]) -> str | None:
+    """
+    Args:
+        entry: the draft of one property in a portfolio
+
+    Returns:
+        str | None: the normalized address (or name) of the property used to recognize it across chunks, None if it has neither
+    """
+    for hint in ("address", "name"):
+        for key, value in entry.items():
+            if hint in key.lower() and isinstance(value, str) and value.strip():
+                return " ".join(value.lower().split())
+    return None
+
+
+def merge_portfolios(portfolios: list[list[dict[str, Any]]]) -> list[dict[str, Any]]:
+    """
+    Merges the property drafts parsed from each chunk of a portfolio. Drafts of the same property (same address)
+    found in different chunks are merged with `merge_drafts`, the properties keep the order they are first found in.
+
+    Args:
+        portfolios: the list of property drafts of each chunk, in chunk order
+
+    Returns:
+        list[dict[str, Any]]: the merged property drafts
+    """
+    merged: list[dict[str, Any]] = []
+    positions: dict[str, int] = {}
+    for portfolio in portfolios:
+        for entry in portfolio:
+            key = property_key(entry)
+            if key is not None and key in positions:
+                merged[positions[key]] = merge_drafts([merged[positions[key]], entry])
+                continue
+            if key is not None:
+                positions[key] = len(merged)
+            merged.append(entry)
+    return merged
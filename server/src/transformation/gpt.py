@@ -1,10 +1,23 @@
+from __future__ import annotations
+
 from dotenv import load_dotenv
 import os
-from openai import OpenAI
-from openai.types.chat import ParsedChatCompletionMessage
+import json
+import time
+from typing import TYPE_CHECKING
+from caching.disk_cache import DiskCache, make_key
+from transformation.openai_client import get_client, load_prompt, is_cacheable, assistant_message
+from observability import metrics
+from transformation.chunking import split_text, request_chunks, merge_drafts
+
+# openai is only imported once a request is sent, see `openai_client`
+if TYPE_CHECKING:
+    from openai.types.chat import ParsedChatCompletionMessage
+    from transformation.async_backend import AsyncOpenAIBackend
 
 
 PROMPT_FILE_PATH = os.path.join(os.path.dirname(__file__), "prompt.txt")
+MODEL = "gpt-4o-mini-2024-07-18"
 
 def main(path: str,type: str):
     load_dotenv()
@@ -38,7 +51,7 @@ def readFile(path: str) -> str:
     return text
     
 
-def request(type: str, api: str, text: str) -> ParsedChatCompletionMessage:
+def request(type: str, api: str, text: str, cache: DiskCache | None = None, backend: AsyncOpenAIBackend | None = None) -> ParsedChatCompletionMessage:
     """
     Uses OpenAI API to parse data from the given text based on document type.
 
@@ -46,6 +59,8 @@ def request(type: str, api: str, text: str) -> ParsedChatCompletionMessage:
         type: a str representing the document type
         api: a str representing the OpenAI API Key
         text: a str representing the text to be parsed
+        cache: optional response cache, keyed by the prompt, model, document type and text so a change to the prompt file invalidates it
+        backend: optional async backend the request is sent through to respect the rate limits and retry on errors, the shared synchronous client is used if None
 
     Returns:
         ParsedChatCompletionMessage: the result of the OpenAI API query, use the .content field to access the actual content as a str
@@ -54,21 +69,66 @@ def request(type: str, api: str, text: str) -> ParsedChatCompletionMessage:
     # with open("parsed.txt", "w") as f:
     #     f.write(text)
     os.environ.setdefault("PYTHONUTF8", "1")
-    client = OpenAI(api_key=api)
-    prompt = readFile(PROMPT_FILE_PATH)
+    prompt = load_prompt(PROMPT_FILE_PATH)
+    if cache is not None:
+        cache_key = make_key(prompt, MODEL, type, text)
+        cached_content = cache.get(cache_key)
+        if cached_content is not None:
+            return assistant_message(cached_content)
     safe_prompt = prompt.encode("utf-8", errors="ignore").decode("utf-8", errors="ignore")
     safe_text = text.encode("utf-8", errors="ignore").decode("utf-8", errors="ignore")
-    completion = client.beta.chat.completions.parse(
-        model="gpt-4o-mini-2024-07-18",
-        messages=[
+    request_args = {
+        "model": MODEL,
+        "messages": [
             {"role": "system", "content": safe_prompt},
             {"role": "user", "content": f"This lease is of type {type} and the following is the text that I need you to extract from. f{safe_text}"},
         ],
-        response_format= {"type": "json_object"},
-    )
+        "response_format": {"type": "json_object"},
+    }
 
-    event = completion.choices[0].message
+    if backend is not None:
+        choice = backend.complete(**request_args)
+    else:
+        start = time.perf_counter()
+        try:
+            completion = get_client(api).beta.chat.completions.parse(**request_args)
+        except Exception:
+            metrics.ERRORS.inc(stage="llm_request")
+            raise
+        metrics.record_llm_request(time.perf_counter() - start, completion.usage)
+        choice = completion.choices[0]
+    event = choice.message
+    if cache is not None and is_cacheable(choice.finish_reason, event.content):
+        cache.put(cache_key, event.content)
     return event
 
+
+def request_chunked(type: str, api: str, text: str, max_tokens: int, concurrency: int, cache: DiskCache | None = None,
+                    backend: AsyncOpenAIBackend | None = None) -> ParsedChatCompletionMessage:
+    """
+    Uses OpenAI API to parse data from text that may be too long for a single request. The text is split into chunks
+    of at most `max_tokens` tokens that are parsed concurrently, the drafts of each chunk are merged into a single draft.
+
+    Args:
+        type: a str representing the document type
+        api: a str representing the OpenAI API Key
+        text: a str representing the text to be parsed
+        max_tokens: the token budget of each chunk
+        concurrency: the maximum amount of chunks parsed at the same time
+        cache: optional response cache used for each chunk
+        backend: optional async backend the requests are sent through
+
+    Returns:
+        ParsedChatCompletionMessage: the merged result, use the .content field to access a single JSON object as a str
+    """
+    chunks = split_text(text, max_tokens)
+    if len(chunks) <= 1:
+        return request(type, api, text, cache=cache, backend=backend)
+
+    results = request_chunks(request, type, api, chunks, concurrency, cache=cache, backend=backend)
+    merged = merge_drafts(results)
+    return assistant_message(json.dumps(merged, ensure_ascii=False))
+
+
 if __name__ == '__main__':
     main("output_unstructured.txt", "Multifamily OM")
@@ -0,0 +1,159 @@
+"""
+Shared OpenAI clients and prompt files for `gpt` and `gptPortfolio`
+
+One client is kept per API key for the whole process. Each client holds a keep-alive connection pool, so concurrent
+requests reuse warm connections instead of paying for a new TLS handshake every call. The asynchronous client of
+`AsyncOpenAIBackend` is bound to the event loop of its backend, so it is created by `create_async_client` on that
+loop instead of being shared, with the same pool limits and timeout. Prompt files are read once and only read again
+when their modification time changes.
+
+The pools can be configured with the following environment variables:
+    OPENAI_MAX_CONNECTIONS: maximum amount of open connections (default 20)
+    OPENAI_MAX_KEEPALIVE_CONNECTIONS: maximum amount of idle connections kept open (default 10)
+    OPENAI_KEEPALIVE_EXPIRY: seconds an idle connection is kept open (default 60)
+    OPENAI_TIMEOUT: seconds before a request times out (default 600)
+"""
+
+from __future__ import annotations
+
+import os
+import json
+import threading
+from typing import TYPE_CHECKING
+
+# openai and httpx are only imported once the first client is created
+if TYPE_CHECKING:
+    import httpx
+    from openai import AsyncOpenAI, OpenAI
+    from openai.types.chat import ParsedChatCompletionMessage
+
+
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", 20))
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", 10))
+OPENAI_KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", 60))
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", 600))
+
+_CLIENTS: dict[str, OpenAI] = {}
+_CLIENTS_LOCK = threading.Lock()
+
+# path -> (modification time, contents)
+_PROMPTS: dict[str, tuple[float, str]] = {}
+_PROMPTS_LOCK = threading.Lock()
+
+
+def http_limits() -> httpx.Limits:
+    """
+    Returns:
+        httpx.Limits: the connection pool limits of every OpenAI client, see the environment variables above
+    """
+    import httpx
+
+    return httpx.Limits(
+        max_connections=OPENAI_MAX_CONNECTIONS,
+        max_keepalive_connections=OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY,
+    )
+
+
+def get_client(api: str) -> OpenAI:
+    """
+    Returns the shared client for the given API key, creating it on first use
+
+    Args:
+        api: a str representing the OpenAI API Key
+
+    Returns:
+        OpenAI: the shared client
+    """
+    import httpx
+    from openai import OpenAI
+
+    with _CLIENTS_LOCK:
+        client = _CLIENTS.get(api)
+        if client is None:
+            http_client = httpx.Client(limits=http_limits(), timeout=OPENAI_TIMEOUT)
+            client = OpenAI(api_key=api, http_client=http_client)
+            _CLIENTS[api] = client
+        return client
+
+
+def create_async_client(api: str, base_url: str | None = None) -> AsyncOpenAI:
+    """
+    Creates an asynchronous client with the same connection pool limits and timeout as the shared clients, must be
+    called from the event loop the client is used on. Retries are left to the caller.
+
+    Args:
+        api: a str representing the OpenAI API Key
+        base_url: optional url of an OpenAI compatible server, `OPENAI_BASE_URL` or the OpenAI API if None
+
+    Returns:
+        AsyncOpenAI: the new client
+    """
+    import httpx
+    from openai import AsyncOpenAI
+
+    http_client = httpx.AsyncClient(limits=http_limits(), timeout=OPENAI_TIMEOUT)
+    return AsyncOpenAI(api_key=api, base_url=base_url, max_retries=0, http_client=http_client)
+
+
+def close_clients() -> None:
+    """Closes every shared client along with its connections"""
+    with _CLIENTS_LOCK:
+        for client in _CLIENTS.values():
+            client.close()
+        _CLIENTS.clear()
+
+
+def is_cacheable(finish_reason: str | None, content: str | None) -> bool:
+    """
+    Whether a completion can be kept in the response cache: a truncated (`length`) or filtered completion, or one
+    that is not valid JSON, would otherwise be returned for the same document until the cache entry expires
+
+    Args:
+        finish_reason: the finish reason of the choice
+        content: the message content of the choice
+
+    Returns:
+        bool: True if the completion stopped on its own and its content is valid JSON
+    """
+    if finish_reason != "stop" or not content:
+        return False
+    try:
+        json.loads(content)
+    except ValueError:
+        return False
+    return True
+
+
+def assistant_message(content: str) -> ParsedChatCompletionMessage:
+    """
+    Args:
+        content: the message content, a cached response or the merged drafts of several chunks
+
+    Returns:
+        ParsedChatCompletionMessage: an assistant message holding the content, like the message of a completion
+    """
+    from openai.types.chat import ParsedChatCompletionMessage
+
+    return ParsedChatCompletionMessage.construct(role="assistant", content=content)
+
+
+def load_prompt(path: str) -> str:
+    """
+    Returns the contents of the prompt file, the file is only read again when its modification time changes
+
+    Args:
+        path: a str representing the path to the prompt file
+
+    Returns:
+        str: the contents of the prompt file
+    """
+    mtime = os.path.getmtime(path)
+    with _PROMPTS_LOCK:
+        cached = _PROMPTS.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        with open(path, 'r', encoding='utf-8', errors='replace') as file:
+            prompt = file.read()
+        _PROMPTS[path] = (mtime, prompt)
+        return prompt
@@ -0,0 +1,125 @@
+"""
+Offline relevance filter that shrinks the extracted text before it is sent to the OpenAI API
+
+Every element of the extracted text (elements are separated by a blank line) is scored locally on how likely it is
+to hold a value for one of the fields the prompt asks for:
+    - tables, which usually hold the rent roll, unit mix and financials
+    - key-value lines such as `Year Built: 1998`
+    - the share of digits, currency and percent signs in the element
+    - the amount of words matching a field keyword, taken from the prompt file and a list of common CRE terms
+
+The highest scoring elements are kept, in their original order, until the token budget is used up. Text that already
+fits the budget is returned unchanged.
+
+The filter runs before `chunking` splits the text into requests, so a budget of one chunk or less means a filtered
+document is always sent in a single request. `chunk_budget` sizes the budget in chunks instead, documents with more
+relevant text than a single chunk are then still split into several requests whose drafts are merged.
+"""
+
+import re
+from transformation.chunking import ELEMENT_SEPARATOR, count_tokens
+
+
+# words that commonly label the fields extracted from OMs, rent rolls and leases
+DEFAULT_KEYWORDS = frozenset({
+    "address", "price", "asking", "units", "unit", "cap", "rate", "noi", "income", "expenses", "rent", "rents",
+    "occupancy", "occupied", "vacancy", "year", "built", "renovated", "sf", "sqft", "square", "feet", "acres",
+    "lot", "zoning", "parcel", "apn", "tenant", "tenants", "lease", "term", "expiration", "commencement", "gross",
+    "net", "nnn", "cam", "taxes", "insurance", "mix", "bedroom", "bath", "parking", "stories", "buildings",
+    "owner", "seller", "broker", "grm", "psf", "per", "average", "market", "city", "state", "zip", "county",
+})
+
+# a table element as written by `extract_text`, or as `< table >` once cleaned by `clean_text`
+TABLE_PATTERN = re.compile(r"^\s*<\s*table", re.IGNORECASE)
+# a line such as `Year Built: 1998` or `Price - $1,000,000`
+KEY_VALUE_PATTERN = re.compile(r"^[^\n:]{2,40}(?::|\s-\s)\s*\S", re.MULTILINE)
+NUMERIC_CHAR_PATTERN = re.compile(r"[0-9$%]")
+WORD_PATTERN = re.compile(r"[a-z]+")
+# quoted names in the prompt file, field names are listed as "field_name" or "Field Name"
+PROMPT_FIELD_PATTERN = re.compile(r"\"([^\"\n]{2,60})\"")
+
+TABLE_WEIGHT = 5.0
+KEY_VALUE_WEIGHT = 1.0
+NUMERIC_WEIGHT = 10.0
+KEYWORD_WEIGHT = 0.5
+
+
+def load_field_keywords(prompt: str) -> frozenset[str]:
+    """
+    Collects the words of the field names listed in the prompt along with `DEFAULT_KEYWORDS`
+
+    Args:
+        prompt: a str representing the contents of the prompt file
+
+    Returns:
+        frozenset[str]: the lowercase keywords
+    """
+    words = set(DEFAULT_KEYWORDS)
+    for field in PROMPT_FIELD_PATTERN.findall(prompt):
+        words.update(word for word in WORD_PATTERN.findall(field.lower().replace("_", " ")) if len(word) > 2)
+    return frozenset(words)
+
+
+def chunk_budget(chunk_tokens: int, max_chunks: float) -> int:
+    """
+    Args:
+        chunk_tokens: the token budget of a chunk sent to OpenAI
+        max_chunks: the amount of chunks the filtered text may fill, the filter is disabled if 0 or less
+
+    Returns:
+        int: the token budget of the filter
+    """
+    if max_chunks <= 0:
+        return 0
+    return int(chunk_tokens * max_chunks)
+
+
+def score_element(element: str, keywords: frozenset[str]) -> float:
+    """
+    Args:
+        element: a str representing the text of one extracted element
+        keywords: the lowercase field keywords
+
+    Returns:
+        float: how likely the element is to hold a field value, higher is more relevant
+    """
+    if not element.strip():
+        return 0.0
+
+    score = TABLE_WEIGHT if TABLE_PATTERN.match(element) else 0.0
+    score += KEY_VALUE_WEIGHT * len(KEY_VALUE_PATTERN.findall(element))
+    score += NUMERIC_WEIGHT * len(NUMERIC_CHAR_PATTERN.findall(element)) / len(element)
+    score += KEYWORD_WEIGHT * sum(1 for word in WORD_PATTERN.findall(element.lower()) if word in keywords)
+    return score
+
+
+def filter_relevant(text: str, max_tokens: int, keywords: frozenset[str] = DEFAULT_KEYWORDS) -> tuple[str, int, int]:
+    """
+    Keeps the most relevant elements of the extracted text within the token budget, in their original order
+
+    Args:
+        text: a str representing the extracted text
+        max_tokens: the token budget of the filtered text, the text is returned unchanged if 0 or less
+        keywords: the lowercase field keywords
+
+    Returns:
+        tuple[str, int, int]: the filtered text, the amount of tokens before filtering, and the amount of tokens after filtering
+    """
+    total_tokens = count_tokens(text)
+    if max_tokens <= 0 or total_tokens <= max_tokens:
+        return text, total_tokens, total_tokens
+
+    elements = [element for element in text.split(ELEMENT_SEPARATOR) if element.strip()]
+    tokens = [count_tokens(element + ELEMENT_SEPARATOR) for element in elements]
+    # highest score first, earlier elements win ties so the result is deterministic
+    ranked = sorted(range(len(elements)), key=lambda i: (-score_element(elements[i], keywords), i))
+
+    kept: set[int] = set()
+    kept_tokens = 0
+    for i in ranked:
+        if kept_tokens + tokens[i] <= max_tokens:
+            kept.add(i)
+            kept_tokens += tokens[i]
+
+    filtered = "".join(elements[i] + ELEMENT_SEPARATOR for i in sorted(kept))
+    return filtered, total_tokens, kept_tokens